@@ -0,0 +1,607 @@
+#!/usr/bin/env python
+
+"""Batch checking for the PR Checker.
+
+Runs many PRs through a pipeline of stages connected by bounded queues:
+
+    decode -> parse -> check -> render
+
+decode  reads the form header, rejects unsupported or outdated forms and
+memory-maps the file
+parse   decodes the mapped base64/gzip payload straight into the XML parser,
+        loads the form's rules and extracts the field values, then drops the
+        document
+check   runs the check plan
+render  writes each report as a PDF (or text with --text) next to its input
+
+Every stage has its own worker threads, so reading, decompressing, checking and
+writing overlap across reports.  A full queue blocks the stage feeding it, so
+at most --queue-size reports wait between two stages and memory stays flat
+however large the batch.  A throughput report is printed at the end.
+
+With --report NAME every report is also collected into one consolidated
+document with a table of contents, plus CSV and JSONL summaries (see
+prreport.py); --report-only skips the per-report files and the spelling
+suggestions.  With --duplicates FILE.csv bullets copied between reports of the
+batch are listed in FILE.csv (see prdupes.py).  With --stats FILE rule, field
+and word counts over the batch are ranked in FILE (see prstats.py).  With
+--sink jsonl --sink-file FILE the findings of every report are streamed to
+FILE as JSON lines instead (see prsinks.py).
+
+With --isolate every report is decoded, parsed and checked in a worker process
+of the check stage instead, under a --timeout and a --memory-limit, so one bad
+or huge form is recorded as an error without stalling or crashing the batch
+(see prisolate.py).  Payloads expanding more than --max-ratio times are
+rejected either way.
+
+With --reload SECONDS a change to the workbook (or the --lexicon) is picked up
+while the batch runs: reports started after the new rules are loaded are
+checked with them, the ones already under way finish with the old rules (see
+prrules.ruleset_manager).
+
+Usage: prbatch.py [options] file-or-directory ...
+"""
+
+import os
+import sys
+import time
+import threading
+import xml.dom.minidom
+
+try:
+    import Queue as queue
+except ImportError:
+    import queue
+import prcheck
+import prdupes
+import prinput
+import prisolate
+import prreport
+import prrules
+import prsinks
+import prstats
+
+STAGE_NAMES = ("decode", "parse", "check", "render")
+DEFAULT_WORKERS = {"decode": 1, "parse": 2, "check": 2, "render": 1}
+
+# Queue marker telling a worker there is no more work
+STOP = None
+
+
+def find_reports(paths):
+    # Yield every .xfdl file named on the command line or found in a directory
+    for path in paths:
+        if os.path.isdir(path):
+            for dirpath, dirnames, filenames in os.walk(path):
+                dirnames.sort()
+                for filename in sorted(filenames):
+                    if os.path.splitext(filename)[1].lower() == ".xfdl":
+                        yield os.path.join(dirpath, filename)
+        else:
+            yield path
+
+
+class batch_job:
+    def __init__(self, filename, output=None):
+        # One report on its way through the pipeline; output is the shared
+        # sink of the batch, if any, else the report is kept in memory
+        self.filename = os.path.abspath(filename)
+        if output is None:
+            output = prsinks.memory_sink()
+        self.output = output
+        self.pr = None
+        self.rules = None  # prrules.ruleset, while the report uses it
+        self.payload = None
+        self.on_form = None
+        self.status = "ok"  # ok, rejected or error
+        self.error = None
+        self.report_filename = None
+
+    def failed(self, e):
+        # Note the exception that stopped the report
+        self.status = "error"
+        self.error = "%s: %s" % (e.__class__.__name__, e)
+
+
+class pipeline_stage:
+    def __init__(self, name, func, workers, in_queue, out_queue):
+        self.name = name
+        self.func = func
+        self.workers = workers
+        self.in_queue = in_queue
+        self.out_queue = out_queue
+        self.next_stage = None
+        self.count = 0
+        self.busy = 0.0
+        self.running = 0
+        self.lock = threading.Lock()
+        self.threads = []
+
+    def start(self):
+        self.running = self.workers
+        for i in range(self.workers):
+            thread = threading.Thread(
+                target=self.work, name="%s-%d" % (self.name, i + 1)
+            )
+            thread.daemon = True
+            thread.start()
+            self.threads.append(thread)
+
+    def work(self):
+        # Take jobs until told to stop; the last worker out stops the next stage
+        if os.name == "nt":
+            import pythoncom
+
+            pythoncom.CoInitialize()
+        while True:
+            job = self.in_queue.get()
+            if job is STOP:
+                break
+            start = time.time()
+            if job.status == "ok" or self.name == "render":
+                try:
+                    self.func(job)
+                except Exception as e:
+                    job.failed(e)
+            elapsed = time.time() - start
+            self.lock.acquire()
+            self.count += 1
+            self.busy += elapsed
+            self.lock.release()
+            if self.out_queue is not None:
+                self.out_queue.put(job)
+
+        self.lock.acquire()
+        self.running -= 1
+        last = self.running == 0
+        self.lock.release()
+        if last and self.next_stage:
+            for i in range(self.next_stage.workers):
+                self.out_queue.put(STOP)
+
+    def join(self):
+        for thread in self.threads:
+            thread.join()
+
+
+class pipeline:
+    def __init__(
+        self,
+        settings_filename,
+        run_options=None,
+        workers=None,
+        queue_size=4,
+        text_only=False,
+        output_dir=None,
+        report=None,
+        individual=True,
+        duplicates=None,
+        journal=None,
+        sink=None,
+        isolate=False,
+        timeout=prisolate.DEFAULT_TIMEOUT,
+        memory_limit=prisolate.DEFAULT_MEMORY_LIMIT,
+        stats=None,
+        reload=0,
+    ):
+        # workers maps stage names to thread counts (see DEFAULT_WORKERS).
+        # report is a prreport.batch_report collecting every report; with
+        # individual False no per-report files are written.  duplicates is a
+        # prdupes.duplicate_index the bullets of every report are added to.
+        # journal is told about every finished report (see prwatch.py).
+        # sink is a prsinks sink every report is written to, in place of
+        # the report files and the consolidated report.  isolate checks
+        # every report in a worker process, given up on after timeout seconds
+        # or memory_limit megabytes (see prisolate.py).  stats is a
+        # prstats.report_stats every report's counts are merged into.
+        # reload > 0 looks for changed rules every reload seconds.
+        if run_options is None:
+            run_options = prcheck.options
+        self.options = run_options
+        self.settings_filename = settings_filename
+        self.reload = reload
+        self.manager = prrules.ruleset_manager(
+            settings_filename, [run_options.lexicon], reload
+        )
+        self.workers = dict(DEFAULT_WORKERS)
+        if workers:
+            self.workers.update(workers)
+        self.queue_size = queue_size
+        self.text_only = text_only
+        self.output_dir = output_dir
+        if output_dir and not os.path.isdir(output_dir):
+            try:
+                os.makedirs(output_dir)
+            except OSError:
+                # Made by another process in the meantime
+                if not os.path.isdir(output_dir):
+                    raise
+        self.report = report
+        self.individual = individual
+        self.duplicates = duplicates
+        self.journal = journal
+        self.sink = sink
+        self.isolate = isolate
+        self.timeout = timeout
+        self.memory_limit = memory_limit
+        self.stats = stats
+        self.isolated_workers = None
+        self.results = []
+        self.results_lock = threading.Lock()
+        self.stages = []
+        self.elapsed = 0.0
+
+    # *****************************STAGES******************************
+
+    def decode(self, job):
+        if self.isolate:
+            # Everything up to the report text happens in check_isolated
+            return
+        job.rules = self.manager.acquire()
+        job.pr = prcheck.pr_object(
+            job.filename, job.rules, self.options, job.output, run=False
+        )
+        if not job.pr.check_header(job.filename):
+            job.status = "rejected"
+            job.error = job.pr.error
+            return
+        if self.stats is not None:
+            job.pr.stats = prstats.report_stats()
+        job.payload = prinput.mapped_xfdl(
+            job.filename, self.options.max_ratio, self.options.max_size << 20
+        )
+
+    def parse(self, job):
+        if self.isolate:
+            return
+        try:
+            doc = xml.dom.minidom.parse(job.payload.stream())
+        finally:
+            job.payload.close()
+            job.payload = None
+        job.pr.set_document(doc)
+        job.pr.load_rules()
+        job.on_form = job.pr.extract()
+        # Only the extracted values travel on; free the document now
+        doc.unlink()
+        job.pr.doc = job.pr.globalpage = job.pr.pages = None
+
+    def check(self, job):
+        if self.isolate:
+            self.check_isolated(job)
+            return
+        job.pr.run_checks(job.on_form)
+        if self.stats is not None:
+            self.stats.merge(job.pr.stats)
+        if self.duplicates is not None:
+            self.duplicates.add_report(
+                job.filename, job.pr.engine.narratives(job.on_form)
+            )
+        job.on_form = None
+
+    def check_isolated(self, job):
+        # Decode, parse and check in one of the worker processes
+        worker = self.isolated_workers.get()
+        try:
+            result = worker.check(job.filename)
+        except prisolate.worker_failure as e:
+            job.status = "error"
+            job.error = str(e)
+            return
+        finally:
+            self.isolated_workers.put(worker)
+        result.output.replay(job.output, result)
+        job.pr = result
+        job.status = result.status
+        job.error = result.error
+        if self.stats is not None and result.stats is not None:
+            self.stats.merge(result.stats)
+        if self.duplicates is not None and result.narratives:
+            self.duplicates.add_report(job.filename, result.narratives)
+
+    def render(self, job):
+        # Write the report, then record the result whether or not it could
+        # be written
+        try:
+            self.write_report(job)
+        except Exception as e:
+            # An unwritable --output-dir, a full disk, a failed PDF layout
+            job.failed(e)
+            job.report_filename = None
+        finally:
+            job.output = job.pr = None
+            self.record(job)
+
+    def write_report(self, job):
+        if job.status == "error":
+            job.output.write(
+                "Cannot convert file.  It may be an outdated PR version.  "
+                "Contact your administrator.\n%s\n" % job.error
+            )
+        job.output.write_status(job.filename, job.status, job.error)
+        if self.sink is not None:
+            # Already streamed to the shared sink
+            job.report_filename = self.sink.filename
+        else:
+            text = job.output.getvalue()
+            if self.report is not None:
+                self.report.add(job.filename, text, job.status, job.error, job.pr)
+            if self.individual:
+                output_dir = self.output_dir or os.path.dirname(job.filename)
+                base = os.path.join(output_dir, os.path.basename(job.filename))
+                sink_name = "pdf"
+                if self.text_only:
+                    sink_name = "text"
+                sink = prsinks.open_sink(sink_name, base)
+                sink.write(text)
+                sink.close()
+                job.report_filename = sink.report_filename
+
+    def record(self, job):
+        # Release the report's ruleset, journal it and count it.  Never
+        # raises: a failed step is noted on the job, and the report is always
+        # counted, so the batch (or watch) moves on to the next one.
+        try:
+            if job.rules is not None:
+                rules = job.rules
+                job.rules = None
+                self.manager.release(rules)
+        except Exception as e:
+            job.failed(e)
+        try:
+            if self.journal is not None:
+                self.journal.record(job.filename, job.status, job.report_filename)
+        except Exception as e:
+            job.failed(e)
+        self.results_lock.acquire()
+        try:
+            self.results.append(
+                (job.filename, job.status, job.error, job.report_filename)
+            )
+        finally:
+            self.results_lock.release()
+
+    # ******************************RUN*******************************
+
+    def run(self, filenames):
+        # Check every file and return [(filename, status, error, report file)]
+        queues = [queue.Queue(self.queue_size) for name in STAGE_NAMES]
+        queues.append(None)
+        self.stages = []
+        for i, name in enumerate(STAGE_NAMES):
+            stage = pipeline_stage(
+                name,
+                getattr(self, name),
+                max(1, self.workers[name]),
+                queues[i],
+                queues[i + 1],
+            )
+            if self.stages:
+                self.stages[-1].next_stage = stage
+            self.stages.append(stage)
+
+        workers = []
+        if self.isolate:
+            # One worker process per check thread, started before any thread
+            self.isolated_workers = queue.Queue()
+            for i in range(self.stages[STAGE_NAMES.index("check")].workers):
+                worker = prisolate.report_worker(
+                    self.settings_filename,
+                    self.options,
+                    self.timeout,
+                    self.memory_limit,
+                    self.duplicates is not None,
+                    self.stats is not None,
+                    self.reload,
+                )
+                worker.start()
+                workers.append(worker)
+                self.isolated_workers.put(worker)
+
+        if not self.isolate:
+            self.manager.start()
+        start = time.time()
+        for stage in self.stages:
+            stage.start()
+        # Feeding blocks whenever the decode queue is full (backpressure)
+        for filename in filenames:
+            queues[0].put(batch_job(filename, self.sink))
+        for i in range(self.stages[0].workers):
+            queues[0].put(STOP)
+        for stage in self.stages:
+            stage.join()
+        self.elapsed = time.time() - start
+        self.manager.close()
+        for worker in workers:
+            worker.close()
+
+        return self.results
+
+    def throughput_report(self):
+        # Per-stage counts, busy time and utilisation, then overall throughput
+        lines = [
+            "%-8s %7s %8s %9s %10s %11s"
+            % ("Stage", "Workers", "Reports", "Busy (s)", "ms/report", "Utilisation")
+        ]
+        for stage in self.stages:
+            per_report = 0.0
+            if stage.count:
+                per_report = stage.busy / stage.count * 1000
+            utilisation = 0.0
+            if self.elapsed:
+                utilisation = stage.busy / (self.elapsed * stage.workers) * 100
+            lines.append(
+                "%-8s %7d %8d %9.2f %10.1f %10.0f%%"
+                % (
+                    stage.name,
+                    stage.workers,
+                    stage.count,
+                    stage.busy,
+                    per_report,
+                    utilisation,
+                )
+            )
+        totals = {"ok": 0, "rejected": 0, "error": 0}
+        for filename, status, error, report_filename in self.results:
+            totals[status] += 1
+        rate = 0.0
+        if self.elapsed:
+            rate = len(self.results) / self.elapsed
+        lines.append(
+            "%d report(s) in %.2f s: %.1f reports/s "
+            "(%d checked, %d rejected, %d failed)"
+            % (
+                len(self.results),
+                self.elapsed,
+                rate,
+                totals["ok"],
+                totals["rejected"],
+                totals["error"],
+            )
+        )
+        if self.manager.reloads:
+            lines.append("Ruleset reloaded %d time(s)" % self.manager.reloads)
+        return "\n".join(lines) + "\n"
+
+
+# ***********************START MAIN PROGRAM*************************
+
+
+def batch_option_parser():
+    # prcheck's options plus the pipeline settings
+    p = prcheck.option_parser()
+    p.set_usage("%prog [options] file-or-directory ...")
+    p.add_option("--settings", default="PR Structure.ods")
+    for name in STAGE_NAMES:
+        p.add_option(
+            "--%s-workers" % name,
+            dest="%s_workers" % name,
+            type="int",
+            default=DEFAULT_WORKERS[name],
+        )
+    p.add_option("--queue-size", type="int", default=4)
+    p.add_option("--output-dir")
+    p.add_option("--text", action="store_true", help="write .out text, not PDF")
+    p.add_option("--report", help="also write NAME.pdf, NAME.csv and NAME.jsonl")
+    p.add_option("--report-only", action="store_true", help="no per-report files")
+    p.add_option("--duplicates", metavar="FILE", help="list copied bullets in FILE")
+    p.add_option("--stats", metavar="FILE", help="rank rule, field and word counts")
+    p.add_option(
+        "--stats-top",
+        type="int",
+        default=prstats.DEFAULT_TOP,
+        metavar="N",
+        help="rows per table of the --stats report",
+    )
+    p.add_option(
+        "--isolate", action="store_true", help="check each report in a worker process"
+    )
+    p.add_option(
+        "--timeout",
+        type="float",
+        default=prisolate.DEFAULT_TIMEOUT,
+        metavar="SECONDS",
+        help="with --isolate, time allowed per report (0: no limit)",
+    )
+    p.add_option(
+        "--memory-limit",
+        type="int",
+        default=prisolate.DEFAULT_MEMORY_LIMIT,
+        metavar="MB",
+        help="with --isolate, address space per worker process (0: no limit)",
+    )
+    p.add_option(
+        "--reload",
+        type="float",
+        default=0,
+        metavar="SECONDS",
+        help="look for a changed ruleset every SECONDS (0: never)",
+    )
+    p.add_option(
+        "--duplicate-threshold",
+        type="float",
+        default=prdupes.DEFAULT_THRESHOLD,
+        help="share of wording two bullets must have in common",
+    )
+    return p
+
+
+if __name__ == "__main__":
+    # Needed by the --isolate worker processes in the py2exe build
+    prisolate.multiprocessing.freeze_support()
+
+    p = batch_option_parser()
+    options, arguments = p.parse_args()
+    if not arguments:
+        p.error("no PR files given")
+    if options.report_only and not options.report:
+        p.error("--report-only needs --report")
+    if options.sink == "jsonl" and not options.sink_file:
+        p.error("--sink jsonl needs --sink-file")
+    if options.sink not in ("pdf", "jsonl"):
+        p.error("a batch writes PDF (or --text) reports or a --sink jsonl file")
+    if options.sink == "jsonl" and options.report:
+        p.error("--report and --sink jsonl cannot be combined")
+    if options.report_only:
+        # Nobody reads the per-report files; skip the spelling suggestions
+        options.detect_only = True
+
+    console = sys.stdout
+    sys.stdout = prinput.open_report("logfile.txt")
+    sys.stderr = prinput.open_report("logfileerr.txt")
+
+    consolidated = None
+    if options.report:
+        consolidated = prreport.batch_report(options.report, options.text)
+    sink = None
+    if options.sink == "jsonl":
+        sink = prsinks.jsonl_sink(options.sink_file)
+    stats = None
+    if options.stats:
+        stats = prstats.report_stats()
+    duplicates = None
+    if options.duplicates:
+        duplicates = prdupes.duplicate_index(
+            options.duplicates, options.duplicate_threshold
+        )
+
+    workers = {}
+    for name in STAGE_NAMES:
+        workers[name] = getattr(options, "%s_workers" % name)
+    batch = pipeline(
+        options.settings,
+        options,
+        workers,
+        options.queue_size,
+        options.text,
+        options.output_dir,
+        consolidated,
+        not options.report_only,
+        duplicates,
+        sink=sink,
+        isolate=options.isolate,
+        timeout=options.timeout,
+        memory_limit=options.memory_limit,
+        stats=stats,
+        reload=options.reload,
+    )
+    batch.run(find_reports(arguments))
+    if stats is not None:
+        stats.write(options.stats, options.stats_top)
+        console.write("Statistics: %s\n" % options.stats)
+    if sink is not None:
+        sink.close()
+        console.write(
+            "%d finding(s) of %d report(s): %s\n"
+            % (sink.findings, sink.reports, sink.report_filename)
+        )
+    if consolidated is not None:
+        console.write("Batch report: %s\n" % consolidated.close())
+    if duplicates is not None:
+        console.write(
+            "%d duplicate bullet(s): %s\n" % (duplicates.close(), options.duplicates)
+        )
+
+    report = batch.throughput_report()
+    print(report)
+    console.write(report)
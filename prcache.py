@@ -0,0 +1,147 @@
+#!/usr/bin/env python
+
+"""Incremental check cache for the PR Checker.
+
+Stores a hash of every checked field value together with the output that the
+checks produced for it, keyed by the form serial number found in
+globalpage/formid/serialnumber.  When the same form is checked again only the
+fields whose value changed are re-run; the stored results are replayed for the
+rest so the report is identical to a full check.
+
+Cache files live in prcache/<serial number>.cache under the working directory.
+"""
+
+import os
+import errno
+import pickle
+import hashlib
+import tempfile
+import threading
+
+import prreport
+
+CACHE_DIR = "prcache"
+CACHE_FORMAT = 3
+
+# Cache file name => lock, so reports of one form saved by several check
+# workers replace the file one at a time
+save_locks = {}
+save_locks_lock = threading.Lock()
+
+
+def save_lock(filename):
+    save_locks_lock.acquire()
+    try:
+        lock = save_locks.get(filename)
+        if lock is None:
+            lock = save_locks[filename] = threading.Lock()
+        return lock
+    finally:
+        save_locks_lock.release()
+
+
+def value_digest(value):
+    # Hash one field value; unicode is hashed as UTF-8 so the digest is stable
+    if not isinstance(value, bytes):
+        value = value.encode("utf-8")
+    return hashlib.sha1(value).hexdigest()
+
+
+class incremental_cache:
+    def __init__(self, serial_number, fingerprint, cache_dir=None):
+        # fingerprint identifies everything other than the field values that
+        # can change a result (ruleset, lexicon, spell checker).
+        # A cache written under a different fingerprint is ignored.
+        if cache_dir is None:
+            cache_dir = "%s%s%s" % (os.getcwd(), os.path.sep, CACHE_DIR)
+        self.cache_dir = cache_dir
+        self.serial_number = serial_number
+        self.fingerprint = fingerprint
+        self.cache_filename = "%s%s%s.cache" % (
+            cache_dir,
+            os.path.sep,
+            self.safe_name(serial_number),
+        )
+        self.previous = self.load()
+        self.current = {}
+        self.hits = 0
+        self.misses = 0
+
+    def safe_name(self, serial_number):
+        # Serial numbers are GUIDs, but never trust a form to supply a file name
+        keep = [c for c in serial_number if c.isalnum() or c in "-_"]
+        return "".join(keep) or "UNKNOWN"
+
+    def load(self):
+        # Read the results of the previous check of this form, if any
+        try:
+            f = open(self.cache_filename, "rb")
+        except IOError:
+            return {}
+        try:
+            try:
+                data = pickle.load(f)
+            except Exception:
+                return {}
+        finally:
+            f.close()
+        if (
+            not isinstance(data, dict)
+            or data.get("format") != CACHE_FORMAT
+            or data.get("fingerprint") != self.fingerprint
+        ):
+            return {}
+        return data.get("fields", {})
+
+    def lookup(self, key, value):
+        # Return the stored result for key if the field value is unchanged
+        digest = value_digest(value)
+        try:
+            stored_digest, result = self.previous[key]
+        except KeyError:
+            stored_digest, result = None, None
+        if stored_digest == digest:
+            self.hits += 1
+            self.current[key] = (digest, result)
+            return result
+        self.misses += 1
+        return None
+
+    def store(self, key, value, result):
+        # Remember the result of a check for the next run
+        self.current[key] = (value_digest(value), result)
+
+    def save(self):
+        # Write only the results seen in this run so stale fields drop out.
+        # Every save writes a temporary file of its own and moves it into
+        # place, so a reader sees the old cache or the new one, never none.
+        try:
+            os.makedirs(self.cache_dir)
+        except OSError as e:
+            if e.errno != errno.EEXIST:
+                raise
+        data = {
+            "format": CACHE_FORMAT,
+            "fingerprint": self.fingerprint,
+            "serial_number": self.serial_number,
+            "fields": self.current,
+        }
+        lock = save_lock(self.cache_filename)
+        lock.acquire()
+        try:
+            fd, temp_filename = tempfile.mkstemp(
+                ".tmp", os.path.basename(self.cache_filename) + ".", self.cache_dir
+            )
+            try:
+                f = os.fdopen(fd, "wb")
+                try:
+                    pickle.dump(data, f, 2)
+                finally:
+                    f.close()
+                prreport.replace_file(temp_filename, self.cache_filename)
+            except:
+                if os.path.exists(temp_filename):
+                    os.remove(temp_filename)
+                raise
+        finally:
+            lock.release()
@@ -9,15 +9,15 @@ Purpose:  Identify and report common errors in Air Force performance reports.
 
 Tested with:  	AF707, 2008/06/18, ver 2.79.9
               	AF910, 2006/12/01, ver 8.113.5
+              	AF910, 2008/06/18, ver 8.120.3
+
+Runs on:      Python 2.7 and Python 3; report text is ISO-8859-1, like the forms
 
 Known Issues:
  
 -Will not open IE with Adobe Acrobat if current PR output file is already open
 -Does not include checking for words that need hyphens or vice versa
 -Does not identify the field or line where spelling errors are found
--Does not check for the correct form version and exit gracefully
--Does not check for valid abbreviations and acronyms
--Fails duty title containing "ERS CC"
 
 Nice To Haves:
 -Explanations for check fails
@@ -25,26 +25,39 @@ Nice To Haves:
 
 Static Files:
 -PR Structure.ods: Contains regex and check suite information for PRs
--Text2PDF.exe (Windows) or Text2PDF (Linux): Converts raw text output to PDFs (Thanks to Anand B Pillai)
+-PR Structure.prrules: Optional precompiled copy of PR Structure.ods, used when
+ newer than the workbook (build with prrules.py --binary)
+-PR Acronyms.txt: Acronyms and abbreviations accepted without spelling out
+-pyText2PDF/pyText2PDF.py: Converts the report text to PDF, in process (Thanks to Anand B Pillai)
 -setup.py: Configuration information for py2exe
--uudeview.exe (Windows) or uudeview (Linux): Converts .XFDL file to gzipped XML
 -prchecker_splash.gif: Image for the splash
 -others (may be included with py2exe distribution)
 
 Dynamic Files:
--logfile.txt: Containes stdout feed
+-logfile.txt: Containes stdout feed, and the trace of the checks (--trace,
+ --verbose) unless --trace-file names another file; see prtrace.py
 -logfileerr.txt: Containes stderr feed
--output.pdf: Contains the output from the PR Checker
+-<PR file>.pdf: Contains the output from the PR Checker (--sink chooses text,
+ JSON lines or the console instead; see prsinks.py)
+-prcache/*.cache: Results of the last check of each form (--incremental)
 """
 
 import sys
-
-sys.stdout = open("logfile.txt", "w")
-sys.stderr = open("logfileerr.txt", "w")
-import os, shutil
-import xml.dom.minidom
+import os, time
 import re
-import gzip, zipfile
+import collections
+import prcache
+import prengine
+import prforms
+import prinput
+import prlexicon
+import prlint
+import prrecords
+import prrules
+import prsinks
+import prspell
+import prtitles
+import prtrace
 
 try:
     import win32gui
@@ -52,202 +65,242 @@ try:
 except:
     pass
 import optparse
-import Tkinter
-from tkFileDialog import askopenfilename
 
+try:
+    import Tkinter
+    from tkFileDialog import askopenfilename
+except ImportError:
+    import tkinter as Tkinter
+    from tkinter.filedialog import askopenfilename
 
-class pr_object:
-    def __init__(self, pr_filename, settings_filename):
 
-        # Initialize Output File
+class pr_object:
+    def __init__(
+        self, pr_filename, settings_filename, run_options=None, output=None, run=True
+    ):
+        # settings_filename may also be an already loaded prrules.ruleset.
+        # run_options defaults to the command line options; output is a
+        # prsinks sink, by default the one chosen with --sink.  With
+        # run=False the caller drives the phases itself (check_header,
+        # set_document, load_rules, run_checks).
+
+        # Initialize Output
         self.pr_filename = pr_filename
-        self.output_filename = "%s%s%s.out" % (
-            os.getcwd(),
-            os.path.sep,
-            os.path.basename(pr_filename),
-        )
+        if run_options is None:
+            run_options = options
+        self.options = run_options
+        self.trace = prtrace.open_tracer(run_options)
+        self.status = "ok"  # ok, rejected or error
+        self.error = None
+        self.stats = None  # a prstats.report_stats to count the checks in
         program_string = """=====PR Checker=====\n\n"""
         author_string = (
             """Author: Capt Josef Peterson\n(2009) All Rights Reserved\n\n"""
         )
         file_name_string = """File: %s\n\n""" % os.path.basename(pr_filename)
-        self.output = open(self.output_filename, "w", -1)
+        if output is None:
+            output = prsinks.open_sink(
+                run_options.sink, pr_filename, run_options.sink_file
+            )
+        self.output = output
         self.output.write(program_string)
         self.output.write(author_string)
         self.output.write(file_name_string)
 
-        # Load PR into parsed XML document
-        print("Converting XFDL to XML...")
-        if os.name == "posix":
-            os.system("""uudeview -i "%s" """ % pr_filename)
+        # Load settings from PR Structure.ods (or an exported CSV/binary ruleset)
+        if isinstance(settings_filename, prrules.ruleset):
+            self.settings = settings_filename
         else:
-            os.system(
-                """%s%suudeview -i "%s" """ % (os.getcwd(), os.path.sep, pr_filename)
-            )
-        zipped_file = "%s%sUNKNOWN.001" % (os.getcwd(), os.path.sep)
+            self.settings = prrules.load_ruleset(settings_filename)
+        self.ver_dict = self.settings.version_dict()
+        self.findings = []
 
+        if not run:
+            return
+
+        # Reject unsupported or outdated forms before decoding the whole file
+        if not self.check_header(pr_filename):
+            self.status = "rejected"
+            self.clean_up()
+            return
+
+        if not self.load_document():
+            return
+        self.load_rules()
+
+        # Start program main function
+        self.main()
+
+    def load_document(self):
+        # Load PR into parsed XML document; on failure the report is closed
+        # and False returned
+        pr_filename = self.pr_filename
+        print("Converting XFDL to XML...")
         try:
-            zip_data = gzip.GzipFile(zipped_file, "r")
-            self.doc = xml.dom.minidom.parse(zip_data)
-        except:
+            doc = prinput.parse_document(
+                pr_filename, self.options.max_ratio, self.options.max_size << 20
+            )
+        except Exception as e:
+            self.error = "%s: %s" % (e.__class__.__name__, e)
             print(
                 "Cannot convert file.  It may be an outdated PR version.  Contact your administrator."
             )
             self.output.write(
                 "Cannot convert file.  It may be an outdated PR version.  \
-                               Contact your administrator.\n"
+                               Contact your administrator.\n%s\n"
+                % self.error
             )
+            self.status = "error"
             self.clean_up()
+            return False
 
-        finally:
-            zip_data.close()
-            os.remove(zipped_file)
+        self.set_document(doc)
+        return True
 
-        # Store globalpage, page 1 & page 2 in attributes
+    def set_document(self, doc):
+        # Store globalpage & every page of the form in attributes
+        self.doc = doc
         self.globalpage = self.doc.getElementsByTagName("globalpage")[0]
-        pages = self.doc.getElementsByTagName("page")
-        self.page1 = pages[0]
-        self.page2 = pages[1]
-
-        # Determine and write PR type, version
-        pr_types = {"Officer": "OPR", "ENLISTED": "EPR"}
-        self.pr_type_text = self.get_text(
-            self.globalpage.getElementsByTagName("title")[0]
+        self.pages = self.doc.getElementsByTagName("page")
+
+    def load_form_rules(self):
+        # =Load REGEX checks into dictionaries=
+        # The per-page tables and check plan of this form type, all that
+        # extract needs; only the sheets this form type uses are read
+        self.settings.load_sheets(list(self.form.sheets.values()))
+        self.dispatch = self.form.dispatch(self.settings, self.options.jobs)
+        self.engine = self.dispatch.engine
+
+    def load_rules(self):
+        # The form's rules plus everything the checks use: text sheets,
+        # lexicon, title index, regex guard, cache and spell checker
+        self.load_form_rules()
+        sheet_names = list(self.form.sheets.values()) + list(prlint.TEXT_SHEETS)
+        self.settings.load_sheets(
+            list(prlint.TEXT_SHEETS) + [prlexicon.LEXICON_SHEET, prtitles.TITLE_SHEET]
         )
-        self.pr_version_text = self.get_text(
-            self.globalpage.getElementsByTagName("custom:date")[0]
+        self.overlook_list = self.settings.cell_list("Overlook")
+        self.catch_list = self.settings.cell_list("Catch")
+        lexicon_filename = self.options.lexicon
+        self.lexicon = self.settings.memo(
+            ("lexicon", lexicon_filename),
+            lambda rules: prlexicon.load_lexicon(rules, lexicon_filename),
+        )
+        if not len(self.lexicon):
+            self.lexicon = None
+        self.title_index = self.settings.memo(("titles",), prtitles.load_title_index)
+        regex_budget = self.options.regex_budget
+        self.regex_guard = self.settings.memo(
+            ("regex guard", regex_budget, self.form.name),
+            lambda rules: prlint.regex_guard(
+                prlint.guarded_patterns(rules, sheet_names), regex_budget
+            ),
         )
-        self.output.write("Type: ")
-        self.output.write(self.pr_type_text)
-        self.output.write("\n\n")
-        self.output.write("Version: ")
-        self.output.write(self.pr_version_text)
-        self.output.write("\n\n")
 
-        for pr_type in pr_types:
-            p = re.compile(pr_type)
-            if p.search(self.pr_type_text):
-                self.pr_type = pr_types[pr_type]
+        trace = self.trace
+        trace.heading(self.pr_filename)
+        trace.trace(
+            "rules", prtrace.INFO, "%r\n%r\n", self.overlook_list, self.catch_list
+        )
 
-        # Load settings into parsed XML document
-        OD_TABLE_NS = "urn:oasis:names:tc:opendocument:xmlns:table:1.0"
-        zip_data = zipfile.ZipFile(settings_filename)
-        content = zip_data.read("content.xml")
-        self.settings = xml.dom.minidom.parseString(content)
-        zip_data.close()
+        # Set up the incremental check cache, keyed by the form serial number
+        self.cache = None
+        if self.options.incremental:
+            fingerprint = (
+                self.settings.fingerprint(),
+                os.name == "nt",
+                self.lexicon and self.lexicon.fingerprint(),
+            )
+            self.cache = prcache.incremental_cache(self.serial_number, fingerprint)
 
-        # =Load REGEX checks into dictionaries=
-        sheet_list = self.settings.getElementsByTagNameNS(OD_TABLE_NS, "table")
-
-        # Pull cells from tables corresponding to PR type
-        fields_str = "%s Fields" % self.pr_type
-        checks_str = "%s Checks" % self.pr_type
-        popups_str = "%s Popups" % self.pr_type
-
-        for sheet in sheet_list:
-            sheet_name = sheet.getAttributeNS(OD_TABLE_NS, "name")
-            sheet_rows = sheet.getElementsByTagNameNS(OD_TABLE_NS, "table-row")
-
-            if sheet_name == fields_str:
-                field_dict_p1, field_dict_p2 = self.get_cells(sheet_rows, OD_TABLE_NS)
-
-            if sheet_name == checks_str:
-                checks_dict_p1, checks_dict_p2 = self.get_cells(sheet_rows, OD_TABLE_NS)
-
-            if sheet_name == popups_str:
-                popups_dict_p1, popups_dict_p2 = self.get_cells(sheet_rows, OD_TABLE_NS)
-
-            if sheet_name == "Senior Rater Info":
-                self.SR_dict = {}
-                for row in sheet_rows:
-                    cells = row.getElementsByTagNameNS(OD_TABLE_NS, "table-cell")
-                    self.SR_dict[self.get_text(cells[1])] = (
-                        self.get_text(cells[0]),
-                        self.get_text(cells[2]),
-                    )
-
-            if sheet_name == "PR Version":
-                self.ver_dict = {}
-                for row in sheet_rows:
-                    cells = row.getElementsByTagNameNS(OD_TABLE_NS, "table-cell")
-                    self.ver_dict[self.get_text(cells[0])] = self.get_text(cells[1])
-
-            if sheet_name == "Overlook":
-                self.overlook_list = []
-                cells = sheet.getElementsByTagNameNS(OD_TABLE_NS, "table-cell")
-                for cell in cells:
-                    if self.get_text(cell):
-                        self.overlook_list.append(self.get_text(cell))
-                if options.verbose:
-                    self.output.write(repr(self.overlook_list) + "\n")
-
-            if sheet_name == "Catch":
-                self.catch_list = []
-                cells = sheet.getElementsByTagNameNS(OD_TABLE_NS, "table-cell")
-                for cell in cells:
-                    if self.get_text(cell):
-                        self.catch_list.append(self.get_text(cell))
-                if options.verbose:
-                    self.output.write(repr(self.catch_list) + "\n")
-
-        # Print the contents of the dictionaries if the verbose option is set
-        if options.verbose:
-
-            self.print_dict(field_dict_p1, "Page 1 Field Dictionary")
-            self.print_dict(field_dict_p2, "Page 2 Field Dictionary")
-
-            self.print_dict(checks_dict_p1, "Page 1 Check Box Dictionary")
-            self.print_dict(checks_dict_p2, "Page 2 Check Box Dictionary")
-
-            self.print_dict(popups_dict_p1, "Page 1 Popups Dictionary")
-            self.print_dict(popups_dict_p2, "Page 2 Popups Dictionary")
+        # Trace the contents of the dictionaries
+        if trace.enabled("rules", prtrace.INFO):
+
+            for name, truth_dict in self.dispatch.labelled_dicts():
+                self.print_dict(truth_dict, name)
 
+            # Senior Rater Info is only read for the dump
+            self.SR_dict = self.settings.senior_rater_dict()
             self.print_dict(self.SR_dict, "Senior Rater Info")
             self.print_dict(self.ver_dict, "Version Information")
 
-        # Initialize Spell Checker
+        # Initialize Spell Checker; one per ruleset, so a batch shares its
+        # Word instances and word results
+        self.spell_checker = None
         if os.name == "nt":
-            self.spell_checker = msword_spell_check(self.overlook_list)
+            spell_workers = self.options.spell_workers
+            overlook_list = self.overlook_list
+            lexicon = self.lexicon
+            self.spell_checker = self.settings.memo(
+                ("spell", spell_workers, lexicon_filename),
+                lambda rules: prspell.spell_scheduler(
+                    prspell.spell_pool(prspell.msword_backend, spell_workers),
+                    overlook_list,
+                    lexicon,
+                ),
+            )
             print("Spell Checker Initialized")
 
-        # Start program main function
-        self.main(
-            field_dict_p1,
-            field_dict_p2,
-            checks_dict_p1,
-            checks_dict_p2,
-            popups_dict_p1,
-            popups_dict_p2,
-        )
+    def check_header(self, pr_filename):
+        # Read the globalpage header, write the PR type & version, and check
+        # them against the ruleset.  Returns False if the form is rejected.
+        start = time.time()
+        try:
+            header = prinput.read_header(pr_filename)
+        except (IOError, prinput.xfdl_error) as e:
+            # A corrupt or foreign file is turned away here, after a few KB
+            print("Cannot read form header: %s" % e)
+            self.error = "%s: %s" % (e.__class__.__name__, e)
+            self.output.write(
+                "Cannot convert file.  It may be an outdated PR version.  "
+                "Contact your administrator.\n%s\n" % self.error
+            )
+            return False
 
-    def get_cells(self, sheet_rows, OD_TABLE_NS):
-        # Pull the fields out of the ODS spreadsheet and put in dictionaries.
-        dict_p1 = {}
-        dict_p2 = {}
+        self.serial_number = header.serial_number
+        self.form_version_text = header.version
+        self.pr_type_text = header.title
+        self.pr_version_text = header.date
+        self.output.write("Type: ")
+        self.output.write(self.pr_type_text)
+        self.output.write("\n\n")
+        self.output.write("Version: ")
+        self.output.write(self.pr_version_text)
+        self.output.write("\n\n")
 
-        for row in sheet_rows:
-            cells = row.getElementsByTagNameNS(OD_TABLE_NS, "table-cell")
-            try:
-                if self.get_text(cells[4]) == "1":
-                    dict_p1[self.get_text(cells[1])] = (
-                        self.get_text(cells[0]),
-                        self.get_text(cells[2]),
-                        self.get_text(cells[3]),
-                        self.get_text(cells[4]),
-                        self.get_text(cells[5]),
-                    )
-                elif self.get_text(cells[4]) == "2":
-                    dict_p2[self.get_text(cells[1])] = (
-                        self.get_text(cells[0]),
-                        self.get_text(cells[2]),
-                        self.get_text(cells[3]),
-                        self.get_text(cells[4]),
-                        self.get_text(cells[5]),
-                    )
-            except:
-                pass
+        # Determine PR type
+        self.form = prforms.detect_form(self.pr_type_text, self.form_version_text)
+        if self.form is None and prforms.detect_form(self.pr_type_text) is not None:
+            print(
+                "Unsupported form version: %s %s"
+                % (self.pr_type_text, self.form_version_text)
+            )
+            self.output.write(
+                "Unsupported form version %s.  Contact your administrator.\n"
+                % self.form_version_text
+            )
+            return False
+        if self.form is None or self.form.pr_type not in self.ver_dict:
+            print("Unsupported form: %s" % self.pr_type_text)
+            self.output.write(
+                "Unsupported form.  This PR type is not in PR Structure.ods.  "
+                "Contact your administrator.\n"
+            )
+            return False
+        self.pr_type = self.form.pr_type
+
+        # Stop on the wrong form version; the version stage reports the details
+        if self.ver_dict[self.pr_type] != self.pr_version_text:
+            self.findings = prengine.version_stage().check_form(self)
+            for finding in self.findings:
+                self.output.write_finding(self, finding)
+            self.output.write(
+                "Check stopped.  Update the PR to the current form version.\n"
+            )
+            return False
 
-        return dict_p1, dict_p2
+        print("Form header checked in %.3f ms" % ((time.time() - start) * 1000))
+        return True
 
     def get_text(self, node):
         # Pull text out of one XML node
@@ -257,156 +310,47 @@ class pr_object:
                 text = text + self.get_text(child)
             elif child.nodeType == child.TEXT_NODE:
                 text = text + child.nodeValue
-        return text.encode("ascii")
+        return text
 
-    def get_on_form_dicts(self, form_field, xmldoc):
-        # Return a dictionary with all keys & items from elements matching the string form_field
-        # from an XML document
+    def get_on_form_dicts(self, form_field, xmldoc, page_number=1):
+        # Return a dictionary of sid => prrecords.form_field for all elements matching
+        # the string form_field from an XML document, in document order so the
+        # report lists fields the same way under every Python version
         xmllist = xmldoc.getElementsByTagName(form_field)
-        value_dict = {}
+        group = prrecords.GROUP_IDS[form_field]
+        value_dict = collections.OrderedDict()
 
         for i in xmllist:
             j = i.getElementsByTagName("value")
+            sid = j[0].parentNode.getAttribute("sid")
             try:
-                value_dict[j[0].parentNode.getAttribute("sid")] = j[
-                    0
-                ].firstChild.nodeValue
+                value = j[0].firstChild.nodeValue
             except:
-                value_dict[j[0].parentNode.getAttribute("sid")] = ""
+                value = ""
+            field = prrecords.form_field(sid, group, page_number, value)
+            value_dict[field.sid] = field
 
         return value_dict
 
     def print_dict(self, the_dict, name):
-        # Print the keys and items in an arbitrary dictionary.
+        # Trace the keys and items in an arbitrary dictionary.
         if the_dict and name:
-            print(name)
-            self.output.write(name)
-            self.output.write("\n")
+            lines = [name]
             for i in the_dict:
-                print(i, the_dict[i])
-                self.output.write(i)
-                self.output.write(" ")
-                self.output.write(repr(the_dict[i]))
-                self.output.write("\n")
-            self.output.write("\n")
-
-    def regex_check(self, IUT_dict, truth_dict):
-        # Check in incoming dictionary against regular expressions in a truth dictionary
-        if len(IUT_dict) == 0:
-            return
-
-        print("Running Regular Expression Check...\n")
-
-        for i in IUT_dict:
-            try:
-                if truth_dict[i][2] != "None":
-                    pattern = re.compile(truth_dict[i][2])
-                    try:
-                        match = pattern.match(IUT_dict[i]).group()
-                        if options.verbose:
-                            out_string = "%s => [OK]\nField: %s Text: %s\n" % (
-                                truth_dict[i][0],
-                                i,
-                                match,
-                            )
-                            print(out_string)
-                            self.output.write(out_string)
-                            self.output.write("\n")
-                    except:
-                        out_string = "%s => [FAIL]\nField: %s Text: %s\n" % (
-                            truth_dict[i][0],
-                            i,
-                            IUT_dict[i].encode("unicode_escape"),
-                        )
-                        print(out_string)
-                        self.output.write(out_string)
-                        self.output.write("\n")
-                        self.fails += 1
-            except KeyError:
-                pass
-
-    def spell_check(self, on_form_dict, check_dict):
-        # Use the msword spelling object to spell check fields
-        print("Running Spell Check...")
-
-        for item in on_form_dict:
-            try:
-                spell_item = check_dict[item][4]
-                if spell_item == "Y":
-                    lines = on_form_dict[item].splitlines()
-                    line_count = 1
-                    for line in lines:
-                        spelling_result, warnings = self.spell_checker(line)
-                        self.warnings += warnings
-                        if spelling_result:
-                            line_out = (
-                                "\n"
-                                + check_dict[item][0]
-                                + " "
-                                + "line %d" % line_count
-                                + ":\n"
-                            )
-                            self.output.write(line_out)
-                            self.output.write(spelling_result)
-                        line_count += 1
-            except KeyError:
-                pass
-
-    def version_check(self, read_version, version_dict):
-        # Check if the form is the right version -- use information form PR Structure.ods
-        if version_dict[self.pr_type] != read_version:
-            self.output.write("Version Check => [FAIL]\n")
-            self.output.write("Correct PR Version: %s\n" % version_dict[self.pr_type])
-            self.output.write("This PR Version: %s\n\n" % read_version)
-        elif options.verbose:
-            self.output.write("Version Check => [OK]\n\n")
-
-    def catch_common(self, on_form_dict, check_dict):
-        # Look for common error patterns defined on Catch sheet in PR Structure.ods
-        for item in on_form_dict:
-            try:
-                if check_dict[item][4] == "Y":
-                    line_number = 1
-                    for line in on_form_dict[item].splitlines():
-                        for pattern in self.catch_list:
-                            p = re.compile(r"%s" % pattern)
-                            match = p.search(line)
-                            if match:
-                                output = (
-                                    "\n%s, Line %d:\n[WARNING] Likely error => %s\n\n"
-                                    % (check_dict[item][0], line_number, match.group())
-                                )
-                                self.output.write(output)
-                                self.warnings += 1
-                            else:
-                                if options.verbose:
-                                    self.output.write(
-                                        "Catch Common => %s [OK]\n" % pattern
-                                    )
-                        line_number += 1
-
-            except KeyError:
-                pass
+                lines.append("%s %r" % (i, the_dict[i]))
+            self.trace.trace("rules", prtrace.INFO, "\n".join(lines) + "\n\n")
 
     # def senior_rater_sig_block_match
 
     def clean_up(self):
-        # Finish up the script and call the output files
+        # Finish the report and show it if it is a PDF
+        self.output.write_status(self.pr_filename, self.status, self.error)
         self.output.close()
 
-        os.system(
-            '%s%sText2PDF "%s"' % (os.getcwd(), os.path.sep, self.output_filename)
-        )
-        self.pdfout_file = "%s%s%s.pdf" % (
-            os.path.split(self.pr_filename)[0],
-            os.path.sep,
-            os.path.basename(self.pr_filename),
-        )
+        self.pdfout_file = self.output.report_filename
         print(self.pdfout_file)
-        print(self.output_filename)
-
-        shutil.move("%s.pdf" % (self.output_filename), self.pdfout_file)
-        os.remove(self.output_filename)
+        if not isinstance(self.output, prsinks.pdf_sink):
+            return
 
         if os.name == "posix":
             try:
@@ -418,21 +362,14 @@ class pr_object:
             ie.visible = 1
             ie.Navigate("%s" % self.pdfout_file)
 
-    def test_group(self, check_tuple, check_type):
-        # Test the form's front and back page against truth dictionaries
-        p1_on_form = self.get_on_form_dicts(check_type, self.page1)
-        p2_on_form = self.get_on_form_dicts(check_type, self.page2)
-
-        on_form = (p1_on_form, p2_on_form)
-
-        # Spell Check Applicable Fields & Check The Pages Against Regular Expressions
-        for i in range(2):
-            if os.name == "nt":
-                self.spell_check(on_form[i], check_tuple[i])
-            self.catch_common(on_form[i], check_tuple[i])
-            self.regex_check(on_form[i], check_tuple[i])
+    def test_group(self, check_type):
+        # Pull the values of one element type off every page the rules cover
+        return [
+            self.get_on_form_dicts(check_type, page, page_index + 1)
+            for page_index, page in enumerate(self.pages[: self.dispatch.page_count])
+        ]
 
-    def main(self, *args):
+    def main(self):
 
         print("\n*****************START PR ANALYSIS*******************\n")
 
@@ -447,14 +384,61 @@ class pr_object:
         msg.pack()
         please_wait.update()
 
+        self.run_checks()
+
+        please_wait.destroy()
+
+        self.clean_up()
+
+    def extract(self):
+        # Pull the values of every element type the check plan needs, each
+        # labelled from its rule
+        on_form = {}
+        for check_type in self.engine.groups():
+            pages = self.test_group(check_type)
+            for truth_dict, values in zip(self.engine.rules[check_type], pages):
+                for sid in values:
+                    rule = truth_dict.get(sid)
+                    if rule is not None:
+                        values[sid].label = rule.label
+            on_form[check_type] = pages
+        return on_form
+
+    def write_findings(self, findings):
+        # Stream the findings of one page to the output as soon as the page is
+        # checked, with spelling suggestions filled in first
+        if self.spell_checker is not None:
+            detect_only = self.options.detect_only
+            if getattr(self.options, "sink", None) in prsinks.MACHINE_SINKS:
+                detect_only = True
+            self.spell_checker.suggest_findings(
+                findings,
+                self.options.suggestion_limit,
+                detect_only=detect_only,
+                deadline=self.suggestion_deadline,
+            )
+        for finding in findings:
+            self.output.write_finding(self, finding)
+            if finding.severity == prrecords.WARNING:
+                self.warnings += 1
+            elif finding.severity == prrecords.FAIL:
+                self.fails += 1
+
+    def run_checks(self, on_form=None):
+        # Run the check plan and write the results and totals to the output
+        if on_form is None:
+            on_form = self.extract()
+
         self.fails = 0
         self.warnings = 0
 
-        self.version_check(self.pr_version_text, self.ver_dict)
-
-        self.test_group((args[0], args[1]), "field")
-        self.test_group((args[2], args[3]), "check")
-        self.test_group((args[4], args[5]), "popup")
+        # One suggestion budget for the whole report
+        self.suggestion_deadline = None
+        if self.options.suggestion_budget:
+            self.suggestion_deadline = time.time() + self.options.suggestion_budget
+        self.findings = self.engine.run(
+            self, on_form, self.cache, self.write_findings
+        )
 
         warning_string = "===%d warning(s)===\n" % self.warnings
         fail_string = "***%d failed field(s)***\n" % self.fails
@@ -465,61 +449,48 @@ class pr_object:
         self.output.write(warning_string)
         self.output.write(fail_string)
 
-        please_wait.destroy()
+        if self.stats is not None:
+            self.stats.add_report(self)
 
-        self.clean_up()
+        if self.cache:
+            self.cache.save()
+            print(
+                "Incremental check: %d result(s) reused, %d field(s) rechecked"
+                % (self.cache.hits, self.cache.misses)
+            )
 
 
-# ****************SPELL CHECKER CLASSES*****************************
-
-
-class msword_spell_check:
-    def __init__(self, overlook_list):
-        self.msword = win32com.client.Dispatch("Word.Application")
-        self.msword.Documents.Add()
-        self.overlook_res = []
-        for word in overlook_list:
-            self.overlook_res.append(re.compile(r"%s" % word, flags=re.I))
-
-    def check_overlook(self, word):
-
-        overlook = False
-
-        for overlook_word in self.overlook_res:
-            if overlook_word.match(word):
-                overlook = True
-
-        return overlook
-
-    def __call__(self, string):
-        warnings = 0
-        output = ""
-        for word in string.replace("-", " ").replace("/", " ").split():
-            if self.msword.CheckSpelling(word):
-                if options.verbose:
-                    out_string = "!%s! OK!" % word
-                    print(out_string)
-                    output += out_string + "\n"
-            else:
-                if not self.check_overlook(word):
-                    warnings += 1
-                    out_string = "[WARNING] ?%s? ->" % word
-                    print(out_string)
-                    output += out_string
-                    output += " "
-                    suggestions = self.msword.GetSpellingSuggestions(word)
-                    for suggest in suggestions:
-                        out_string = suggest.Name
-                        print(out_string)
-                        output += out_string
-                        output += " "
-                    output += "\n"
-                else:
-                    if options.verbose:
-                        out_string = "!%s! -> " % word + "matches overlook list.\n"
-                        output += out_string
-
-        return output, warnings
+# ***********************EXTRACTION API*****************************
+
+
+def extract_fields(pr_filename, settings_filename, run_options=None):
+    # Every value the ruleset covers in a PR, as a list of prrecords.form_field
+    # (sid, page, label, text and line offsets) in report order, without
+    # running any check.  The spans of the findings of a check index into
+    # these values.  Raises prinput.xfdl_error if the form is rejected.
+    pr = pr_object(
+        pr_filename, settings_filename, run_options, prsinks.memory_sink(), run=False
+    )
+    if not pr.check_header(pr_filename):
+        raise prinput.xfdl_error(pr.error or pr.output.getvalue().splitlines()[-1])
+    pr.set_document(
+        prinput.parse_document(
+            pr_filename, pr.options.max_ratio, pr.options.max_size << 20
+        )
+    )
+    # The form's tables only; no spell checker (and no Word) is started
+    pr.load_form_rules()
+    on_form = pr.extract()
+    pr.doc.unlink()
+    fields = []
+    for group, page_index, truth_dict, steps in pr.engine.plan:
+        try:
+            values = on_form[group][page_index]
+        except (KeyError, IndexError):
+            continue
+        # Elements of the form with no row in the ruleset are left out
+        fields.extend([values[sid] for sid in values if sid in truth_dict])
+    return fields
 
 
 # ***********************GUI CLASSES********************************
@@ -571,15 +542,90 @@ def usage():
     print("Usage: prchecker [options] filename")
 
 
+def check_trace(option, opt, value, parser):
+    # Turn a bad --trace value into a usage error
+    try:
+        prtrace.parse_trace(value)
+    except prtrace.trace_error as e:
+        raise optparse.OptionValueError(str(e))
+    parser.values.trace = value
+
+
+def option_parser():
+    # Command line options shared by prcheck and the batch tools
+    p = optparse.OptionParser()
+    p.add_option("--verbose", "-v", action="store_true", help="same as --trace all")
+    p.add_option(
+        "--trace",
+        dest="trace",
+        type="string",
+        action="callback",
+        callback=check_trace,
+        metavar="CHECK[:LEVEL],...",
+        help="trace checks (%s or all) at info or debug"
+        % ", ".join(prtrace.TRACE_CHECKS),
+    )
+    p.add_option("--trace-file", metavar="FILE", help="default: the log")
+    p.add_option("--incremental", "-i", action="store_true")
+    p.add_option("--jobs", "-j", type="int", default=0)
+    p.add_option("--spell-workers", type="int", default=1)
+    p.add_option(
+        "--detect-only",
+        action="store_true",
+        help="flag misspellings, no suggestions (always with --sink jsonl)",
+    )
+    p.add_option("--suggestion-limit", type="int", default=0, metavar="N")
+    p.add_option("--suggestion-budget", type="float", default=0, metavar="SECONDS")
+    p.add_option("--lexicon", metavar="FILE", help="acronym lexicon (text file)")
+    p.add_option(
+        "--sink",
+        type="choice",
+        choices=prsinks.SINK_NAMES,
+        default="pdf",
+        help="report output: %s" % ", ".join(prsinks.SINK_NAMES),
+    )
+    p.add_option("--sink-file", metavar="FILE", help="default: next to the PR")
+    p.add_option(
+        "--regex-budget",
+        type="float",
+        default=1.0,
+        metavar="SECONDS",
+        help="time allowed per match of a guarded rule pattern (0: no limit)",
+    )
+    p.add_option(
+        "--max-ratio",
+        type="int",
+        default=prinput.DEFAULT_MAX_RATIO,
+        help="largest decompression ratio accepted for a form (0: no limit)",
+    )
+    p.add_option(
+        "--max-size",
+        type="int",
+        default=prinput.DEFAULT_MAX_SIZE >> 20,
+        metavar="MB",
+        help="largest decompressed form accepted (0: no limit)",
+    )
+    return p
+
+
+# Defaults for pr_object when prcheck is imported rather than run
+options = option_parser().get_default_values()
+
+
 if __name__ == "__main__":
+    # Needed by the regex guard's worker process in the py2exe build
+    prlint.multiprocessing.freeze_support()
+
+    sys.stdout = prinput.open_report("logfile.txt")
+    sys.stderr = prinput.open_report("logfileerr.txt")
+
     # Set up a couple of admin things to deal with windows' baloney
     working_dir = os.getcwd()
 
     splash_image()
 
     # Deal with arguments, options and incorrect usage
-    p = optparse.OptionParser()
-    p.add_option("--verbose", "-v", action="store_true")
+    p = option_parser()
     options, arguments = p.parse_args()
     if len(arguments) == 0:
         pr_file = ""
@@ -603,10 +649,13 @@ if __name__ == "__main__":
             os.chdir(working_dir)
 
     pr_file = os.path.abspath(pr_file)
+    settings_file = prrules.find_ruleset(settings_file)
 
     # Run the program, finally
     print("Analyzing PR...")
     pr = pr_object(pr_file, settings_file)
+    # Stop the spell checker and regex guard workers
+    pr.settings.close()
 
     # Clean up logfiles
     # sys.stdout.close()
@@ -0,0 +1,231 @@
+#!/usr/bin/env python
+
+"""Duplicate bullet detection across the reports of a batch.
+
+Every line of a narrative field (spell-checked, with no REGEX: the
+assessments, duty descriptions and comments, not names or duty titles) with at
+least MIN_WORDS words is a bullet.  A bullet is cut into overlapping word
+shingles, and the shingles are reduced to a MinHash signature: SIGNATURE_SIZE
+minimum hash values whose agreement between two bullets estimates how much of
+their wording they share.  The signature is split into BANDS bands, and each
+band is looked up in a bucket table (locality sensitive hashing), so a new
+bullet is only compared with earlier bullets that agree with it on a whole
+band instead of with every bullet seen so far.  Pairs from different reports
+whose signatures agree on at least --duplicate-threshold of their values are
+written to a CSV file as they are found.
+
+Memory per bullet is its signature plus a short excerpt of its text.  The
+index keeps the last MAX_BULLETS bullets, the oldest making room for the
+newest, so a very large batch matches each bullet against the most recent
+reports only; and a bucket never holds more than MAX_BUCKET bullets
+(boilerplate shared by hundreds of reports fills its buckets and is still
+matched against them).  The index stays bounded and every lookup takes
+bounded time however large the batch.
+
+Usage: prbatch.py --duplicates FILE.csv file-or-directory ...
+"""
+
+import re
+import csv
+import zlib
+import random
+import threading
+from array import array
+
+import prinput
+
+SHINGLE_WORDS = 3
+MIN_WORDS = 6
+SIGNATURE_SIZE = 32
+BANDS = 8
+MAX_BUCKET = 64
+MAX_BULLETS = 50000
+EXCERPT_LENGTH = 60
+DEFAULT_THRESHOLD = 0.8
+
+# Mersenne prime for the hash family; every hash value fits in 32 bits
+PRIME = (1 << 31) - 1
+SEED = 1
+
+WORD_RE = re.compile(r"[a-z0-9]+")
+
+CSV_HEADER = [
+    "similarity",
+    "file",
+    "page",
+    "field",
+    "line",
+    "text",
+    "duplicate of file",
+    "duplicate of page",
+    "duplicate of field",
+    "duplicate of line",
+    "duplicate of text",
+]
+
+
+def csv_text(text):
+    # Field values are unicode; the csv module of Python 2 wants bytes
+    if isinstance(text, str):
+        return text
+    return text.encode("utf-8")
+
+
+def shingles(text, size=SHINGLE_WORDS):
+    # Set of hashed runs of size words; case and punctuation are ignored
+    words = WORD_RE.findall(text.lower())
+    if len(words) < size:
+        return set()
+    hashes = set()
+    for i in range(len(words) - size + 1):
+        shingle = " ".join(words[i : i + size])
+        hashes.add(zlib.crc32(shingle.encode("utf-8")) & 0xFFFFFFFF)
+    return hashes
+
+
+class duplicate_index:
+    def __init__(self, filename, threshold=DEFAULT_THRESHOLD):
+        # Write near-duplicate pairs to the CSV file filename
+        self.filename = filename
+        self.threshold = threshold
+        generator = random.Random(SEED)
+        self.hash_family = [
+            (generator.randint(1, PRIME - 1), generator.randint(0, PRIME - 1))
+            for i in range(SIGNATURE_SIZE)
+        ]
+        self.rows = SIGNATURE_SIZE // BANDS
+        # Bullet n is kept in slot n % MAX_BULLETS until bullet
+        # n + MAX_BULLETS takes its place
+        self.count = 0  # bullets added
+        self.signatures = array("L")  # SIGNATURE_SIZE values per slot
+        self.bullets = []  # (report, page, sid, line, excerpt) per slot
+        self.reports = []  # file names
+        self.buckets = [{} for i in range(BANDS)]  # band hash => [bullet]
+        self.lock = threading.Lock()
+        self.csv_file = prinput.open_csv(filename, "w")
+        self.csv = csv.writer(self.csv_file, lineterminator="\n")
+        self.csv.writerow(CSV_HEADER)
+        self.pairs = 0
+
+    def signature(self, hashes):
+        # MinHash signature of a set of shingle hashes
+        return [
+            min([(a * (x % PRIME) + b) % PRIME for x in hashes])
+            for a, b in self.hash_family
+        ]
+
+    def band_keys(self, signature):
+        rows = self.rows
+        return [
+            hash(tuple(signature[band * rows : (band + 1) * rows]))
+            for band in range(BANDS)
+        ]
+
+    def stored(self, bullet):
+        # Signature of a bullet still in the index
+        start = (bullet % MAX_BULLETS) * SIGNATURE_SIZE
+        return self.signatures[start : start + SIGNATURE_SIZE]
+
+    def similarity(self, signature, bullet):
+        # Share of signature values a stored bullet agrees on
+        start = (bullet % MAX_BULLETS) * SIGNATURE_SIZE
+        stored = self.signatures[start : start + SIGNATURE_SIZE]
+        same = 0
+        for i in range(SIGNATURE_SIZE):
+            if stored[i] == signature[i]:
+                same += 1
+        return float(same) / SIGNATURE_SIZE
+
+    def add_report(self, filename, narratives):
+        # Index the bullets of one report; narratives yields (sid, rule,
+        # value) as rule_engine.narratives does.  Returns the pairs found.
+        found = []
+        for sid, rule, value in narratives:
+            line_number = 1
+            for line in value.splitlines():
+                if len(line.split()) >= MIN_WORDS:
+                    hashes = shingles(line)
+                    if hashes:
+                        found.append(
+                            (rule.page, sid, line_number, line, self.signature(hashes))
+                        )
+                line_number += 1
+
+        self.lock.acquire()
+        try:
+            report = len(self.reports)
+            self.reports.append(filename)
+            pairs = 0
+            for page, sid, line_number, line, signature in found:
+                bullet = self.count
+                keys = self.band_keys(signature)
+                seen = set()
+                for band in range(BANDS):
+                    for other in self.buckets[band].get(keys[band], ()):
+                        if other in seen:
+                            continue
+                        seen.add(other)
+                        if self.bullets[other % MAX_BULLETS][0] == report:
+                            continue
+                        similarity = self.similarity(signature, other)
+                        if similarity >= self.threshold:
+                            self.write_pair(
+                                similarity, report, page, sid, line_number, line, other
+                            )
+                            pairs += 1
+                entry = (report, page, sid, line_number, line[:EXCERPT_LENGTH])
+                self.store(bullet, signature, entry)
+                for band in range(BANDS):
+                    bucket = self.buckets[band].setdefault(keys[band], [])
+                    if len(bucket) < MAX_BUCKET:
+                        bucket.append(bullet)
+            self.csv_file.flush()
+            self.pairs += pairs
+            return pairs
+        finally:
+            self.lock.release()
+
+    def store(self, bullet, signature, entry):
+        # Keep a bullet, evicting the one whose slot it takes
+        self.count += 1
+        if bullet < MAX_BULLETS:
+            self.signatures.extend(signature)
+            self.bullets.append(entry)
+            return
+        evicted = bullet - MAX_BULLETS
+        keys = self.band_keys(self.stored(evicted))
+        for band in range(BANDS):
+            bucket = self.buckets[band].get(keys[band])
+            if bucket is not None and evicted in bucket:
+                bucket.remove(evicted)
+                if not bucket:
+                    del self.buckets[band][keys[band]]
+        slot = bullet % MAX_BULLETS
+        self.signatures[slot * SIGNATURE_SIZE : (slot + 1) * SIGNATURE_SIZE] = array(
+            "L", signature
+        )
+        self.bullets[slot] = entry
+
+    def write_pair(self, similarity, report, page, sid, line_number, line, other):
+        other_report, other_page, other_sid, other_line, excerpt = self.bullets[
+            other % MAX_BULLETS
+        ]
+        self.csv.writerow(
+            [
+                "%.2f" % similarity,
+                self.reports[report],
+                page,
+                sid,
+                line_number,
+                csv_text(line),
+                self.reports[other_report],
+                other_page,
+                other_sid,
+                other_line,
+                csv_text(excerpt),
+            ]
+        )
+
+    def close(self):
+        self.csv_file.close()
+        return self.pairs
@@ -0,0 +1,605 @@
+#!/usr/bin/env python
+
+"""Rule engine for the PR Checker.
+
+Every check is a stage registered with register_stage.  A form stage runs once
+per report (the version check); a field stage declares which element groups
+(field, check, popup) it needs and which rows of the ruleset it applies to.
+The engine turns a ruleset into an execution plan once, then runs only the
+stages relevant to each field.  Before any field is checked every stage is
+shown all the fields it will be asked about, so a stage with an expensive
+backend (spelling) can answer them in one bulk request.  Field stages on the
+same page are independent, so they may optionally run in a thread pool; their
+output is always written in plan order so a parallel run reports exactly what
+a serial run does.  When the context carries a prstats.report_stats (stats),
+every check_field is timed and counted there.  What passed goes to the
+context's prtrace.tracer (trace), never into the findings; a stage asks the
+tracer once per field whether its check is traced.
+
+Adding a check means writing a stage class and decorating it:
+
+    @register_stage
+    class my_stage(field_stage):
+        name = "mine"
+        order = 40
+        def wants(self, rule): ...
+        def check_field(self, context, sid, value, rule): ...
+"""
+
+import re
+import time
+from multiprocessing.pool import ThreadPool
+
+import prlint
+import prspell
+import prtitles
+import prtrace
+
+from prrecords import split_lines, finding, VERSION, SPELL, CATCH, REGEX, ACRONYM
+from prrecords import OK, NOTE, WARNING, FAIL
+
+GROUPS = ("field", "check", "popup")
+
+STAGES = []
+
+
+def register_stage(stage_class):
+    # Add a stage to the registry, keeping the registry in run order
+    STAGES.append(stage_class)
+    STAGES.sort(key=lambda stage: stage.order)
+    return stage_class
+
+
+class form_stage:
+    # A check that runs once per report before any field checks
+    name = None
+    order = 0
+    requires = None
+
+    def check_form(self, context):
+        # Return a list of prrecords.finding
+        raise NotImplementedError
+
+
+class field_stage:
+    # A check that runs once per field it applies to
+    name = None
+    order = 0
+    groups = GROUPS
+    requires = None
+    thread_safe = True
+    banner = None
+
+    def wants(self, rule):
+        # Return True if this stage applies to a ruleset row (prrecords.rule_row)
+        return True
+
+    def begin(self, context, items):
+        # Called once per report with every (sid, value, rule) this stage is
+        # about to check, before the first check_field
+        pass
+
+    def check_field(self, context, sid, value, rule):
+        # rule is a prrecords.rule_row; return a list of prrecords.finding
+        raise NotImplementedError
+
+
+def pattern_span(context, method, pattern, text):
+    # (start, end) of re.<method>(pattern, text) in text, or None.  With a
+    # prlint.regex_guard on the context, risky patterns run under its time
+    # budget and may raise prlint.regex_timeout.
+    guard = getattr(context, "regex_guard", None)
+    if guard is not None:
+        return guard.span(pattern, method, text)
+    match = getattr(re.compile(pattern), method)(text)
+    if match is None:
+        return None
+    return match.span()
+
+
+def apply_pattern(context, method, pattern, text):
+    # Text matched by re.<method>(pattern, text), or None; see pattern_span
+    span = pattern_span(context, method, pattern, text)
+    if span is None:
+        return None
+    return text[span[0] : span[1]]
+
+
+def timed_out(findings):
+    # True if a guarded pattern ran out of time for any of findings
+    for f in findings:
+        if f.extra == "timeout":
+            return True
+    return False
+
+
+def line_span(start, line):
+    # Span of a whole line of a field value
+    return (start, start + len(line))
+
+
+# ****************************STAGES*********************************
+
+
+@register_stage
+class version_stage(form_stage):
+    name = "version"
+    order = 0
+
+    def check_form(self, context):
+        # Check if the form is the right version -- use information form
+        # PR Structure.ods
+        correct_version = context.ver_dict[context.pr_type]
+        if correct_version != context.pr_version_text:
+            return [
+                finding(
+                    VERSION, FAIL, text=context.pr_version_text, extra=correct_version
+                )
+            ]
+        context.trace.trace_finding("version", prtrace.INFO, finding(VERSION, OK))
+        return []
+
+
+@register_stage
+class spell_stage(field_stage):
+    # Use the spelling object to spell check fields
+    name = "spell"
+    order = 10
+    requires = "spell_checker"
+    thread_safe = False
+    banner = "Running Spell Check..."
+
+    def wants(self, rule):
+        return rule.spell
+
+    def begin(self, context, items):
+        # Send the words of the whole report to the spell checker at once
+        prefetch_text = getattr(context.spell_checker, "prefetch_text", None)
+        if prefetch_text is not None:
+            prefetch_text([value for sid, value, rule in items])
+
+    def check_field(self, context, sid, value, rule):
+        # Spell check one field line by line
+        findings = []
+        trace = context.trace
+        tracing = trace.enabled("spell")
+        line_count = 1
+        for line_start, line in split_lines(value):
+            heading = traced = None
+            words = context.spell_checker.check_words(line)
+            starts = prspell.word_starts(line, [word for word, status in words])
+            for (word, status), start in zip(words, starts):
+                if status == "acronym":
+                    # Left to the acronym stage
+                    continue
+                start += line_start
+                span = (start, start + len(word))
+                if status != "misspelled":
+                    if tracing:
+                        if traced is None:
+                            traced = finding(
+                                SPELL, NOTE, sid, rule.page, rule.label, line_count
+                            )
+                            trace.trace_finding("spell", prtrace.DEBUG, traced)
+                        extra = None
+                        if status == "overlook":
+                            extra = "overlook"
+                        trace.trace_finding(
+                            "spell",
+                            prtrace.DEBUG,
+                            finding(
+                                SPELL,
+                                OK,
+                                sid,
+                                rule.page,
+                                rule.label,
+                                line_count,
+                                word,
+                                extra,
+                                span,
+                            ),
+                        )
+                    continue
+                if heading is None:
+                    heading = finding(
+                        SPELL,
+                        NOTE,
+                        sid,
+                        rule.page,
+                        rule.label,
+                        line_count,
+                        span=line_span(line_start, line),
+                    )
+                    findings.append(heading)
+                # Suggestions are filled in later, only if wanted
+                findings.append(
+                    finding(
+                        SPELL,
+                        WARNING,
+                        sid,
+                        rule.page,
+                        rule.label,
+                        line_count,
+                        word,
+                        span=span,
+                    )
+                )
+            line_count += 1
+        return findings
+
+
+@register_stage
+class acronym_stage(field_stage):
+    # Check acronyms and abbreviations against the lexicon (prlexicon.py).
+    # Unknown ones are spell checked like other words, so they are only
+    # reported here when there is no spell checker.
+    name = "acronym"
+    order = 15
+    requires = "lexicon"
+
+    def wants(self, rule):
+        return rule.spell
+
+    def check_field(self, context, sid, value, rule):
+        findings = []
+        trace = context.trace
+        tracing = trace.enabled("acronym")
+        spelled = getattr(context, "spell_checker", None) is not None
+        defined = set()
+        line_number = 1
+        for line_start, line in split_lines(value):
+            for word, token, status, start in context.lexicon.scan(line, defined):
+                start += line_start
+                span = (start, start + len(word))
+                if status == "unknown" and spelled:
+                    # Left to the spell stage
+                    continue
+                if status == "unknown":
+                    findings.append(
+                        finding(
+                            ACRONYM,
+                            WARNING,
+                            sid,
+                            rule.page,
+                            rule.label,
+                            line_number,
+                            token,
+                            span=span,
+                        )
+                    )
+                elif tracing:
+                    trace.trace_finding(
+                        "acronym",
+                        prtrace.DEBUG,
+                        finding(
+                            ACRONYM,
+                            OK,
+                            sid,
+                            rule.page,
+                            rule.label,
+                            line_number,
+                            token,
+                            span=span,
+                        ),
+                    )
+            line_number += 1
+        return findings
+
+
+@register_stage
+class catch_stage(field_stage):
+    # Look for common error patterns defined on Catch sheet in PR Structure.ods
+    name = "catch"
+    order = 20
+    requires = "catch_list"
+
+    def wants(self, rule):
+        return rule.spell
+
+    def check_field(self, context, sid, value, rule):
+        findings = []
+        stats = getattr(context, "stats", None)
+        trace = context.trace
+        tracing = trace.enabled("catch")
+        line_number = 1
+        for line_start, line in split_lines(value):
+            for pattern in context.catch_list:
+                if stats is not None:
+                    start = time.time()
+                try:
+                    match = pattern_span(context, "search", pattern, line)
+                except prlint.regex_timeout:
+                    if stats is not None:
+                        stats.record("pattern", "", pattern, True, time.time() - start)
+                    findings.append(
+                        finding(
+                            CATCH,
+                            WARNING,
+                            sid,
+                            rule.page,
+                            rule.label,
+                            line_number,
+                            pattern,
+                            "timeout",
+                            line_span(line_start, line),
+                        )
+                    )
+                    continue
+                if stats is not None:
+                    stats.record(
+                        "pattern", "", pattern, match is not None, time.time() - start
+                    )
+                if match is not None:
+                    findings.append(
+                        finding(
+                            CATCH,
+                            WARNING,
+                            sid,
+                            rule.page,
+                            rule.label,
+                            line_number,
+                            line[match[0] : match[1]],
+                            span=(line_start + match[0], line_start + match[1]),
+                        )
+                    )
+                elif tracing:
+                    trace.trace_finding(
+                        "catch",
+                        prtrace.DEBUG,
+                        finding(
+                            CATCH, OK, sid, rule.page, rule.label, line_number, pattern
+                        ),
+                    )
+            line_number += 1
+        return findings
+
+
+@register_stage
+class regex_stage(field_stage):
+    # Check fields against the regular expressions in the Fields, Checks and
+    # Popups sheets
+    name = "regex"
+    order = 30
+    banner = "Running Regular Expression Check...\n"
+
+    def wants(self, rule):
+        return rule.has_regex
+
+    def check_field(self, context, sid, value, rule):
+        # Duty titles are checked token by token against the title index
+        # (prtitles.py); everything else against the row's regex
+        passed = None
+        titles = getattr(context, "title_index", None)
+        if titles is not None and prtitles.is_duty_title(rule):
+            passed = titles.check_field(value, rule.regex)
+            text = value
+        if passed is None:
+            try:
+                text = apply_pattern(context, "match", rule.regex, value)
+            except prlint.regex_timeout:
+                result = finding(
+                    REGEX,
+                    FAIL,
+                    sid,
+                    rule.page,
+                    rule.label,
+                    text=value,
+                    extra="timeout",
+                    span=(0, len(value)),
+                )
+                print(result.format())
+                return [result]
+            passed = text is not None
+        if passed:
+            trace = context.trace
+            if trace.enabled("regex"):
+                trace.trace_finding(
+                    "regex",
+                    prtrace.DEBUG,
+                    finding(REGEX, OK, sid, rule.page, rule.label, text=text),
+                )
+            return []
+        result = finding(
+            REGEX, FAIL, sid, rule.page, rule.label, text=value, span=(0, len(value))
+        )
+        print(result.format())
+        return [result]
+
+
+# ****************************ENGINE*********************************
+
+
+class rule_engine:
+    def __init__(self, rules, stages=None, workers=0):
+        # rules maps each group to a sequence of per-page truth dictionaries,
+        # e.g. {"field": (field_dict_p1, field_dict_p2), ...}.  workers > 1 runs
+        # independent thread-safe stages of a page concurrently.
+        if stages is None:
+            stages = STAGES
+        self.rules = rules
+        self.form_stages = [s() for s in stages if issubclass(s, form_stage)]
+        self.field_stages = [s() for s in stages if issubclass(s, field_stage)]
+        self.workers = workers
+        self.plan = self.build_plan()
+
+    def build_plan(self):
+        # For every group and page, list the stages to run and the set of
+        # field sids each one applies to.  Done once per ruleset.
+        plan = []
+        for group in GROUPS:
+            if group not in self.rules:
+                continue
+            for page_index, truth_dict in enumerate(self.rules[group]):
+                steps = []
+                for stage in self.field_stages:
+                    if group not in stage.groups:
+                        continue
+                    sids = set()
+                    for sid in truth_dict:
+                        if stage.wants(truth_dict[sid]):
+                            sids.add(sid)
+                    steps.append((stage, sids))
+                plan.append((group, page_index, truth_dict, steps))
+        return plan
+
+    def groups(self):
+        # Element groups the plan needs values for
+        return [group for group in GROUPS if group in self.rules]
+
+    def narratives(self, on_form):
+        # Yield (sid, rule, value) for every narrative (free text) field of
+        # the extracted values, in plan order
+        for group, page_index, truth_dict, steps in self.plan:
+            try:
+                values = on_form[group][page_index]
+            except (KeyError, IndexError):
+                continue
+            for sid in values:
+                rule = truth_dict.get(sid)
+                if rule is not None and rule.narrative:
+                    yield sid, rule, values[sid].value
+
+    def available(self, stage, context):
+        # A stage is skipped when the context lacks what it requires
+        return (
+            stage.requires is None or getattr(context, stage.requires, None) is not None
+        )
+
+    def run(self, context, on_form, cache=None, emit=None):
+        # Run every stage against the values extracted from the form.
+        # on_form maps each group to a list of per-page
+        # {sid: prrecords.form_field} dicts.  Returns the findings in report
+        # order; emit, if given, is also called with the findings of the form
+        # stages and then of each page as soon as they are complete.
+        results = []
+        for stage in self.form_stages:
+            if self.available(stage, context):
+                results.extend(stage.check_form(context))
+        if emit is not None and results:
+            emit(results[:])
+
+        # Resolve the cache for every page first, so each stage sees all of
+        # its remaining work before checking starts
+        pages = []
+        for group, page_index, truth_dict, steps in self.plan:
+            try:
+                values = on_form[group][page_index]
+            except (KeyError, IndexError):
+                continue
+            scope = "%s:%d" % (group, page_index + 1)
+            jobs = []
+            for stage, sids in steps:
+                if not self.available(stage, context):
+                    continue
+                jobs.append(
+                    self.prepare(context, scope, stage, sids, values, truth_dict, cache)
+                )
+            pages.append((values, jobs))
+        for stage in self.field_stages:
+            items = []
+            for values, jobs in pages:
+                for job in jobs:
+                    if job[0] is stage:
+                        for index in job[2]:
+                            key, sid, value, rule = job[1][index]
+                            items.append((sid, value, rule))
+            if items:
+                stage.begin(context, items)
+
+        pool = None
+        if self.workers > 1:
+            pool = ThreadPool(self.workers)
+        try:
+            for values, jobs in pages:
+                for job in jobs:
+                    if job[0].banner and values:
+                        print(job[0].banner)
+                if pool:
+                    pending = [
+                        pool.apply_async(self.complete, (context, job))
+                        for job in jobs
+                        if job[0].thread_safe
+                    ]
+                    for job in jobs:
+                        if not job[0].thread_safe:
+                            self.complete(context, job)
+                    for p in pending:
+                        p.get()
+                else:
+                    for job in jobs:
+                        self.complete(context, job)
+                page_results = []
+                for job in jobs:
+                    self.finish(job, cache)
+                    for result in job[3]:
+                        page_results.extend(result)
+                if emit is not None and page_results:
+                    emit(page_results)
+                results.extend(page_results)
+        finally:
+            if pool:
+                pool.close()
+                pool.join()
+
+        return results
+
+    def prepare(self, context, scope, stage, sids, values, truth_dict, cache):
+        # Resolve cached results on the calling thread and queue the rest.
+        # A job is (stage, [(key, sid, value, rule)], todo indexes, results).
+        items = []
+        results = []
+        todo = []
+        for sid in values:
+            if sid not in sids:
+                continue
+            key = (scope, stage.name, sid)
+            value = values[sid].value
+            result = None
+            if cache:
+                result = cache.lookup(key, value)
+            if result is None:
+                todo.append(len(results))
+            items.append((key, sid, value, truth_dict[sid]))
+            results.append(result)
+        return (stage, items, todo, results)
+
+    def complete(self, context, job):
+        # Run the stage over every field that was not answered by the cache
+        stage, items, todo, results = job
+        stats = getattr(context, "stats", None)
+        if stats is not None:
+            self.complete_counted(context, job, stats)
+            return
+        for index in todo:
+            key, sid, value, rule = items[index]
+            results[index] = stage.check_field(context, sid, value, rule)
+
+    def complete_counted(self, context, job, stats):
+        # complete, timing each field and counting the ones with a warning
+        # or failure as hits of the field's rule
+        stage, items, todo, results = job
+        form = getattr(getattr(context, "form", None), "name", "")
+        for index in todo:
+            key, sid, value, rule = items[index]
+            start = time.time()
+            result = stage.check_field(context, sid, value, rule)
+            elapsed = time.time() - start
+            hit = False
+            for f in result:
+                if f.severity >= WARNING:
+                    hit = True
+                    break
+            stats.record(stage.name, form, "%s %s" % (sid, rule.label), hit, elapsed)
+            results[index] = result
+
+    def finish(self, job, cache):
+        # Store freshly computed results for the next incremental run.  A
+        # pattern that ran out of time says nothing about the value, so
+        # results with a timeout are checked again next time.
+        stage, items, todo, results = job
+        if cache:
+            for index in todo:
+                key, sid, value, rule = items[index]
+                if timed_out(results[index]):
+                    continue
+                cache.store(key, value, results[index])
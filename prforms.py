@@ -0,0 +1,110 @@
+#!/usr/bin/env python
+
+"""Form type registry for the PR Checker.
+
+Each supported form (AF707 OPR, AF910 EPR, ...) is a registered form_type that
+knows how to recognise itself from the globalpage formid title and version and
+which sheets of the ruleset hold its rules.  The per-page truth dictionaries and
+the check plan for a form type are built once per ruleset and reused for every
+report of that type, so a mixed batch never rescans the workbook.
+
+A new form needs one call:
+
+    register_form_type(form_type("AF911", "EPR", r"AF FORM 911", versions=("1.2",)))
+"""
+
+import re
+
+import prengine
+import prrecords
+
+GROUP_SHEETS = (("field", "Fields"), ("check", "Checks"), ("popup", "Popups"))
+GROUP_LABELS = {"field": "Field", "check": "Check Box", "popup": "Popups"}
+
+FORM_TYPES = []
+
+
+class form_type:
+    def __init__(self, name, pr_type, title_pattern, versions=None, sheets=None):
+        # name: form designation, e.g. "AF707"
+        # pr_type: key into the PR Version sheet and prefix of the rule sheets
+        # title_pattern: regex searched for in formid/title
+        # versions: accepted formid/version prefixes, or None for any version
+        # sheets: {group: sheet name}, defaulting to "<pr_type> Fields" etc.
+        self.name = name
+        self.pr_type = pr_type
+        self.title_re = re.compile(title_pattern)
+        self.versions = versions
+        if sheets is None:
+            sheets = {}
+            for group, suffix in GROUP_SHEETS:
+                sheets[group] = "%s %s" % (pr_type, suffix)
+        self.sheets = sheets
+
+    def matches(self, title, version=None):
+        # True if a form with this formid title and version is of this type
+        if not self.title_re.search(title):
+            return False
+        if self.versions is None or version is None:
+            return True
+        for accepted in self.versions:
+            if version.startswith(accepted):
+                return True
+        return False
+
+    def dispatch(self, rules, workers=0):
+        # Per-page truth dictionaries and check plan for this form type,
+        # built on first use and kept with the ruleset
+        return rules.memo(
+            ("form", self.name, workers), lambda r: self.build_dispatch(r, workers)
+        )
+
+    def build_dispatch(self, rules, workers):
+        group_rules = {}
+        page_count = 0
+        for group, suffix in GROUP_SHEETS:
+            if group in self.sheets:
+                group_rules[group] = rules.get_pages(
+                    self.sheets[group], prrecords.GROUP_IDS[group]
+                )
+                page_count = max(page_count, len(group_rules[group]))
+        return form_dispatch(self, group_rules, page_count, workers)
+
+
+class form_dispatch:
+    def __init__(self, form, group_rules, page_count, workers):
+        # group_rules maps each group to a list of truth dictionaries, one per page
+        self.form = form
+        self.rules = group_rules
+        self.page_count = page_count
+        self.engine = prengine.rule_engine(group_rules, workers=workers)
+
+    def labelled_dicts(self):
+        # (label, truth dictionary) pairs for the verbose dump, in report order
+        for group, suffix in GROUP_SHEETS:
+            for page_index, truth_dict in enumerate(self.rules.get(group, [])):
+                yield (
+                    "Page %d %s Dictionary" % (page_index + 1, GROUP_LABELS[group]),
+                    truth_dict,
+                )
+
+
+def register_form_type(form):
+    # Add a form type; later registrations are tried first so a site can
+    # override a shipped definition
+    FORM_TYPES.insert(0, form)
+    return form
+
+
+def detect_form(title, version=None):
+    # Return the registered form type matching a formid title and version
+    for form in FORM_TYPES:
+        if form.matches(title, version):
+            return form
+    return None
+
+
+register_form_type(
+    form_type("AF910", "EPR", r"ENLISTED", versions=("8.113.5", "8.120.3"))
+)
+register_form_type(form_type("AF707", "OPR", r"Officer", versions=("2.79.9",)))
@@ -0,0 +1,536 @@
+#!/usr/bin/env python
+
+"""XFDL input handling for the PR Checker.
+
+An .xfdl file is a MIME type line followed by a base64 encoded, gzipped XML
+document.  read_header decodes only as much of the payload as it takes to see
+the globalpage formid and custom:date elements, so the form type and version
+can be checked before paying for a full decode and parse.
+
+mapped_xfdl memory-maps a whole .xfdl file and decodes the payload straight
+from the map, a run of base64 lines at a time, into a streaming gzip
+decompressor whose output is fed to the XML parser as it is produced.  Neither
+the base64 text nor the gzip stream is ever copied into a Python string of its
+own, and there is no uudeview run or temp file.  parse_document is the entry
+point; decode_payload returns the whole document as one string instead.
+
+Every decoder validates the envelope as it streams (envelope_check): the
+MIME type line, the base64 alphabet, the gzip header, the XFDL root element
+and namespace within the first ROOT_WINDOW bytes of the document, and at the
+end the gzip trailer against a CRC-32 and length kept as the data goes by.  A
+corrupt or foreign file is rejected with an xfdl_error saying why after a few
+KB, before the XML parser sees any of it.
+
+A form's XML compresses about 8:1 to a few hundred KB.  Given max_ratio,
+decoding also stops as soon as a payload has expanded to more than max_ratio
+times the compressed bytes read so far (past the first RATIO_GRACE bytes), and
+given max_size once it passes max_size bytes, so a gzip bomb is rejected
+after a few megabytes instead of filling memory.
+
+Usage: prinput.py --bench file.xfdl ...
+
+    compares the peak memory allocated while decoding a report (tracemalloc,
+    Python 3 only), time per report and peak RSS of the uudeview/temp file
+    path, the in-memory path and the memory-mapped path
+"""
+
+import os
+import re
+import sys
+import mmap
+import codecs
+import zlib
+import struct
+import binascii
+import xml.dom.minidom
+from xml.sax.saxutils import unescape
+
+MIME_TYPE = b"application/vnd.xfdl"
+CONTENT_ENCODING = b"base64-gzip"
+CONTENT_ENCODING_RE = re.compile(br'content-encoding="?([^";\s]*)')
+XFDL_ENCODING = "ISO-8859-1"
+
+# Base64 is decoded in blocks of this many characters (a multiple of 4)
+CHUNK_SIZE = 4096
+WHITESPACE = b" \t\r\n"
+BASE64_INVALID = re.compile(br"[^A-Za-z0-9+/=\s]")
+
+GZIP_MAGIC = b"\x1f\x8b\x08"  # gzip, deflate
+ROOT_WINDOW = 4096
+ROOT_RE = re.compile(br'<XFDL\b[^>]*\sxmlns="http://www\.PureEdge\.com/XFDL/')
+
+# Decompression caps (see above); 0 means no cap
+DEFAULT_MAX_RATIO = 100
+DEFAULT_MAX_SIZE = 64 << 20
+RATIO_GRACE = 1 << 20
+
+HEADER_ELEMENTS = [
+    (attribute, element, re.compile(r"<%s>([^<]*)</%s>" % (element, element)))
+    for attribute, element in (
+        ("serial_number", "serialnumber"),
+        ("version", "version"),
+        ("title", "title"),
+        ("date", "custom:date"),
+    )
+]
+HEADER_END = "</custom:date>"
+GLOBALPAGE_END = "</globalpage>"
+
+
+class xfdl_error(Exception):
+    pass
+
+
+def check_root(document):
+    # The document must open with the XFDL root element and namespace
+    if ROOT_RE.search(document, 0, ROOT_WINDOW) is None:
+        raise xfdl_error(
+            "No XFDL root element in the first %d bytes of the document" % ROOT_WINDOW
+        )
+
+
+class envelope_check:
+    def __init__(self, max_ratio=0, max_size=0):
+        # Validates one payload as it is decoded; every method raises
+        # xfdl_error on the first thing wrong with it
+        self.max_ratio = max_ratio
+        self.max_size = max_size
+        self.compressed = 0
+        self.expanded = 0
+        self.crc = 0
+        self.head = b""  # start of the gzip stream, until its header is checked
+        self.document = b""  # start of the document, until its root is checked
+        self.tail = b""  # last 8 bytes of the gzip stream (the trailer)
+
+    def add_compressed(self, data):
+        # A decoded block of the gzip stream, before it is decompressed
+        if self.head is not None:
+            self.head += data[: len(GZIP_MAGIC)]
+            if len(self.head) >= len(GZIP_MAGIC):
+                if not self.head.startswith(GZIP_MAGIC):
+                    raise xfdl_error("Payload is not gzip compressed")
+                self.head = None
+        self.compressed += len(data)
+        self.tail = (self.tail + data[-8:])[-8:]
+
+    def add_expanded(self, data):
+        # A decompressed block of the document
+        self.expanded += len(data)
+        self.crc = zlib.crc32(data, self.crc)
+        if self.max_size and self.expanded > self.max_size:
+            raise xfdl_error("Payload larger than %d bytes" % self.max_size)
+        if (
+            self.max_ratio
+            and self.expanded > RATIO_GRACE
+            and self.expanded > self.max_ratio * self.compressed
+        ):
+            raise xfdl_error(
+                "Payload expands more than %d:1 (%d bytes from %d)"
+                % (self.max_ratio, self.expanded, self.compressed)
+            )
+        if self.document is not None:
+            self.document += data[:ROOT_WINDOW]
+            if len(self.document) >= ROOT_WINDOW:
+                self.check_root()
+
+    def check_root(self):
+        check_root(self.document)
+        self.document = None
+
+    def finish(self):
+        # The whole stream is decoded: check the root of a short document and
+        # the gzip trailer (CRC-32 and length of the document)
+        if self.head is not None:
+            raise xfdl_error("Empty payload")
+        if self.document is not None:
+            self.check_root()
+        if len(self.tail) < 8:
+            raise xfdl_error("Truncated gzip payload")
+        crc, size = struct.unpack("<II", self.tail)
+        if crc != self.crc & 0xFFFFFFFF or size != self.expanded & 0xFFFFFFFF:
+            raise xfdl_error("Truncated or corrupt gzip payload (CRC mismatch)")
+
+
+def open_report(filename, mode="w"):
+    # Report text files are ISO-8859-1 like the forms, which is what
+    # pyText2PDF lays out; a character outside it is written as "?"
+    if sys.version_info[0] < 3:
+        return codecs.open(filename, mode, XFDL_ENCODING, "replace")
+    return open(filename, mode, encoding=XFDL_ENCODING, errors="replace")
+
+
+def open_csv(filename, mode="r"):
+    # csv reads and writes bytes on Python 2 and text on Python 3
+    if sys.version_info[0] < 3:
+        return open(filename, mode + "b")
+    return open(filename, mode, newline="", encoding="utf-8")
+
+
+try:
+    buffer
+
+    def map_slice(mapped, start, end):
+        # Zero-copy slice of a memory map (slicing a buffer would copy)
+        return buffer(mapped, start, end - start)
+
+except NameError:
+
+    def map_slice(mapped, start, end):
+        # Zero-copy slice of a memory map
+        return memoryview(mapped)[start:end]
+
+
+class form_header:
+    def __init__(self, serial_number, version, title, date):
+        # Values of globalpage formid/serialnumber, formid/version,
+        # formid/title and custom:date
+        self.serial_number = serial_number
+        self.version = version
+        self.title = title
+        self.date = date
+
+
+def decode_block(block):
+    # (decoded bytes, None) for a block of base64, or (None, why it is bad)
+    # Searched first; a2b_base64 would skip a stray character
+    if BASE64_INVALID.search(block) is not None:
+        return None, "Bad base64 payload: character outside the alphabet"
+    try:
+        return binascii.a2b_base64(block), None
+    except binascii.Error as e:
+        return None, "Bad base64 payload: %s" % e
+
+
+def expanded_chunks(blocks, max_ratio=0, max_size=0):
+    # Yield the decompressed document from base64 blocks that each hold whole
+    # 4 character groups (whitespace aside), validating the envelope as the
+    # data goes by; the loop shared by every decoder
+    unzip = zlib.decompressobj(16 + zlib.MAX_WBITS)
+    envelope = envelope_check(max_ratio, max_size)
+    for block in blocks:
+        data, error = decode_block(block)
+        # A block may be a view of a memory map, which cannot be closed while
+        # a traceback holds this frame and the view with it
+        block = None
+        if error is not None:
+            raise xfdl_error(error)
+        envelope.add_compressed(data)
+        try:
+            expanded = unzip.decompress(data)
+        except zlib.error as e:
+            raise xfdl_error("Bad gzip payload: %s" % e)
+        envelope.add_expanded(expanded)
+        yield expanded
+    expanded = unzip.flush()
+    envelope.add_expanded(expanded)
+    envelope.finish()
+    yield expanded
+
+
+def file_blocks(f, chunk_size=CHUNK_SIZE):
+    # Yield the base64 text of an open .xfdl file in blocks of whole 4
+    # character groups, whitespace removed
+    pending = b""
+    while True:
+        block = f.read(chunk_size)
+        if not block:
+            break
+        pending += block.translate(None, WHITESPACE)
+        usable = len(pending) - len(pending) % 4
+        if usable:
+            yield pending[:usable]
+            pending = pending[usable:]
+    if pending:
+        if BASE64_INVALID.search(pending) is not None:
+            raise xfdl_error("Bad base64 payload: character outside the alphabet")
+        raise xfdl_error("Truncated base64 payload")
+
+
+def decoded_chunks(f, chunk_size=CHUNK_SIZE, max_ratio=0, max_size=0):
+    # Yield the decompressed document from an open .xfdl file, decoding
+    # base64 a block at a time; the MIME type line must already have been
+    # read.  The envelope is validated up to where the caller stops reading.
+    return expanded_chunks(file_blocks(f, chunk_size), max_ratio, max_size)
+
+
+def check_mime_line(mime_line):
+    # The MIME type line must name XFDL and, if it gives one, the
+    # base64-gzip content encoding
+    if not mime_line.startswith(MIME_TYPE):
+        raise xfdl_error("Not an XFDL file")
+    match = CONTENT_ENCODING_RE.search(mime_line)
+    if match is not None and match.group(1) != CONTENT_ENCODING:
+        raise xfdl_error(
+            "Unsupported content encoding: %s"
+            % match.group(1).decode("ascii", "replace")
+        )
+
+
+def read_mime_line(f):
+    # Read and check the MIME type line at the top of an .xfdl file
+    mime_line = f.readline(1024)
+    check_mime_line(mime_line)
+    return mime_line
+
+
+def read_header(filename, max_bytes=65536):
+    # Decode just enough of an .xfdl file to read its globalpage header.
+    # Raises xfdl_error if the file is not XFDL or the header is missing.
+    f = open(filename, "rb")
+    try:
+        read_mime_line(f)
+        head = b""
+        for data in decoded_chunks(f, 1024):
+            head += data
+            text = head.decode(XFDL_ENCODING)
+            if HEADER_END in text or GLOBALPAGE_END in text:
+                break
+            if len(head) > max_bytes:
+                break
+        else:
+            text = head.decode(XFDL_ENCODING)
+    finally:
+        f.close()
+    check_root(head)
+
+    end = text.find(GLOBALPAGE_END)
+    if end >= 0:
+        text = text[:end]
+    values = {}
+    for attribute, element, element_re in HEADER_ELEMENTS:
+        match = element_re.search(text)
+        if match is None:
+            raise xfdl_error("No %s in the form header" % element)
+        values[attribute] = unescape(match.group(1))
+    return form_header(**values)
+
+
+def decode_payload(filename):
+    # Decode a whole .xfdl file in memory and return the XML document bytes
+    f = open(filename, "rb")
+    try:
+        read_mime_line(f)
+        return b"".join(decoded_chunks(f))
+    finally:
+        f.close()
+
+
+def parse_document(filename, max_ratio=0, max_size=0):
+    # Decode and parse an .xfdl file straight from a memory map
+    mapped = mapped_xfdl(filename, max_ratio, max_size)
+    try:
+        return xml.dom.minidom.parse(mapped.stream())
+    finally:
+        mapped.close()
+
+
+class mapped_xfdl:
+    def __init__(self, filename, max_ratio=0, max_size=0):
+        # Map the file and find where the payload starts, after the MIME line
+        self.max_ratio = max_ratio
+        self.max_size = max_size
+        self.f = open(filename, "rb")
+        try:
+            self.size = os.fstat(self.f.fileno()).st_size
+            if self.size == 0:
+                raise xfdl_error("Not an XFDL file")
+            self.map = mmap.mmap(self.f.fileno(), 0, access=mmap.ACCESS_READ)
+        except (EnvironmentError, ValueError):
+            self.f.close()
+            raise
+        mime_end = self.map.find(b"\n", 0, 1024)
+        try:
+            if mime_end < 0:
+                raise xfdl_error("Not an XFDL file")
+            check_mime_line(self.map[:mime_end])
+        except xfdl_error:
+            self.close()
+            raise
+        self.payload_start = mime_end + 1
+
+    def aligned(self):
+        # True if every full base64 line holds whole 4 character groups, so
+        # the payload can be decoded at any line boundary without a carry
+        line_end = self.map.find(b"\n", self.payload_start)
+        if line_end < 0:
+            return True
+        line = self.map[self.payload_start : line_end].rstrip(b"\r")
+        return len(line) % 4 == 0
+
+    def chunks(self, chunk_size=CHUNK_SIZE):
+        # Iterator over the decompressed document, decoding whole base64
+        # lines directly out of the map
+        if self.aligned():
+            blocks = self.blocks(chunk_size)
+        else:
+            # Unusual line length; fall back to decoding from the file
+            self.f.seek(self.payload_start)
+            blocks = file_blocks(self.f, chunk_size)
+        return expanded_chunks(blocks, self.max_ratio, self.max_size)
+
+    def blocks(self, chunk_size):
+        # Slices of the map ending on a line boundary, read in place
+        position = self.payload_start
+        while position < self.size:
+            end = self.map.find(b"\n", position + chunk_size)
+            if end < 0:
+                end = self.size
+            else:
+                end += 1
+            yield map_slice(self.map, position, end)
+            position = end
+
+    def stream(self, chunk_size=CHUNK_SIZE):
+        # File-like object for the XML parser
+        return payload_stream(self.chunks(chunk_size))
+
+    def close(self):
+        self.map.close()
+        self.f.close()
+
+
+class payload_stream:
+    def __init__(self, chunks):
+        # Hands the parser one decompressed chunk per read() call; the
+        # expat builder accepts reads of any length
+        self.chunks = iter(chunks)
+
+    def read(self, size=-1):
+        for data in self.chunks:
+            if data:
+                return data
+        return b""
+
+
+# ***************************BENCHMARK*******************************
+
+
+def bench_temp_file(filename):
+    # The original path: uudeview writes the gzip stream to UNKNOWN.001, then
+    # GzipFile reads it back for minidom (uudeview emulated in process).
+    # Returns the document text and a clean-up function.
+    import gzip
+    import base64
+    import tempfile
+
+    f = open(filename, "rb")
+    text = f.read()
+    f.close()
+    data = base64.b64decode(text.split(b"\n", 1)[1])
+    handle, zipped_file = tempfile.mkstemp()
+    os.write(handle, data)
+    os.close(handle)
+    zip_data = gzip.GzipFile(zipped_file, "r")
+    try:
+        return zip_data.read(), None
+    finally:
+        zip_data.close()
+        os.remove(zipped_file)
+
+
+def bench_memory(filename):
+    # decode_payload: the whole document decoded and joined in memory
+    return decode_payload(filename), None
+
+
+def bench_mapped(filename):
+    # mapped_xfdl: a stream of the document decoded from the map as it is read
+    mapped = mapped_xfdl(filename)
+    return mapped.stream(), mapped.close
+
+
+BENCH_PATHS = {
+    "tempfile": bench_temp_file,
+    "memory": bench_memory,
+    "mmap": bench_mapped,
+}
+
+
+def bench_input(path, filename, parse=True):
+    # Feed one report through a path to minidom, or with parse False just
+    # read what minidom would have been given
+    source, close = BENCH_PATHS[path](filename)
+    try:
+        if not hasattr(source, "read"):
+            if parse:
+                return xml.dom.minidom.parseString(source)
+            return None
+        if parse:
+            return xml.dom.minidom.parse(source)
+        while source.read():
+            pass
+        return None
+    finally:
+        if close is not None:
+            close()
+
+
+def bench_path(path, filenames, repeat):
+    # Run one path in this process and report the peak memory allocated
+    # while decoding (measured with tracemalloc, where there is one), time
+    # and peak RSS
+    import time
+    import resource
+
+    peak_decode = -1
+    try:
+        import tracemalloc
+    except ImportError:
+        tracemalloc = None
+    if tracemalloc is not None:
+        peak_decode = 0
+        tracemalloc.start()
+        for filename in filenames:
+            bench_input(path, filename, parse=False)
+            tracemalloc.reset_peak()
+            base = tracemalloc.get_traced_memory()[0]
+            bench_input(path, filename, parse=False)
+            peak_decode = max(peak_decode, tracemalloc.get_traced_memory()[1] - base)
+        tracemalloc.stop()
+
+    reports = 0
+    start = time.time()
+    for i in range(repeat):
+        for filename in filenames:
+            bench_input(path, filename).unlink()
+            reports += 1
+    elapsed = time.time() - start
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    print("%s %d %f %d" % (path, peak_decode, elapsed / reports, peak))
+
+
+def bench(filenames, repeat=5):
+    # Each path runs in a fresh interpreter so peak RSS is its own
+    import subprocess
+
+    print(
+        "%-10s %18s %12s %14s"
+        % ("Path", "Peak decode (KB)", "ms/report", "Peak RSS (KB)")
+    )
+    for path in ("tempfile", "memory", "mmap"):
+        command = [sys.executable, os.path.abspath(__file__), "--bench-path", path]
+        command += ["--repeat", str(repeat)] + filenames
+        result = subprocess.check_output(command).split()
+        peak_decode = "n/a"
+        if int(result[1]) >= 0:
+            peak_decode = "%d" % (int(result[1]) // 1024)
+        print(
+            "%-10s %18s %12.1f %14d"
+            % (path, peak_decode, float(result[2]) * 1000, int(result[3]))
+        )
+
+
+if __name__ == "__main__":
+    import optparse
+
+    p = optparse.OptionParser(usage="%prog --bench file.xfdl ...")
+    p.add_option("--bench", action="store_true")
+    p.add_option("--bench-path", choices=list(BENCH_PATHS))
+    p.add_option("--repeat", type="int", default=5)
+    options, arguments = p.parse_args()
+    if not arguments:
+        p.error("no XFDL files given")
+    if options.bench_path:
+        bench_path(options.bench_path, arguments, options.repeat)
+    elif options.bench:
+        bench(arguments, options.repeat)
@@ -0,0 +1,294 @@
+#!/usr/bin/env python
+
+"""Per-report isolation for batch runs.
+
+With --isolate a batch checks every report in a worker process instead of on
+its own threads, so a malformed or hostile form can only take its own report
+down.  Each check worker thread of the pipeline owns one worker process, which
+loads the ruleset once and then decodes, parses and checks one report at a
+time.  A report is given up on, and recorded as an error, when
+
+    it takes longer than --timeout seconds (the worker is killed and replaced)
+    the worker runs out of --memory-limit megabytes of address space, or dies
+    its payload expands more than --max-ratio times (a gzip bomb; prinput.py)
+
+while the other workers carry on, so the batch keeps its throughput.  The
+finished report comes back as an isolated_report carrying the report text,
+findings and totals prreport and prsinks need, and its output is replayed
+into the batch's sink.
+
+A worker that ran out of memory is replaced after sending its report back,
+since its heap stays grown and the next report would fail the same way.
+
+On Unix each worker leads a process group of its own, so a worker given up
+on is killed together with the regex guard processes it started (prlint.py).
+
+The memory limit needs the resource module (Unix); elsewhere only the timeout
+and ratio cap apply.
+
+Usage: prbatch.py --isolate [--timeout SECONDS] [--memory-limit MB] file ...
+"""
+
+import os
+import time
+import signal
+import multiprocessing
+
+import prcheck
+import prinput
+import prrules
+import prsinks
+import prstats
+
+DEFAULT_TIMEOUT = 120.0
+DEFAULT_MEMORY_LIMIT = 2048  # megabytes of address space per worker
+
+# How often a waiting check looks in on its worker process
+POLL_INTERVAL = 0.5
+
+
+class worker_failure(Exception):
+    pass
+
+
+class isolated_form:
+    def __init__(self, name):
+        self.name = name
+
+
+class isolated_report:
+    def __init__(self, pr, status, error, output, narratives):
+        # What is left of a pr_object once its report is checked; stands in
+        # for it wherever prreport and prsinks want the pr_object
+        self.pr_filename = pr.pr_filename
+        self.serial_number = getattr(pr, "serial_number", "")
+        self.form = isolated_form(getattr(getattr(pr, "form", None), "name", ""))
+        self.pr_version_text = getattr(pr, "pr_version_text", "")
+        self.findings = pr.findings
+        self.warnings = getattr(pr, "warnings", 0)
+        self.fails = getattr(pr, "fails", 0)
+        self.status = status
+        self.error = error
+        self.output = output  # prsinks.recording_sink
+        self.narratives = narratives  # [(sid, rule, value)]
+        self.stats = pr.stats  # prstats.report_stats, if asked for
+        self.out_of_memory = False
+
+
+def limit_memory(megabytes):
+    # Cap the address space of this process; False where that is not possible
+    try:
+        import resource
+    except ImportError:
+        return False
+    limit = megabytes * 1024 * 1024
+    soft, hard = resource.getrlimit(resource.RLIMIT_AS)
+    if hard != resource.RLIM_INFINITY:
+        limit = min(limit, hard)
+    resource.setrlimit(resource.RLIMIT_AS, (limit, hard))
+    return True
+
+
+def check_report(filename, rules, options, narratives=False, stats=False):
+    # Worker process side: the whole check of one report, as the batch
+    # pipeline's decode, parse and check stages would do it
+    output = prsinks.recording_sink()
+    pr = prcheck.pr_object(filename, rules, options, output, run=False)
+    if stats:
+        pr.stats = prstats.report_stats()
+    status = "ok"
+    error = None
+    found = []
+    out_of_memory = False
+    try:
+        if not pr.check_header(filename):
+            status = "rejected"
+            error = pr.error
+        else:
+            doc = prinput.parse_document(
+                filename, options.max_ratio, options.max_size << 20
+            )
+            pr.set_document(doc)
+            pr.load_rules()
+            on_form = pr.extract()
+            doc.unlink()
+            pr.doc = pr.globalpage = pr.pages = None
+            pr.run_checks(on_form)
+            if narratives:
+                found = list(pr.engine.narratives(on_form))
+    except MemoryError:
+        status = "error"
+        error = "MemoryError: out of memory"
+        out_of_memory = True
+    except Exception as e:
+        status = "error"
+        error = "%s: %s" % (e.__class__.__name__, e)
+    result = isolated_report(pr, status, error, output, found)
+    result.out_of_memory = out_of_memory
+    return result
+
+
+def worker_main(
+    connection, settings_filename, options, memory_limit, narratives, stats, reload
+):
+    # Worker process loop: check every file name received until told to stop.
+    # reload > 0 picks up a changed ruleset between reports.
+    if os.name == "nt":
+        import pythoncom
+
+        pythoncom.CoInitialize()
+    if hasattr(os, "setpgrp"):
+        # A process group of its own, which the regex guard's processes join
+        os.setpgrp()
+    if memory_limit:
+        limit_memory(memory_limit)
+    manager = prrules.ruleset_manager(settings_filename, [options.lexicon], reload)
+    manager.start()
+    # Ready: the timeout of the first report starts now
+    connection.send(True)
+    while True:
+        try:
+            filename = connection.recv()
+        except EOFError:
+            # The batch has gone away
+            break
+        if filename is None:
+            break
+        try:
+            rules = manager.acquire()
+            try:
+                result = check_report(filename, rules, options, narratives, stats)
+            finally:
+                manager.release(rules)
+        except MemoryError:
+            result = None
+        connection.send(result)
+        if result is not None and result.out_of_memory:
+            # Memory freed by the report is not given back; start over
+            break
+    manager.close()
+    connection.close()
+
+
+def kill_group(pid):
+    # Kill what is left of the process group a worker process leads (Unix)
+    if not hasattr(os, "killpg"):
+        return
+    try:
+        os.killpg(pid, signal.SIGKILL)
+    except OSError:
+        # The group is gone already
+        pass
+
+
+class report_worker:
+    def __init__(
+        self,
+        settings_filename,
+        options,
+        timeout=DEFAULT_TIMEOUT,
+        memory_limit=DEFAULT_MEMORY_LIMIT,
+        narratives=False,
+        stats=False,
+        reload=0,
+    ):
+        # One worker process, started on first use and replaced whenever a
+        # report kills it or runs out of time.  narratives also returns the
+        # free text fields of each report (for prdupes.py), stats its
+        # prstats.report_stats.  reload is passed to the worker's
+        # prrules.ruleset_manager.
+        self.settings_filename = settings_filename
+        self.options = options
+        self.timeout = timeout
+        self.memory_limit = memory_limit
+        self.narratives = narratives
+        self.stats = stats
+        self.reload = reload
+        self.process = None
+        self.connection = None
+        self.restarts = 0
+
+    def start(self):
+        # Start the worker process and wait until it has loaded the ruleset
+        self.connection, child = multiprocessing.Pipe()
+        self.process = multiprocessing.Process(
+            target=worker_main,
+            args=(
+                child,
+                self.settings_filename,
+                self.options,
+                self.memory_limit,
+                self.narratives,
+                self.stats,
+                self.reload,
+            ),
+        )
+        # Not a daemon: the regex guard (prlint.py) starts processes of its own
+        self.process.start()
+        child.close()
+        try:
+            self.connection.recv()
+        except EOFError:
+            self.restart("Worker process could not start")
+
+    def stop(self):
+        # Kill the worker process and whatever it started
+        if self.process.is_alive():
+            self.process.terminate()
+        kill_group(self.process.pid)
+        self.process.join()
+        self.connection.close()
+        self.process = self.connection = None
+
+    def restart(self, message):
+        # Give up on the worker process; the next check starts a new one
+        self.stop()
+        self.restarts += 1
+        raise worker_failure(message)
+
+    def check(self, filename):
+        # The isolated_report of filename.  Raises worker_failure when the
+        # worker process runs out of time or memory.
+        if self.process is None:
+            self.start()
+        self.connection.send(filename)
+        deadline = None
+        if self.timeout:
+            deadline = time.time() + self.timeout
+        while True:
+            wait = POLL_INTERVAL
+            if deadline is not None:
+                wait = min(wait, deadline - time.time())
+                if wait <= 0:
+                    self.restart("Timed out after %g s" % self.timeout)
+            if self.connection.poll(wait):
+                try:
+                    result = self.connection.recv()
+                except (EOFError, IOError):
+                    result = None
+                break
+            if not self.process.is_alive():
+                result = None
+                break
+        if result is None:
+            exitcode = self.process.exitcode
+            if exitcode:
+                self.restart(
+                    "Worker process died (exit code %s); memory limit %d MB"
+                    % (exitcode, self.memory_limit)
+                )
+            self.restart("Out of memory (limit %d MB)" % self.memory_limit)
+        if result.out_of_memory:
+            # The worker process has quit; the next check starts a new one
+            self.stop()
+            self.restarts += 1
+        return result
+
+    def close(self):
+        if self.process is not None:
+            try:
+                self.connection.send(None)
+            except (IOError, OSError):
+                pass
+            self.process.join(self.timeout or None)
+            self.stop()
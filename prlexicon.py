@@ -0,0 +1,216 @@
+#!/usr/bin/env python
+
+"""Acronym and abbreviation lexicon for the PR Checker.
+
+The lexicon is every acronym and abbreviation a PR may use without spelling
+it out, compiled once per ruleset into a hashed index (a dict of token =>
+meaning).  Entries come from an Acronyms sheet in the ruleset (acronym in the
+first column, meaning in the second) and from a text lexicon, by default
+PR Acronyms.txt next to the ruleset:
+
+    # comment
+    USAF    United States Air Force
+    e.g.
+
+Tokens matching a pattern of the Overlook sheet (UAV(s?), AMRAAM) are known
+as well, as they are to the spell check.
+
+scan walks a line once and picks out every all-caps or dotted token (AFSOC,
+NCOs, U.S.) and every lexicon entry.  An acronym defined in parentheses right
+after its words, "Airman Leadership School (ALS)", is accepted for the rest of
+that field.  Lines that are mostly capitals (name blocks, unit names) are not
+screened, but their lexicon entries still count as known.
+
+The spell checker leaves the known and defined tokens to the lexicon, so
+they never reach the spell backend.  Unknown tokens are spell checked like
+any other word, and are only reported as unknown acronyms when there is no
+spell checker to ask.
+
+Usage: prlexicon.py [--lexicon FILE] ruleset "some text" ...
+"""
+
+import os
+import re
+import hashlib
+
+from prspell import split_words, word_starts, overlook_pattern, overlooked
+
+DEFAULT_LEXICON = "PR Acronyms.txt"
+LEXICON_SHEET = "Acronyms"
+OVERLOOK_SHEET = "Overlook"
+
+# Punctuation stripped from the ends of a word before it is looked up
+TOKEN_STRIP = "()[]{}\"',;:!?"
+ACRONYM_RE = re.compile(r"[A-Z][A-Z0-9&]*[A-Z0-9]$")
+DOTTED_RE = re.compile(r"(?:[A-Za-z]\.){2,}$")
+DEFINITION_RE = re.compile(r"\([^()]+\)[.,;:!?]*$")
+PLURAL_ENDINGS = ("'s", "s")
+
+
+def mostly_capitals(line):
+    # True for name blocks and unit lines such as "JOHN A. DOE, Capt, USAF"
+    upper = 0
+    lower = 0
+    for c in line:
+        if c.isupper():
+            upper += 1
+        elif c.islower():
+            lower += 1
+    return upper > lower
+
+
+class lexicon:
+    def __init__(self, source=""):
+        self.source = source
+        self.index = {}  # token => meaning
+        self.overlook_res = []
+
+    def __len__(self):
+        return len(self.index)
+
+    def add(self, token, meaning=""):
+        token = token.strip()
+        if token:
+            self.index[token] = meaning.strip()
+
+    def load_rows(self, rows):
+        # Rows of an Acronyms sheet: acronym, meaning
+        for cells in rows:
+            if cells and cells[0]:
+                meaning = ""
+                if len(cells) > 1:
+                    meaning = cells[1]
+                self.add(cells[0], meaning)
+
+    def load_text(self, filename):
+        # One entry per line, the meaning after the first tab or run of spaces
+        f = open(filename)
+        try:
+            for line in f:
+                line = line.strip()
+                if not line or line.startswith("#"):
+                    continue
+                parts = line.split(None, 1)
+                if len(parts) == 1:
+                    parts.append("")
+                self.add(parts[0], parts[1])
+        finally:
+            f.close()
+
+    def load_overlook(self, cells):
+        # Patterns of the Overlook sheet; tokens they match are known
+        for cell in cells:
+            self.overlook_res.append(re.compile(overlook_pattern(cell)))
+
+    def fingerprint(self):
+        # Identifies the entries, for the incremental cache
+        digest = hashlib.sha1()
+        for token in sorted(self.index):
+            digest.update(("%s\t%s\n" % (token, self.index[token])).encode("utf-8"))
+        return digest.hexdigest()
+
+    def singular(self, token):
+        # NCOs and SNCO's => NCO and SNCO
+        for ending in PLURAL_ENDINGS:
+            if token.endswith(ending) and len(token) > len(ending):
+                return token[: -len(ending)]
+        return token
+
+    def lookup(self, token):
+        # Return the meaning of a token, also for plurals, or None
+        try:
+            return self.index[token]
+        except KeyError:
+            return self.index.get(self.singular(token))
+
+    def known(self, token):
+        # True for lexicon entries and tokens the Overlook sheet lets pass
+        return self.lookup(token) is not None or overlooked(self.overlook_res, token)
+
+    def normalize(self, word):
+        # Return the token a word stands for, or None if it is not acronym-like
+        token = word.strip(TOKEN_STRIP)
+        if DOTTED_RE.match(token):
+            return token
+        token = token.rstrip(".")
+        if token in self.index:
+            return token
+        if ACRONYM_RE.match(token) or ACRONYM_RE.match(self.singular(token)):
+            return token
+        return None
+
+    def scan(self, line, defined=None):
+        # Return (word, token, status, start) for every acronym-like word of a
+        # line, start being its offset in the line; status is "known",
+        # "defined" or "unknown".  defined is a set of acronyms spelled out
+        # earlier in the field and is updated in place.
+        if defined is None:
+            defined = set()
+        screen = not mostly_capitals(line)
+        results = []
+        words = split_words(line)
+        for word, start in zip(words, word_starts(line, words)):
+            token = self.normalize(word)
+            if token is None:
+                continue
+            if self.known(token):
+                status = "known"
+            elif not screen:
+                continue
+            elif DEFINITION_RE.match(word):
+                defined.add(token)
+                defined.add(self.singular(token))
+                status = "defined"
+            elif token in defined or self.singular(token) in defined:
+                status = "defined"
+            else:
+                status = "unknown"
+            results.append((word, token, status, start))
+        return results
+
+    def covered(self, line):
+        # Words of a line the lexicon answers for, kept from the spell
+        # checker; unknown tokens are left to it
+        return set(
+            [
+                word
+                for word, token, status, start in self.scan(line)
+                if status != "unknown"
+            ]
+        )
+
+
+def load_lexicon(rules, filename=None):
+    # Build the lexicon for a ruleset: its Acronyms sheet plus a text lexicon
+    # (filename, or PR Acronyms.txt beside the ruleset if there is one), and
+    # the patterns of its Overlook sheet
+    words = lexicon(filename or rules.source)
+    words.load_rows(rules.rows(LEXICON_SHEET))
+    words.load_overlook(rules.cell_list(OVERLOOK_SHEET))
+    if filename is None:
+        default = os.path.join(
+            os.path.dirname(os.path.abspath(rules.source)), DEFAULT_LEXICON
+        )
+        if os.path.isfile(default):
+            filename = default
+    if filename is not None:
+        words.load_text(filename)
+    return words
+
+
+if __name__ == "__main__":
+    import optparse
+    import prrules
+
+    p = optparse.OptionParser(usage='%prog [--lexicon FILE] ruleset "text" ...')
+    p.add_option("--lexicon")
+    options, arguments = p.parse_args()
+    if not arguments:
+        p.error("no ruleset given")
+    words = load_lexicon(prrules.load_ruleset(arguments[0]), options.lexicon)
+    print("%d entries" % len(words))
+    for text in arguments[1:]:
+        defined = set()
+        for line in text.splitlines():
+            for word, token, status, start in words.scan(line, defined):
+                print("%-12s %-8s %s" % (token, status, words.lookup(token) or ""))
@@ -0,0 +1,494 @@
+#!/usr/bin/env python
+
+"""Regex safety checks for the PR Checker rule sheets.
+
+The Fields, Checks, Popups, Catch and Overlook sheets hold regexes written by
+rule editors and run against free text.  Python's re module backtracks, so a
+pattern such as ^(([A-Z]+),?\\s?)+$ can take seconds or hours on a line it
+almost matches.  This module
+
+  - parses every pattern and flags constructs that can backtrack
+    catastrophically: a repeat inside a repeat (risky), alternation inside
+    a repeat and back to back repeats (warnings), and patterns that do not
+    compile (errors)
+  - times each pattern on adversarial inputs built from its own characters
+    and, optionally, on the field values of real PRs
+  - guards the checks at run time: risky patterns and those with warnings
+    are matched in a worker process (one per concurrent match) with a time
+    budget per match (--regex-budget), so one bad pattern costs one failed
+    check instead of a stalled report or batch worker.  Overlook patterns
+    are only ever matched against a single word, so they run unguarded.
+
+Usage: prlint.py [options] "PR Structure.ods"
+
+    --budget SECONDS    time allowed per pattern and input (default 1)
+    --corpus FILE       also time the patterns on the fields of an .xfdl file
+                        (may be repeated)
+"""
+
+import re
+import sys
+import time
+import threading
+import multiprocessing
+
+from prspell import overlook_pattern
+
+try:
+    import re._parser as sre_parse
+except ImportError:
+    import sre_parse
+
+RULE_SHEET_SUFFIXES = ("Fields", "Checks", "Popups")
+TEXT_SHEETS = ("Catch", "Overlook")
+
+# Sheets whose patterns only see one word at a time and are not guarded
+UNGUARDED_SHEETS = ("Overlook",)
+
+# Regex cells that are keywords of the check sheets, not patterns
+NOT_PATTERNS = ("None", "REGEX", "DEFAULT")
+
+ERROR, RISKY, WARNING = "error", "risky", "warning"
+
+# Adversarial inputs repeat a pattern's characters this many times, then
+# add a character it is unlikely to accept
+PUMP_LENGTH = 24
+PUMP_ENDINGS = ("!", "\n!")
+
+# Compiled patterns of the worker process
+SANDBOX_PATTERNS = {}
+
+
+class regex_timeout(Exception):
+    pass
+
+
+# ****************************ANALYSIS*******************************
+
+
+def op_name(op):
+    # sre opcodes are strings on Python 2 and named constants on Python 3
+    return str(op).lower()
+
+
+def is_unbounded(av):
+    return av[1] == sre_parse.MAXREPEAT or av[1] > 1000
+
+
+def has_unbounded_repeat(items):
+    for op, av in items:
+        name = op_name(op)
+        if name in ("max_repeat", "min_repeat"):
+            if is_unbounded(av) or has_unbounded_repeat(av[2]):
+                return True
+        else:
+            for child in children(name, av):
+                if has_unbounded_repeat(child):
+                    return True
+    return False
+
+
+def children(name, av):
+    # Sub-sequences of one sre item
+    if name == "subpattern":
+        return [av[-1]]
+    if name == "branch":
+        return av[1]
+    if name in ("assert", "assert_not", "atomic_group"):
+        return [av[-1]]
+    if name == "groupref_exists":
+        return [p for p in av[1:] if p is not None]
+    if name in ("max_repeat", "min_repeat", "possessive_repeat"):
+        return [av[2]]
+    return []
+
+
+def analyze(pattern):
+    # Return a list of (level, message) for one pattern
+    try:
+        parsed = sre_parse.parse(pattern)
+    except (re.error, OverflowError, RuntimeError) as e:
+        return [(ERROR, "does not compile: %s" % e)]
+    issues = []
+    walk(list(parsed), False, issues)
+    return issues
+
+
+def walk(items, in_repeat, issues):
+    # Look for dangerous shapes in a sequence of sre items
+    previous_unbounded = False
+    for op, av in items:
+        name = op_name(op)
+        if name in ("max_repeat", "min_repeat"):
+            unbounded = is_unbounded(av)
+            if unbounded and has_unbounded_repeat(av[2]):
+                issue = (RISKY, "nested quantifier, e.g. (x+)+")
+                if issue not in issues:
+                    issues.append(issue)
+            if unbounded and previous_unbounded:
+                issue = (WARNING, "back to back quantifiers, e.g. x*x*")
+                if issue not in issues:
+                    issues.append(issue)
+            if unbounded:
+                previous_unbounded = True
+            elif av[0] > 0:
+                previous_unbounded = False
+            walk(av[2], in_repeat or unbounded, issues)
+            continue
+        if name == "branch" and in_repeat:
+            issue = (WARNING, "alternation inside a quantifier, e.g. (a|ab)+")
+            if issue not in issues:
+                issues.append(issue)
+        if name != "at":
+            previous_unbounded = False
+        for child in children(name, av):
+            walk(child, in_repeat, issues)
+
+
+def sample_characters(items, found):
+    # One representative character for every literal and set in a pattern
+    for op, av in items:
+        name = op_name(op)
+        if name == "literal":
+            found.append(chr(av) if av < 128 else "a")
+        elif name == "any":
+            found.append("a")
+        elif name == "in":
+            for set_op, set_av in av:
+                set_name = op_name(set_op)
+                if set_name == "literal":
+                    found.append(chr(set_av) if set_av < 128 else "a")
+                    break
+                if set_name == "range":
+                    found.append(chr(set_av[0]) if set_av[0] < 128 else "a")
+                    break
+                if set_name == "category":
+                    category = op_name(set_av)
+                    if "digit" in category:
+                        found.append("0")
+                    elif "space" in category:
+                        found.append(" ")
+                    else:
+                        found.append("a")
+                    break
+        else:
+            for child in children(name, av):
+                sample_characters(child, found)
+    return found
+
+
+def adversarial_inputs(pattern):
+    # Strings that make a backtracking pattern try every way to split them
+    try:
+        parsed = sre_parse.parse(pattern)
+    except (re.error, OverflowError, RuntimeError):
+        return []
+    items = list(parsed)
+    # Literal text a pattern starts with (e.g. ^\n) leads every input
+    prefix_items = []
+    for op, av in items:
+        if op_name(op) not in ("at", "literal", "in", "any"):
+            break
+        prefix_items.append((op, av))
+    prefix = "".join(sample_characters(prefix_items, []))
+    characters = []
+    for c in sample_characters(items, []):
+        if c not in characters:
+            characters.append(c)
+    pumps = [c * PUMP_LENGTH for c in characters]
+    for first, second in zip(characters, characters[1:]):
+        pumps.append((first + second) * (PUMP_LENGTH // 2))
+    if characters:
+        pumps.append("".join(characters) * (PUMP_LENGTH // len(characters) + 1))
+    return [prefix + pump + ending for pump in pumps for ending in PUMP_ENDINGS]
+
+
+def rule_patterns(rules, sheet_names=None):
+    # Yield (sheet, row number, label, pattern, method) for every pattern
+    # in a ruleset, or in the named sheets of it; pattern and method are how
+    # the checks apply it
+    if sheet_names is None:
+        sheet_names = rules.sheet_names
+    for sheet_name in sheet_names:
+        if sheet_name.endswith(RULE_SHEET_SUFFIXES):
+            for row_number, cells in enumerate(rules.rows(sheet_name)):
+                if len(cells) > 3 and cells[3] and cells[3] not in NOT_PATTERNS:
+                    yield sheet_name, row_number + 1, cells[0], cells[3], "match"
+        elif sheet_name in TEXT_SHEETS:
+            method = "search"
+            if sheet_name == "Overlook":
+                method = "match"
+            for row_number, cells in enumerate(rules.rows(sheet_name)):
+                for cell in cells:
+                    if cell:
+                        if sheet_name == "Overlook":
+                            cell = overlook_pattern(cell)
+                        yield sheet_name, row_number + 1, "", cell, method
+
+
+def guarded_patterns(rules, sheet_names=None):
+    # Patterns of a ruleset (or of the named sheets) that the checks should
+    # run under the guard: the risky ones and those with warnings
+    guarded = set()
+    for sheet_name, row_number, label, pattern, method in rule_patterns(
+        rules, sheet_names
+    ):
+        if sheet_name in UNGUARDED_SHEETS:
+            continue
+        for level, message in analyze(pattern):
+            if level in (RISKY, WARNING):
+                guarded.add(pattern)
+    return guarded
+
+
+# *****************************GUARD*********************************
+
+
+def sandbox_run(pattern, method, text):
+    # Worker process side of regex_guard: the (start, end) of the match, or None
+    try:
+        compiled = SANDBOX_PATTERNS[pattern]
+    except KeyError:
+        compiled = SANDBOX_PATTERNS[pattern] = re.compile(pattern)
+    match = getattr(compiled, method)(text)
+    if match is None:
+        return None
+    return match.span()
+
+
+def sandbox_time(pattern, method, texts):
+    # Worker process side of timed_run: seconds to apply pattern to texts
+    compiled = re.compile(pattern)
+    apply = getattr(compiled, method)
+    start = time.time()
+    for text in texts:
+        apply(text)
+    return time.time() - start
+
+
+class regex_guard:
+    def __init__(self, guarded, budget=1.0):
+        # guarded is the set of patterns to run in a worker process with at
+        # most budget seconds per match; a budget of 0 runs everything inline
+        self.guarded = guarded
+        self.budget = budget
+        self.compiled = {}
+        # Workers owned by the guard and lent to one match at a time, so
+        # guarded matches of different fields run side by side.  A worker
+        # goes back to idle after each match, whichever thread asked for it,
+        # so there are never more than the most matches that ran at once.
+        self.idle = []
+        self.pools = []
+        self.lock = threading.Lock()
+        self.timeouts = 0
+
+    def span(self, pattern, method, text):
+        # (start, end) of pattern.<method>(text) in text, or None.  Raises
+        # regex_timeout when a guarded pattern runs out of time.
+        if not self.budget or pattern not in self.guarded:
+            try:
+                compiled = self.compiled[pattern]
+            except KeyError:
+                compiled = self.compiled[pattern] = re.compile(pattern)
+            match = getattr(compiled, method)(text)
+            if match is None:
+                return None
+            return match.span()
+
+        pool = self.borrow()
+        result = pool.apply_async(sandbox_run, (pattern, method, text))
+        try:
+            span = result.get(self.budget)
+        except multiprocessing.TimeoutError:
+            # The worker is stuck in the pattern; replace it
+            self.lock.acquire()
+            try:
+                if pool in self.pools:
+                    self.pools.remove(pool)
+                self.timeouts += 1
+            finally:
+                self.lock.release()
+            pool.terminate()
+            print("Pattern ran out of time (%g s): %s" % (self.budget, pattern))
+            raise regex_timeout(pattern)
+        except:
+            self.give_back(pool)
+            raise
+        self.give_back(pool)
+        return span
+
+    def borrow(self):
+        # An idle worker, or a new one when every worker is busy
+        self.lock.acquire()
+        try:
+            if self.idle:
+                return self.idle.pop()
+            pool = multiprocessing.Pool(1)
+            self.pools.append(pool)
+            return pool
+        finally:
+            self.lock.release()
+
+    def give_back(self, pool):
+        # A worker closed meanwhile is not reused
+        self.lock.acquire()
+        try:
+            if pool in self.pools:
+                self.idle.append(pool)
+        finally:
+            self.lock.release()
+
+    def close(self):
+        # Stop every worker; a match afterwards starts a new one
+        self.lock.acquire()
+        try:
+            pools = self.pools
+            self.pools = []
+            self.idle = []
+        finally:
+            self.lock.release()
+        for pool in pools:
+            pool.terminate()
+
+
+class pattern_timer:
+    def __init__(self, budget=1.0):
+        # Times patterns in a worker process, replaced whenever one overruns
+        self.budget = budget
+        self.pool = None
+
+    def time(self, pattern, method, texts):
+        # Seconds taken to apply pattern to every text, or None if it took
+        # longer than the budget
+        if not texts:
+            return 0.0
+        if self.pool is None:
+            self.pool = multiprocessing.Pool(1)
+        result = self.pool.apply_async(sandbox_time, (pattern, method, texts))
+        try:
+            return result.get(self.budget)
+        except multiprocessing.TimeoutError:
+            self.close()
+            return None
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.terminate()
+            self.pool = None
+
+
+# *****************************LINTER********************************
+
+
+def corpus_values(filenames):
+    # Every field value of the given .xfdl files
+    import prinput
+
+    values = []
+    for filename in filenames:
+        doc = prinput.parse_document(filename)
+        for tag in ("field", "check", "popup"):
+            for element in doc.getElementsByTagName(tag):
+                for value in element.getElementsByTagName("value"):
+                    text = "".join(
+                        [
+                            node.nodeValue
+                            for node in value.childNodes
+                            if node.nodeType == node.TEXT_NODE
+                        ]
+                    )
+                    if text:
+                        values.append(text)
+        doc.unlink()
+    return values
+
+
+def lint(rules, budget=1.0, corpus=None):
+    # Return one (sheet, row, label, pattern, issues, adversarial seconds,
+    # corpus seconds) per unique pattern; a time is None if it ran out of
+    # budget
+    report = []
+    seen = set()
+    timer = pattern_timer(budget)
+    try:
+        for entry in rule_patterns(rules):
+            if (entry[3], entry[4]) in seen:
+                continue
+            seen.add((entry[3], entry[4]))
+            report.append(lint_pattern(timer, corpus, *entry))
+    finally:
+        timer.close()
+    return report
+
+
+def lint_pattern(timer, corpus, sheet_name, row_number, label, pattern, method):
+    issues = analyze(pattern)
+    adversarial = corpus_time = 0.0
+    if not [level for level, message in issues if level == ERROR]:
+        adversarial = timer.time(pattern, method, adversarial_inputs(pattern))
+        if corpus:
+            corpus_time = timer.time(pattern, method, corpus)
+    return (sheet_name, row_number, label, pattern, issues, adversarial, corpus_time)
+
+
+def format_time(seconds):
+    if seconds is None:
+        return "TIMEOUT"
+    return "%.1f" % (seconds * 1000)
+
+
+if __name__ == "__main__":
+    import optparse
+    import prrules
+
+    p = optparse.OptionParser(usage='%prog [options] "PR Structure.ods"')
+    p.add_option("--budget", type="float", default=1.0)
+    p.add_option("--corpus", action="append", default=[])
+    p.add_option("--all", action="store_true", help="also list clean patterns")
+    options, arguments = p.parse_args()
+    if len(arguments) != 1:
+        p.error("give one ruleset")
+
+    rules = prrules.load_ruleset(arguments[0])
+    corpus = corpus_values(options.corpus)
+    failed = 0
+    print(
+        "%-12s %4s %-8s %9s %11s  %s"
+        % ("Sheet", "Row", "Level", "Adv (ms)", "Corpus (ms)", "Pattern")
+    )
+    for (
+        sheet_name,
+        row_number,
+        label,
+        pattern,
+        issues,
+        adversarial,
+        corpus_time,
+    ) in lint(rules, options.budget, corpus):
+        levels = [level for level, message in issues]
+        if adversarial is None or corpus_time is None:
+            levels.insert(0, ERROR)
+        level = ""
+        for name in (ERROR, RISKY, WARNING):
+            if name in levels:
+                level = name
+                break
+        if not level and not options.all:
+            continue
+        if level in (ERROR, RISKY):
+            failed += 1
+        print(
+            "%-12s %4d %-8s %9s %11s  %s"
+            % (
+                sheet_name[:12],
+                row_number,
+                level or "ok",
+                format_time(adversarial),
+                format_time(corpus_time),
+                pattern,
+            )
+        )
+        for issue_level, message in issues:
+            print("%27s %s" % ("", message))
+    print("%d pattern(s) need attention" % failed)
+    sys.exit(failed and 1 or 0)
@@ -0,0 +1,248 @@
+#!/usr/bin/env python
+
+"""Record types for the PR Checker.
+
+rule_row     one row of a Fields, Checks or Popups sheet
+form_field   one value extracted from the form, with its label and the offset
+             of every line
+finding      one result of a check, formatted into report text only when written
+
+A finding on a field carries its span, the (start, end) character offsets of
+what it is about in the field's value (a word, a pattern match, a line, or the
+whole value), so a viewer can mark it in place without splitting the text
+again.  Lines are numbered from 1 and cut as value.splitlines() cuts them.
+
+All three use __slots__ so a report's rules, values and findings stay small
+enough to keep in memory across a batch.  Field sids are interned, so the
+many dictionaries keyed by sid share one string per field.  Groups,
+categories and severities are small integer constants.
+"""
+
+import sys
+
+try:
+    intern_text = sys.intern
+except AttributeError:
+    intern_text = intern
+
+# Element groups
+FIELD, CHECK, POPUP = range(3)
+GROUP_NAMES = ("field", "check", "popup")
+GROUP_IDS = {"field": FIELD, "check": CHECK, "popup": POPUP}
+
+# Finding categories
+VERSION, SPELL, CATCH, REGEX, ACRONYM = range(5)
+CATEGORY_NAMES = ("version", "spell", "catch", "regex", "acronym")
+
+# Finding severities; only WARNING and FAIL are counted in the totals
+OK, NOTE, WARNING, FAIL = range(4)
+SEVERITY_NAMES = ("ok", "note", "warning", "fail")
+
+
+def split_lines(text):
+    # (start offset, line) for every line of text.splitlines()
+    lines = []
+    position = 0
+    for ended, line in zip(text.splitlines(True), text.splitlines()):
+        lines.append((position, line))
+        position += len(ended)
+    return lines
+
+
+def intern_sid(sid):
+    # Share one string object per field sid
+    try:
+        return intern_text(str(sid))
+    except (TypeError, UnicodeError):
+        return sid
+
+
+class rule_row(object):
+    __slots__ = ("sid", "group", "label", "notes", "regex", "page", "spell_flag")
+
+    def __init__(self, sid, group, label, notes, regex, page, spell_flag):
+        self.sid = intern_sid(sid)
+        self.group = group
+        self.label = label
+        self.notes = notes
+        self.regex = regex
+        self.page = page
+        self.spell_flag = spell_flag
+
+    @property
+    def spell(self):
+        # True if the SPELL CHECK column is Y
+        return self.spell_flag == "Y"
+
+    @property
+    def has_regex(self):
+        return self.regex != "None"
+
+    @property
+    def narrative(self):
+        # True for free text: spell-checked with no REGEX the value must
+        # match (names and duty titles have one)
+        return self.spell and not self.has_regex
+
+    def as_tuple(self):
+        # The sheet row as pr_object has always stored it
+        return (self.label, self.notes, self.regex, str(self.page), self.spell_flag)
+
+    def __repr__(self):
+        return repr(self.as_tuple())
+
+
+class form_field(object):
+    __slots__ = ("sid", "group", "page", "value", "label", "line_starts")
+
+    def __init__(self, sid, group, page, value, label=""):
+        self.sid = intern_sid(sid)
+        self.group = group
+        self.page = page
+        self.value = value
+        self.label = label
+        self.line_starts = [start for start, line in split_lines(value)]
+
+    def lines(self):
+        # (line number, start offset, line) for every line of the value
+        lines = []
+        number = 1
+        for start, line in zip(self.line_starts, self.value.splitlines()):
+            lines.append((number, start, line))
+            number += 1
+        return lines
+
+    def as_dict(self):
+        # JSON-ready fields, with the group by name
+        return {
+            "sid": self.sid,
+            "group": GROUP_NAMES[self.group],
+            "page": self.page,
+            "label": self.label,
+            "text": self.value,
+            "line_starts": self.line_starts,
+        }
+
+
+class finding(object):
+    __slots__ = (
+        "category",
+        "severity",
+        "sid",
+        "page",
+        "label",
+        "line",
+        "text",
+        "extra",
+        "span",
+    )
+
+    def __init__(
+        self,
+        category,
+        severity,
+        sid=None,
+        page=0,
+        label="",
+        line=0,
+        text="",
+        extra=None,
+        span=None,
+    ):
+        # text is the offending (or checked) text; extra holds the spelling
+        # suggestions, the expected version, or "overlook" for a spelling
+        # that matched the Overlook sheet; span is (start, end) in the value
+        # of field sid, or None
+        self.category = category
+        self.severity = severity
+        self.sid = sid
+        self.page = page
+        self.label = label
+        self.line = line
+        self.text = text
+        self.extra = extra
+        self.span = span
+
+    def __getstate__(self):
+        return tuple([getattr(self, name) for name in self.__slots__])
+
+    def __setstate__(self, state):
+        self.span = None
+        for name, value in zip(self.__slots__, state):
+            setattr(self, name, value)
+
+    def as_dict(self):
+        # JSON-ready fields, with category and severity by name
+        return {
+            "category": CATEGORY_NAMES[self.category],
+            "severity": SEVERITY_NAMES[self.severity],
+            "sid": self.sid,
+            "page": self.page,
+            "label": self.label,
+            "line": self.line,
+            "text": self.text,
+            "extra": self.extra,
+            "span": self.span and list(self.span),
+        }
+
+    def format(self):
+        # Report text for this finding, exactly as the checks have always written it
+        category = self.category
+        severity = self.severity
+        if category == VERSION:
+            if severity == OK:
+                return "Version Check => [OK]\n\n"
+            return (
+                "Version Check => [FAIL]\nCorrect PR Version: %s\n"
+                "This PR Version: %s\n\n" % (self.extra, self.text)
+            )
+        if category == SPELL:
+            if severity == NOTE:
+                return "\n%s line %d:\n" % (self.label, self.line)
+            if severity == OK:
+                if self.extra == "overlook":
+                    return "!%s! -> matches overlook list.\n" % self.text
+                return "!%s! OK!\n" % self.text
+            suggestions = "".join([suggest + " " for suggest in self.extra or ()])
+            return "[WARNING] ?%s? -> %s\n" % (self.text, suggestions)
+        if category == CATCH:
+            if severity == OK:
+                return "Catch Common => %s [OK]\n" % self.text
+            if self.extra == "timeout":
+                return (
+                    "\n%s, Line %d:\n[WARNING] Catch pattern ran out of time => %s\n\n"
+                    % (
+                        self.label,
+                        self.line,
+                        self.text,
+                    )
+                )
+            return "\n%s, Line %d:\n[WARNING] Likely error => %s\n\n" % (
+                self.label,
+                self.line,
+                self.text,
+            )
+        if category == ACRONYM:
+            if severity == OK:
+                return "Acronym Check => %s [OK]\n" % self.text
+            return "\n%s, Line %d:\n[WARNING] Unknown acronym => %s\n\n" % (
+                self.label,
+                self.line,
+                self.text,
+            )
+        if category == REGEX:
+            if severity == OK:
+                return "%s => [OK]\nField: %s Text: %s\n\n" % (
+                    self.label,
+                    self.sid,
+                    self.text,
+                )
+            text = "%s => [FAIL]\nField: %s Text: %s\n" % (
+                self.label,
+                self.sid,
+                self.text.encode("unicode_escape").decode("ascii"),
+            )
+            if self.extra == "timeout":
+                text += "Pattern ran out of time.  Contact your administrator.\n"
+            return text + "\n"
+        return self.text
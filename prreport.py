@@ -0,0 +1,265 @@
+#!/usr/bin/env python
+
+"""Consolidated batch reports for the PR Checker.
+
+batch_report collects every report of a batch into one document instead of a
+PDF per PR:
+
+    <name>.pdf    summary and table of contents, then every report, each
+                  starting on a new page (<name>.txt with --text)
+    <name>.csv    one row per report: status, warnings, fails and page count
+    <name>.jsonl  one JSON object per warning or failed check
+
+Reports are appended to a temporary body file as they finish and the CSV and
+JSONL rows are written straight away, so memory use does not grow with the
+batch.  Page numbers are counted the way pyText2PDF lays out text, which lets
+the table of contents be written ahead of the body when the batch is done.
+
+Usage: prbatch.py --report NAME file-or-directory ...
+"""
+
+import os
+import sys
+import io
+import csv
+import json
+import time
+import shutil
+import threading
+
+import prinput
+import prrecords
+
+PYTEXT2PDF_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "pyText2PDF")
+
+# pyText2PDF's default page: 60 lines of 80 characters, tabs every 4
+PAGE_LINES = 60
+PAGE_COLUMNS = 80
+TAB_WIDTH = 4
+FORM_FEED = "\f"
+
+CSV_HEADER = [
+    "file",
+    "serial number",
+    "form",
+    "version",
+    "status",
+    "warnings",
+    "fails",
+    "pages",
+    "error",
+]
+TOC_FORMAT = "%-44s %-8s %5s %5s %5s"
+
+# replace_file on Python 2 under Windows
+REPLACE_ATTEMPTS = 10
+REPLACE_RETRY_DELAY = 0.05
+
+
+def text2pdf(pdf_filename, form_feeds=False):
+    # A pyText2PDF converter writing pdf_filename.  With form_feeds a form
+    # feed character starts a new page.
+    if PYTEXT2PDF_DIR not in sys.path:
+        sys.path.append(PYTEXT2PDF_DIR)
+    import pyText2PDF
+
+    pdf = pyText2PDF.pyText2Pdf()
+    pdf._ofile = pdf_filename
+    if form_feeds:
+        pdf._doFFs = 1
+    return pdf
+
+
+def render_pdf(text_filename, pdf_filename, form_feeds=False):
+    # Convert a text report to PDF with pyText2PDF, in process
+    pdf = text2pdf(pdf_filename, form_feeds)
+    pdf._ifile = text_filename
+    pdf.Convert()
+
+
+def render_pdf_text(text, pdf_filename, form_feeds=False, title=""):
+    # Like render_pdf, for report text held in memory.  As in a report file,
+    # characters outside ISO-8859-1 are laid out as "?".
+    if isinstance(text, bytes):
+        text = text.decode(prinput.XFDL_ENCODING)
+    text = text.encode(prinput.XFDL_ENCODING, "replace").decode(prinput.XFDL_ENCODING)
+    pdf = text2pdf(pdf_filename, form_feeds)
+    pdf._ifile = title
+    pdf._ifs = io.StringIO(text)
+    pdf.Convert()
+
+
+def replace_file(temp_filename, filename):
+    # Move a finished temporary file into place, replacing filename, so
+    # nobody opens a half written file
+    replace = getattr(os, "replace", None)
+    if replace is not None:
+        replace(temp_filename, filename)
+        return
+    if os.name != "nt":
+        # rename replaces atomically on POSIX
+        os.rename(temp_filename, filename)
+        return
+    # Python 2 on Windows cannot rename over a file: remove it first, and try
+    # again if another writer puts one back in between
+    for attempt in range(REPLACE_ATTEMPTS):
+        try:
+            os.remove(filename)
+        except OSError:
+            pass
+        try:
+            os.rename(temp_filename, filename)
+            return
+        except OSError:
+            if attempt == REPLACE_ATTEMPTS - 1:
+                raise
+            time.sleep(REPLACE_RETRY_DELAY)
+
+
+def page_count(text):
+    # Pages pyText2PDF needs for text: long lines wrap at PAGE_COLUMNS and a
+    # line of exactly PAGE_COLUMNS characters is followed by an empty one
+    rows = 0
+    for line in text.split("\n"):
+        rows += len(line.expandtabs(TAB_WIDTH)) // PAGE_COLUMNS + 1
+    return max(1, (rows + PAGE_LINES - 1) // PAGE_LINES)
+
+
+class batch_report:
+    def __init__(self, name, text_only=False):
+        # name is the output path without an extension
+        self.name = name
+        self.text_only = text_only
+        self.body_filename = "%s.body.tmp" % name
+        self.toc_filename = "%s.toc.tmp" % name
+        self.body = prinput.open_report(self.body_filename)
+        self.toc = prinput.open_report(self.toc_filename)
+        self.csv_file = prinput.open_csv("%s.csv" % name, "w")
+        self.csv = csv.writer(self.csv_file, lineterminator="\n")
+        self.csv.writerow(CSV_HEADER)
+        self.jsonl = open("%s.jsonl" % name, "w")
+        self.lock = threading.Lock()
+        self.pages = 0  # pages of the body written so far
+        self.reports = 0
+        self.totals = {"ok": 0, "rejected": 0, "error": 0}
+        self.warnings = 0
+        self.fails = 0
+        self.report_filename = None
+
+    def add(self, filename, text, status, error=None, pr=None):
+        # Append one finished report; pr is its pr_object, if it got that far
+        serial_number = getattr(pr, "serial_number", "")
+        form = getattr(getattr(pr, "form", None), "name", "")
+        version = getattr(pr, "pr_version_text", "")
+        findings = getattr(pr, "findings", [])
+        warnings = getattr(pr, "warnings", 0)
+        fails = getattr(pr, "fails", 0)
+
+        self.lock.acquire()
+        try:
+            if self.reports:
+                self.body.write(FORM_FEED)
+            start_page = self.pages + 1
+            pages = page_count(text)
+            self.body.write(text)
+            self.pages += pages
+            self.reports += 1
+            self.totals[status] += 1
+            self.warnings += warnings
+            self.fails += fails
+
+            name = os.path.basename(filename)
+            self.toc.write(
+                "%s\t%s\t%d\t%d\t%d\n" % (name, status, warnings, fails, start_page)
+            )
+            self.csv.writerow(
+                [
+                    filename,
+                    serial_number,
+                    form,
+                    version,
+                    status,
+                    warnings,
+                    fails,
+                    pages,
+                    error or "",
+                ]
+            )
+            for finding in findings:
+                if finding.severity < prrecords.WARNING:
+                    continue
+                record = finding.as_dict()
+                record["file"] = filename
+                record["serial_number"] = serial_number
+                record["form"] = form
+                self.jsonl.write(json.dumps(record, sort_keys=True))
+                self.jsonl.write("\n")
+            self.csv_file.flush()
+            self.jsonl.flush()
+        finally:
+            self.lock.release()
+
+    def summary_lines(self):
+        # Totals and table of contents header
+        return [
+            "=====PR Checker Batch Report=====",
+            "",
+            "%d report(s): %d checked, %d rejected, %d failed"
+            % (
+                self.reports,
+                self.totals["ok"],
+                self.totals["rejected"],
+                self.totals["error"],
+            ),
+            "%d warning(s), %d failed field(s)" % (self.warnings, self.fails),
+            "",
+            TOC_FORMAT % ("Report", "Status", "Warn", "Fail", "Page"),
+            "",
+        ]
+
+    def close(self):
+        # Write the table of contents and the body into the final document
+        # and return its file name
+        self.body.close()
+        self.toc.close()
+        self.csv_file.close()
+        self.jsonl.close()
+
+        summary = self.summary_lines()
+        # Every table of contents line fits on one row
+        toc_pages = page_count("\n".join(summary) + "\n" * (self.reports + 1))
+        text_filename = "%s.txt" % self.name
+        out = prinput.open_report(text_filename)
+        try:
+            for line in summary:
+                out.write(line + "\n")
+            toc = prinput.open_report(self.toc_filename, "r")
+            try:
+                for entry in toc:
+                    name, status, warnings, fails, page = entry.rstrip("\n").split("\t")
+                    if len(name) > 44:
+                        name = "..." + name[-41:]
+                    page = str(int(page) + toc_pages)
+                    out.write(TOC_FORMAT % (name, status, warnings, fails, page))
+                    out.write("\n")
+            finally:
+                toc.close()
+            body = prinput.open_report(self.body_filename, "r")
+            try:
+                if self.reports:
+                    out.write(FORM_FEED)
+                shutil.copyfileobj(body, out)
+            finally:
+                body.close()
+        finally:
+            out.close()
+        os.remove(self.toc_filename)
+        os.remove(self.body_filename)
+
+        if self.text_only:
+            self.report_filename = text_filename
+        else:
+            self.report_filename = "%s.pdf" % self.name
+            render_pdf(text_filename, self.report_filename, True)
+            os.remove(text_filename)
+        return self.report_filename
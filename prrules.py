@@ -0,0 +1,599 @@
+#!/usr/bin/env python
+
+"""Ruleset loading for the PR Checker.
+
+The check rules ship as PR Structure.ods.  A ruleset can also be stored as a
+directory of CSV files (one per sheet, friendly to diff and review) or as a
+precompiled binary file for production, which loads fastest.  All three
+backends produce the same ruleset: every sheet as a list of rows of cell text,
+exactly as pr_object has always read them, from which get_cells and the other
+lookup tables are built.
+
+A report needs only a few of the sheets (an OPR never touches the EPR sheets),
+so the ODS and CSV backends load a sheet only when it is first asked for.  The
+ODS backend indexes the byte range of every table in content.xml once and
+parses just the sheets in use.  Indexing still unzips and scans the whole of
+content.xml (about a millisecond); the rest of a cold load is parsing the
+sheets a form needs, of which Overlook is the largest.  The binary backend
+loads everything at once, which is already faster than parsing one sheet.
+
+A long running process (prwatch.py, or prbatch.py --reload) keeps its rules in
+a ruleset_manager, which looks at the workbook, its precompiled copy and any
+other files the rules depend on (the --lexicon) every few seconds.  Once a
+changed file has stayed unchanged for one more look, a new ruleset is loaded
+and fully parsed on the manager's thread and then swapped in whole: a report
+takes the current ruleset when it starts, so reports already being checked
+finish on the old rules, the next ones get the new rules, and checking never
+waits for a reload.  The old ruleset is closed (its spell checker and regex
+guard workers stopped) when the last report using it is done.  A workbook
+that fails to load leaves the old rules in place.
+
+Usage: prrules.py [options] "PR Structure.ods"
+
+    --csv DIR       export the workbook to a directory of CSV files
+    --binary FILE   export the workbook to a precompiled binary ruleset
+    --bench         time loading the workbook with every backend
+    --sheet NAME    with --bench, load only the named sheets (repeatable)
+"""
+
+import os
+import re
+import sys
+import csv
+import time
+import collections
+import marshal
+import threading
+import hashlib
+import zipfile
+from xml.sax.saxutils import unescape
+
+try:
+    import xml.etree.cElementTree as ElementTree
+except ImportError:
+    import xml.etree.ElementTree as ElementTree
+
+import prinput
+import prrecords
+
+OD_TABLE_NS = "urn:oasis:names:tc:opendocument:xmlns:table:1.0"
+TABLE_ROW = "{%s}table-row" % OD_TABLE_NS
+TABLE_CELL = "{%s}table-cell" % OD_TABLE_NS
+
+ROOT_TAG_RE = re.compile(br"<([\w.-]+:)?document-content\b([^>]*)>")
+XMLNS_RE = re.compile(br'xmlns(?::([\w.-]+))?="([^"]*)"')
+ATTRIBUTE_ENTITIES = {"&quot;": '"', "&apos;": "'"}
+
+# Seconds between looks at the ruleset files of a ruleset_manager
+DEFAULT_RELOAD_INTERVAL = 5.0
+
+CSV_INDEX = "sheets.csv"
+BINARY_MAGIC = b"PRRULES1"
+BINARY_EXTENSION = ".prrules"
+
+
+class ruleset_error(Exception):
+    pass
+
+
+def native_text(text):
+    # Cell text as a native str: ASCII bytes on Python 2, as the rules have
+    # always been read (unicode if ASCII cannot hold it), text on Python 3
+    if isinstance(text, str):
+        return text
+    try:
+        return text.encode("ascii")
+    except UnicodeError:
+        return text
+
+
+class ruleset:
+    def __init__(self, sheets, source="", reader=None):
+        # sheets is a list of (sheet name, rows); each row is a list of cell
+        # text.  rows is None for a sheet not loaded yet, which reader (with
+        # a read_sheets(names) method) loads on first use.
+        self.source = source
+        self.sheet_names = [name for name, rows in sheets]
+        self.sheets = dict(sheets)
+        self.reader = reader
+        self.sheet_lock = threading.Lock()
+        self.derived = {}
+        self.derived_lock = threading.RLock()
+
+    def rows(self, sheet_name):
+        # Rows of one sheet, or an empty list if the workbook lacks it
+        rows = self.sheets.get(sheet_name, [])
+        if rows is None:
+            self.load_sheets([sheet_name])
+            rows = self.sheets[sheet_name]
+        return rows
+
+    def load_sheets(self, sheet_names):
+        # Load the named sheets that are not loaded yet, all at once
+        self.sheet_lock.acquire()
+        try:
+            wanted = []
+            for name in sheet_names:
+                if name not in wanted and self.sheets.get(name, []) is None:
+                    wanted.append(name)
+            if wanted:
+                for name, rows in zip(wanted, self.reader.read_sheets(wanted)):
+                    self.sheets[name] = rows
+        finally:
+            self.sheet_lock.release()
+
+    def get_cells(self, sheet_name):
+        # Pull the fields out of a sheet and put in dictionaries, one per page.
+        dict_p1 = {}
+        dict_p2 = {}
+
+        for cells in self.rows(sheet_name):
+            try:
+                if cells[4] == "1":
+                    dict_p1[cells[1]] = (
+                        cells[0],
+                        cells[2],
+                        cells[3],
+                        cells[4],
+                        cells[5],
+                    )
+                elif cells[4] == "2":
+                    dict_p2[cells[1]] = (
+                        cells[0],
+                        cells[2],
+                        cells[3],
+                        cells[4],
+                        cells[5],
+                    )
+            except IndexError:
+                pass
+
+        return dict_p1, dict_p2
+
+    def get_pages(self, sheet_name, group=None):
+        # Like get_cells, but returns one dictionary of prrecords.rule_row per
+        # page, for any page count, each in sheet order
+        pages = []
+        for cells in self.rows(sheet_name):
+            try:
+                page = cells[4]
+                row = prrecords.rule_row(
+                    cells[1], group, cells[0], cells[2], cells[3], 0, cells[5]
+                )
+            except IndexError:
+                continue
+            if not page.isdigit() or int(page) < 1:
+                continue
+            row.page = int(page)
+            while len(pages) < row.page:
+                pages.append(collections.OrderedDict())
+            pages[row.page - 1][row.sid] = row
+        return pages
+
+    def memo(self, key, build):
+        # Cache a table derived from this ruleset for as long as it is in use.
+        # Batch workers share a ruleset, so each table is built only once.
+        self.derived_lock.acquire()
+        try:
+            try:
+                return self.derived[key]
+            except KeyError:
+                value = self.derived[key] = build(self)
+                return value
+        finally:
+            self.derived_lock.release()
+
+    def close(self):
+        # Close every derived table holding workers (the spell checker's
+        # Word instances, the regex guard's process); for a ruleset no
+        # report uses any more
+        self.derived_lock.acquire()
+        try:
+            derived = list(self.derived.values())
+            self.derived = {}
+        finally:
+            self.derived_lock.release()
+        for value in derived:
+            close = getattr(value, "close", None)
+            if close is not None:
+                close()
+
+    def senior_rater_dict(self):
+        # SRID => (name, signature block) from the Senior Rater Info sheet
+        SR_dict = collections.OrderedDict()
+        for cells in self.rows("Senior Rater Info"):
+            SR_dict[cells[1]] = (cells[0], cells[2])
+        return SR_dict
+
+    def version_dict(self):
+        # PR type => current form version from the PR Version sheet
+        ver_dict = collections.OrderedDict()
+        for cells in self.rows("PR Version"):
+            ver_dict[cells[0]] = cells[1]
+        return ver_dict
+
+    def cell_list(self, sheet_name):
+        # Every non-empty cell of a sheet, row by row (Overlook and Catch sheets)
+        cell_list = []
+        for cells in self.rows(sheet_name):
+            for cell in cells:
+                if cell:
+                    cell_list.append(cell)
+        return cell_list
+
+    def fingerprint(self):
+        # Digest of the rule content, independent of the storage format
+        self.load_sheets(self.sheet_names)
+        digest = hashlib.sha1()
+        for name in self.sheet_names:
+            digest.update(repr((name, self.sheets[name])).encode("utf-8"))
+        return digest.hexdigest()
+
+
+# ***************************LOADERS*********************************
+
+
+class ods_loader:
+    # OpenDocument spreadsheet, read the same way pr_object always has, one
+    # sheet at a time as the ruleset asks for it
+    def load(self, filename):
+        zip_data = zipfile.ZipFile(filename)
+        try:
+            content = zip_data.read("content.xml")
+        finally:
+            zip_data.close()
+        reader = ods_sheets(content)
+        return ruleset([(name, None) for name in reader.names()], filename, reader)
+
+
+class ods_sheets:
+    def __init__(self, content):
+        # content.xml, indexed by the byte range of every top-level table
+        self.content = content
+        root = ROOT_TAG_RE.search(content)
+        if root is None:
+            raise ruleset_error("content.xml has no document-content element")
+        # The namespace declarations a sheet needs to parse on its own
+        self.declarations = b" ".join(
+            [match.group(0) for match in XMLNS_RE.finditer(root.group(2))]
+        )
+        prefix = None
+        for match in XMLNS_RE.finditer(root.group(2)):
+            if match.group(2) == OD_TABLE_NS.encode("ascii"):
+                prefix = match.group(1)
+        if prefix is None:
+            raise ruleset_error("content.xml does not declare the table namespace")
+        self.table_re = re.compile(br"<(/?)%s:table([\s/>])" % re.escape(prefix))
+        self.name_re = re.compile(br'\s%s:name="([^"]*)"' % re.escape(prefix))
+        self.index = collections.OrderedDict()  # sheet name => (start, end)
+        self.build_index(root.end())
+
+    def build_index(self, position):
+        # One pass over the tags of the document, counting table depth
+        depth = 0
+        start = None
+        for match in self.table_re.finditer(self.content, position):
+            tag_end = self.content.index(b">", match.start()) + 1
+            if match.group(1):
+                depth -= 1
+                if depth == 0:
+                    self.add_sheet(start, tag_end)
+            elif self.content[tag_end - 2 : tag_end] == b"/>":
+                if depth == 0:
+                    self.add_sheet(match.start(), tag_end)
+            else:
+                if depth == 0:
+                    start = match.start()
+                depth += 1
+
+    def add_sheet(self, start, end):
+        tag_end = self.content.index(b">", start)
+        match = self.name_re.search(self.content, start, tag_end)
+        name = ""
+        if match is not None:
+            name = unescape(match.group(1).decode("utf-8"), ATTRIBUTE_ENTITIES)
+        self.index[native_text(name)] = (start, end)
+
+    def names(self):
+        return list(self.index)
+
+    def read_sheet(self, name):
+        # Parse one sheet's table element, wrapped in the namespace
+        # declarations of the document
+        start, end = self.index[name]
+        document = b"".join(
+            [
+                b"<sheet ",
+                self.declarations,
+                b">",
+                self.content[start:end],
+                b"</sheet>",
+            ]
+        )
+        table = ElementTree.fromstring(document)
+        rows = []
+        for row in table.iter(TABLE_ROW):
+            rows.append(
+                [native_text("".join(cell.itertext())) for cell in row.iter(TABLE_CELL)]
+            )
+        return rows
+
+    def read_sheets(self, names):
+        return [self.read_sheet(name) for name in names]
+
+
+class csv_loader:
+    # Directory holding sheets.csv (sheet order) and one <sheet name>.csv per sheet
+    def load(self, dirname):
+        index_file = os.path.join(dirname, CSV_INDEX)
+        if not os.path.exists(index_file):
+            raise ruleset_error("%s has no %s" % (dirname, CSV_INDEX))
+        self.dirname = dirname
+        sheets = [(index_row[0], None) for index_row in self.read_csv(index_file)]
+        return ruleset(sheets, dirname, self)
+
+    def read_sheets(self, names):
+        return [
+            self.read_csv(os.path.join(self.dirname, "%s.csv" % name)) for name in names
+        ]
+
+    def read_csv(self, filename):
+        f = prinput.open_csv(filename)
+        try:
+            return [row for row in csv.reader(f)]
+        finally:
+            f.close()
+
+    def save(self, rules, dirname):
+        if not os.path.isdir(dirname):
+            os.makedirs(dirname)
+        self.write_csv(
+            os.path.join(dirname, CSV_INDEX), [[name] for name in rules.sheet_names]
+        )
+        for name in rules.sheet_names:
+            self.write_csv(os.path.join(dirname, "%s.csv" % name), rules.rows(name))
+
+    def write_csv(self, filename, rows):
+        f = prinput.open_csv(filename, "w")
+        try:
+            writer = csv.writer(f, lineterminator="\n")
+            writer.writerows(rows)
+        finally:
+            f.close()
+
+
+class binary_loader:
+    # Magic, interpreter version, then the marshalled sheet list.  marshal is
+    # only portable between identical interpreter versions, so the version is
+    # checked on load; re-export the workbook after upgrading Python.
+    def load(self, filename):
+        f = open(filename, "rb")
+        try:
+            data = f.read()
+        finally:
+            f.close()
+        header_len = len(BINARY_MAGIC) + 2
+        if data[: len(BINARY_MAGIC)] != BINARY_MAGIC:
+            raise ruleset_error("%s is not a binary ruleset" % filename)
+        if bytearray(data[len(BINARY_MAGIC) : header_len]) != bytearray(
+            sys.version_info[:2]
+        ):
+            raise ruleset_error(
+                "%s was built by another Python version; export it again" % filename
+            )
+        return ruleset(marshal.loads(data[header_len:]), filename)
+
+    def save(self, rules, filename):
+        sheets = [(name, rules.rows(name)) for name in rules.sheet_names]
+        f = open(filename, "wb")
+        try:
+            f.write(BINARY_MAGIC)
+            f.write(bytes(bytearray(sys.version_info[:2])))
+            f.write(marshal.dumps(sheets))
+        finally:
+            f.close()
+
+
+def get_loader(filename):
+    # Pick the backend from the file name
+    if os.path.isdir(filename):
+        return csv_loader()
+    if os.path.splitext(filename)[1].lower() == BINARY_EXTENSION:
+        return binary_loader()
+    return ods_loader()
+
+
+def load_ruleset(filename):
+    # Load a ruleset from an ODS workbook, CSV directory or binary ruleset
+    return get_loader(filename).load(filename)
+
+
+def find_ruleset(settings_filename):
+    # Prefer a precompiled ruleset next to the workbook if it is up to date
+    binary_filename = os.path.splitext(settings_filename)[0] + BINARY_EXTENSION
+    try:
+        if os.path.getmtime(binary_filename) >= os.path.getmtime(settings_filename):
+            return binary_filename
+    except OSError:
+        pass
+    return settings_filename
+
+
+class ruleset_manager:
+    def __init__(self, settings_filename, watch_files=(), interval=0):
+        # The current ruleset of settings_filename (or the precompiled ruleset
+        # beside it, see find_ruleset).  With interval > 0, start() reloads it
+        # whenever the workbook, its precompiled copy or one of watch_files
+        # changes.
+        self.settings_filename = settings_filename
+        self.filenames = [
+            settings_filename,
+            os.path.splitext(settings_filename)[0] + BINARY_EXTENSION,
+        ] + [filename for filename in watch_files if filename]
+        self.interval = interval
+        self.signature = self.file_signature()
+        self.pending = None
+        self.rules = load_ruleset(find_ruleset(settings_filename))
+        self.reloads = 0
+        self.error = None
+        self.thread = None
+        self.stopping = threading.Event()
+        self.users = {}  # ruleset => reports using it
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        # The ruleset to check the next report with; the report keeps it
+        # until it hands it back with release
+        self.lock.acquire()
+        try:
+            rules = self.rules
+            self.users[rules] = self.users.get(rules, 0) + 1
+            return rules
+        finally:
+            self.lock.release()
+
+    def release(self, rules):
+        # A report is done with rules; a replaced ruleset is closed when its
+        # last report is done
+        self.lock.acquire()
+        try:
+            count = self.users[rules] - 1
+            if count:
+                self.users[rules] = count
+                return
+            del self.users[rules]
+            retired = rules is not self.rules
+        finally:
+            self.lock.release()
+        if retired:
+            rules.close()
+
+    def file_signature(self):
+        # (size, mtime) of every file the rules are loaded from, None if absent
+        signature = []
+        for filename in self.filenames:
+            try:
+                stat = os.stat(filename)
+                signature.append((stat.st_size, stat.st_mtime))
+            except OSError:
+                signature.append(None)
+        return tuple(signature)
+
+    def poll(self):
+        # Reload if the files have changed and then not changed since the
+        # last poll (a workbook being saved is left alone).  Returns True if
+        # a new ruleset was swapped in.
+        signature = self.file_signature()
+        if signature == self.signature:
+            self.pending = None
+            return False
+        if signature != self.pending:
+            self.pending = signature
+            return False
+        self.pending = None
+        self.signature = signature
+        filename = find_ruleset(self.settings_filename)
+        start = time.time()
+        try:
+            rules = load_ruleset(filename)
+            rules.load_sheets(rules.sheet_names)
+        except Exception as e:
+            # Keep checking with the rules already loaded
+            self.error = "%s: %s" % (e.__class__.__name__, e)
+            print("Ruleset not reloaded from %s: %s" % (filename, self.error))
+            return False
+        # A report sees either the old or the new rules
+        self.lock.acquire()
+        try:
+            old = self.rules
+            self.rules = rules
+            idle = old not in self.users
+        finally:
+            self.lock.release()
+        if idle:
+            old.close()
+        self.reloads += 1
+        self.error = None
+        print(
+            "Ruleset reloaded from %s in %.1f ms"
+            % (filename, (time.time() - start) * 1000)
+        )
+        return True
+
+    def run(self):
+        while not self.stopping.wait(self.interval):
+            try:
+                self.poll()
+            except Exception as e:
+                print("Ruleset reload failed: %s" % e)
+
+    def start(self):
+        # Watch the files on a background thread, if reloading is asked for
+        if self.interval > 0 and self.thread is None:
+            self.thread = threading.Thread(target=self.run)
+            self.thread.daemon = True
+            self.thread.start()
+
+    def stop(self):
+        if self.thread is not None:
+            self.stopping.set()
+            self.thread.join()
+            self.thread = None
+
+    def close(self):
+        # Stop watching and close the current ruleset; for when every report
+        # is done
+        self.stop()
+        self.rules.close()
+
+
+# ***********************START MAIN PROGRAM*************************
+
+
+def bench(filenames, repeat=20, sheet_names=None):
+    # Time each backend loading the same rules: every sheet, or only the
+    # named ones
+    for filename in filenames:
+        loader = get_loader(filename)
+        start = time.time()
+        for i in range(repeat):
+            rules = loader.load(filename)
+            rules.load_sheets(sheet_names or rules.sheet_names)
+        elapsed = (time.time() - start) / repeat
+        print("%-40s %8.2f ms" % (filename, elapsed * 1000))
+
+
+if __name__ == "__main__":
+    import optparse
+
+    p = optparse.OptionParser(usage='%prog [options] "PR Structure.ods"')
+    p.add_option("--csv", dest="csv_dir", help="export to a directory of CSV files")
+    p.add_option("--binary", dest="binary_file", help="export to a binary ruleset")
+    p.add_option("--bench", action="store_true", help="time every backend")
+    p.add_option(
+        "--sheet",
+        action="append",
+        dest="sheets",
+        help="with --bench, load only this sheet (may be repeated)",
+    )
+    options, arguments = p.parse_args()
+    if len(arguments) != 1:
+        p.error("one ruleset file is required")
+
+    rules = load_ruleset(arguments[0])
+    written = [arguments[0]]
+    if options.csv_dir:
+        csv_loader().save(rules, options.csv_dir)
+        written.append(options.csv_dir)
+    if options.binary_file:
+        binary_loader().save(rules, options.binary_file)
+        written.append(options.binary_file)
+
+    # Every export must read back identically to the source
+    for filename in written[1:]:
+        if load_ruleset(filename).fingerprint() != rules.fingerprint():
+            print("%s does not match %s" % (filename, arguments[0]))
+            sys.exit(1)
+
+    if options.bench:
+        bench(written, sheet_names=options.sheets)
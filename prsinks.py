@@ -0,0 +1,202 @@
+#!/usr/bin/env python
+
+"""Output sinks for the PR Checker.
+
+pr_object writes a report to a sink as the check runs: the report text
+(header, messages, totals) as it is produced and every finding as soon as the
+page it belongs to is checked.  A sink only has to provide
+
+    write(text)                         report text
+    write_finding(pr, finding)          one prrecords.finding of the report pr
+    write_status(filename, status, error)
+                                        how the check of a file ended
+                                        (ok, rejected or error)
+    close()                             the report is complete
+
+and output_sink supplies defaults for all four.  The sinks are
+
+    pdf_sink      the report rendered to PDF when it is complete (the default)
+    text_sink     the report text, streamed to a file
+    memory_sink   the report text kept in memory (getvalue)
+    recording_sink
+                  every call kept, to be replayed into another sink later
+    stdout_sink   the report text on the console
+    jsonl_sink    one JSON object per warning or failed check and one per
+                  report; one sink can take every report of a batch
+
+File sinks write under a temporary name and move the file into place when
+closed.
+
+Usage: prcheck.py --sink pdf|text|jsonl|stdout [--sink-file FILE] file.xfdl
+"""
+
+import sys
+import json
+import threading
+
+try:
+    from StringIO import StringIO
+except ImportError:
+    from io import StringIO
+
+import prinput
+import prrecords
+import prreport
+
+SINK_NAMES = ("pdf", "text", "jsonl", "stdout")
+SINK_EXTENSIONS = {"pdf": ".pdf", "text": ".out", "jsonl": ".jsonl"}
+# Sinks read by programs, not people; no spelling suggestions are fetched
+MACHINE_SINKS = ("jsonl",)
+
+
+class output_sink:
+    # Report text goes nowhere; findings are written as report text
+    report_filename = None
+
+    def write(self, text):
+        pass
+
+    def write_finding(self, pr, finding):
+        self.write(finding.format())
+
+    def write_status(self, filename, status, error=None):
+        pass
+
+    def close(self):
+        pass
+
+
+class memory_sink(output_sink):
+    def __init__(self):
+        self.buffer = StringIO()
+
+    def write(self, text):
+        self.buffer.write(text)
+
+    def getvalue(self):
+        return self.buffer.getvalue()
+
+
+class recording_sink(output_sink):
+    def __init__(self):
+        # Keeps the report text and findings in the order they were written
+        self.events = []  # (text, finding)
+
+    def write(self, text):
+        self.events.append((text, None))
+
+    def write_finding(self, pr, finding):
+        self.events.append((None, finding))
+
+    def replay(self, sink, pr):
+        # Write everything recorded to sink, as the report of pr
+        for text, finding in self.events:
+            if finding is None:
+                sink.write(text)
+            else:
+                sink.write_finding(pr, finding)
+
+
+class text_sink(output_sink):
+    def __init__(self, filename):
+        self.filename = filename
+        self.temp_filename = "%s.tmp" % filename
+        self.stream = prinput.open_report(self.temp_filename)
+
+    def write(self, text):
+        self.stream.write(text)
+
+    def close(self):
+        if self.report_filename is None:
+            self.stream.close()
+            prreport.replace_file(self.temp_filename, self.filename)
+            self.report_filename = self.filename
+
+
+class pdf_sink(memory_sink):
+    def __init__(self, filename, form_feeds=False):
+        # The text is kept in memory and laid out when the report is complete
+        memory_sink.__init__(self)
+        self.filename = filename
+        self.form_feeds = form_feeds
+
+    def close(self):
+        if self.report_filename is None:
+            temp_filename = "%s.tmp" % self.filename
+            prreport.render_pdf_text(
+                self.getvalue(), temp_filename, self.form_feeds, self.filename
+            )
+            prreport.replace_file(temp_filename, self.filename)
+            self.report_filename = self.filename
+
+
+class stdout_sink(output_sink):
+    def __init__(self, stream=None):
+        # The real console by default, even when sys.stdout is a log file
+        if stream is None:
+            stream = sys.__stdout__
+        self.stream = stream
+
+    def write(self, text):
+        self.stream.write(text)
+
+    def close(self):
+        self.stream.flush()
+
+
+class jsonl_sink(output_sink):
+    def __init__(self, filename):
+        # Thread safe, so the check workers of a batch can share one sink
+        self.filename = filename
+        self.temp_filename = "%s.tmp" % filename
+        self.stream = open(self.temp_filename, "w")
+        self.lock = threading.Lock()
+        self.findings = 0
+        self.reports = 0
+
+    def write_line(self, record, is_finding):
+        line = json.dumps(record, sort_keys=True) + "\n"
+        self.lock.acquire()
+        try:
+            self.stream.write(line)
+            if is_finding:
+                self.findings += 1
+            else:
+                self.reports += 1
+        finally:
+            self.lock.release()
+
+    def write_finding(self, pr, finding):
+        # Warnings and failed checks only, as in a batch report's JSONL
+        if finding.severity < prrecords.WARNING:
+            return
+        record = finding.as_dict()
+        record["file"] = pr.pr_filename
+        record["serial_number"] = getattr(pr, "serial_number", "")
+        record["form"] = getattr(getattr(pr, "form", None), "name", "")
+        self.write_line(record, True)
+
+    def write_status(self, filename, status, error=None):
+        self.write_line({"file": filename, "status": status, "error": error}, False)
+
+    def close(self):
+        if self.report_filename is None:
+            self.stream.close()
+            prreport.replace_file(self.temp_filename, self.filename)
+            self.report_filename = self.filename
+
+
+def open_sink(name, pr_filename, filename=None, form_feeds=False):
+    # Sink name (see SINK_NAMES) for the report on pr_filename, written to
+    # filename or next to the PR
+    if name == "stdout":
+        return stdout_sink()
+    if name not in SINK_EXTENSIONS:
+        raise ValueError("Unknown output sink: %s" % name)
+    if filename is None:
+        filename = pr_filename + SINK_EXTENSIONS[name]
+    if name == "pdf":
+        return pdf_sink(filename, form_feeds)
+    if name == "text":
+        return text_sink(filename)
+    return jsonl_sink(filename)
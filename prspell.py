@@ -0,0 +1,324 @@
+#!/usr/bin/env python
+
+"""Spell checking for the PR Checker.
+
+The spell stage asks about one line at a time, but every answer comes from a
+table of word results filled in bulk.  Before the field checks run, the
+unique words of every field still to be checked are collected and only the
+words never seen before go to the spell backend, as one request split across
+a spell_pool of checker instances.  Each pool worker owns its backend (one
+Word instance per worker on Windows), so the slices are checked side by side.
+The scheduler is kept with the ruleset, so in a batch a word is checked once
+however many reports use it.
+
+Spelling suggestions are the most expensive lookup, so the checks only flag
+misspelled words.  Suggestions are fetched afterwards by suggest_findings,
+for the report's findings only, with an optional cap on suggestions per word
+and a time budget per report; detect-only screening (--detect-only, the
+jsonl sink and batch --report-only runs) skips them altogether.
+
+A backend is any object with
+
+    check(word)             True if the word is spelled correctly
+    suggest(word, limit)    list of at most limit (0: all) suggested spellings
+
+msword_backend drives Microsoft Word through COM; a local engine only needs
+the same two methods.
+"""
+
+import re
+import time
+import threading
+
+try:
+    import Queue as queue
+except ImportError:
+    import queue
+
+import prrecords
+
+try:
+    import win32com.client
+except:
+    pass
+
+# Queue marker telling a pool worker to exit
+STOP = None
+
+
+def overlook_pattern(cell):
+    # An Overlook sheet pattern the way the checks apply it: matched at the
+    # start of a word, ignoring case
+    return "(?i)" + cell
+
+
+def overlooked(overlook_res, word):
+    # True if one of the compiled Overlook patterns matches word
+    for overlook_word in overlook_res:
+        if overlook_word.match(word):
+            return True
+    return False
+
+
+def split_words(line):
+    # Words of a line, split the way the spell check always has
+    return line.replace("-", " ").replace("/", " ").split()
+
+
+def word_starts(line, words):
+    # Offset in line of each of words, all the words split_words(line) found
+    spaced = line.replace("-", " ").replace("/", " ")
+    starts = []
+    position = 0
+    for word in words:
+        position = spaced.find(word, position)
+        starts.append(position)
+        position += len(word)
+    return starts
+
+
+class msword_backend:
+    def __init__(self):
+        # COM objects belong to the thread that created them, so every pool
+        # worker dispatches its own Word instance
+        try:
+            import pythoncom
+
+            pythoncom.CoInitialize()
+        except ImportError:
+            pass
+        self.msword = win32com.client.Dispatch("Word.Application")
+        self.msword.Documents.Add()
+
+    def check(self, word):
+        return bool(self.msword.CheckSpelling(word))
+
+    def suggest(self, word, limit=0):
+        # Stop walking the COM collection once limit suggestions are read
+        suggestions = []
+        for suggest in self.msword.GetSpellingSuggestions(word):
+            suggestions.append(suggest.Name)
+            if limit and len(suggestions) >= limit:
+                break
+        return suggestions
+
+
+class spell_pool:
+    def __init__(self, backend_factory, size=1):
+        # Start size workers, each building its own backend with backend_factory()
+        self.size = max(1, size)
+        self.requests = queue.Queue()
+        self.threads = []
+        ready = queue.Queue()
+        for i in range(self.size):
+            thread = threading.Thread(
+                target=self.work,
+                args=(backend_factory, ready),
+                name="spell-%d" % (i + 1),
+            )
+            thread.daemon = True
+            thread.start()
+            self.threads.append(thread)
+        errors = [ready.get() for thread in self.threads]
+        errors = [error for error in errors if error is not None]
+        if errors:
+            self.close()
+            raise errors[0]
+
+    def work(self, backend_factory, ready):
+        try:
+            backend = backend_factory()
+        except Exception as e:
+            ready.put(e)
+            return
+        ready.put(None)
+        while True:
+            request = self.requests.get()
+            if request is STOP:
+                break
+            operation, words, args, reply = request
+            try:
+                method = getattr(backend, operation)
+                reply.put([(word, method(word, *args)) for word in words])
+            except Exception as e:
+                reply.put(e)
+
+    def map(self, operation, words, *args):
+        # Run backend.<operation>(word, *args) over words, split across the
+        # workers, and return {word: result}
+        slices = [words[i :: self.size] for i in range(self.size)]
+        slices = [words_slice for words_slice in slices if words_slice]
+        reply = queue.Queue()
+        for words_slice in slices:
+            self.requests.put((operation, words_slice, args, reply))
+        results = {}
+        error = None
+        for words_slice in slices:
+            answer = reply.get()
+            if isinstance(answer, Exception):
+                error = answer
+            else:
+                results.update(answer)
+        if error is not None:
+            raise error
+        return results
+
+    def close(self):
+        for thread in self.threads:
+            self.requests.put(STOP)
+        for thread in self.threads:
+            thread.join()
+
+
+class spell_scheduler:
+    def __init__(self, pool, overlook_list, lexicon=None):
+        # overlook_list holds the Overlook sheet patterns; words the
+        # prlexicon.lexicon answers for are never sent to the pool
+        self.pool = pool
+        self.lexicon = lexicon
+        self.overlook_res = []
+        for word in overlook_list:
+            self.overlook_res.append(re.compile(overlook_pattern(word)))
+        self.status = {}  # word => "ok", "overlook" or "misspelled"
+        self.suggestions = {}  # misspelled word => (limit, suggestions)
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.words_checked = 0
+        self.words_suggested = 0
+
+    def check_overlook(self, word):
+        return overlooked(self.overlook_res, word)
+
+    def prefetch(self, words):
+        # Check every word not seen before in one bulk request
+        self.lock.acquire()
+        try:
+            new_words = []
+            for word in words:
+                if word not in self.status:
+                    self.status[word] = None
+                    new_words.append(word)
+            if not new_words:
+                return
+            try:
+                results = self.pool.map("check", new_words)
+            except:
+                for word in new_words:
+                    del self.status[word]
+                raise
+            for word in new_words:
+                if results[word]:
+                    self.status[word] = "ok"
+                elif self.check_overlook(word):
+                    self.status[word] = "overlook"
+                else:
+                    self.status[word] = "misspelled"
+            self.requests += 1
+            self.words_checked += len(new_words)
+        finally:
+            self.lock.release()
+
+    def spell_words(self, line):
+        # Words of a line and the ones among them the lexicon knows
+        words = split_words(line)
+        covered = set()
+        if self.lexicon is not None:
+            covered = self.lexicon.covered(line)
+        return words, covered
+
+    def prefetch_text(self, values):
+        # Bulk check the words of several field values at once
+        words = []
+        for value in values:
+            for line in value.splitlines():
+                line_words, covered = self.spell_words(line)
+                words.extend([word for word in line_words if word not in covered])
+        self.prefetch(words)
+
+    def check_words(self, string):
+        # Return (word, status) for every word of a line; status is "ok",
+        # "overlook", "misspelled" or "acronym" (known to the lexicon)
+        words, covered = self.spell_words(string)
+        self.prefetch([word for word in words if word not in covered])
+        results = []
+        for word in words:
+            if word in covered:
+                results.append((word, "acronym"))
+                continue
+            status = self.status[word]
+            if status == "misspelled":
+                print("[WARNING] ?%s?" % word)
+            results.append((word, status))
+
+        return results
+
+    def suggest(self, words, limit=0, deadline=None):
+        # Return {word: suggestions} for words, at most limit (0: all) per
+        # word.  Words still unanswered when time.time() passes deadline map
+        # to None.
+        self.lock.acquire()
+        try:
+            found = {}
+            todo = []
+            for word in words:
+                try:
+                    cached_limit, suggestions = self.suggestions[word]
+                except KeyError:
+                    todo.append(word)
+                    continue
+                if cached_limit and (not limit or cached_limit < limit):
+                    todo.append(word)
+                elif limit:
+                    found[word] = suggestions[:limit]
+                else:
+                    found[word] = suggestions
+            # A few words per worker at a time, so the budget is checked often
+            step = self.pool.size * 4
+            for start in range(0, len(todo), step):
+                if deadline is not None and time.time() > deadline:
+                    for word in todo[start:]:
+                        found[word] = None
+                    break
+                answers = self.pool.map("suggest", todo[start : start + step], limit)
+                for word, suggestions in answers.items():
+                    self.suggestions[word] = (limit, suggestions)
+                    found[word] = suggestions
+                self.words_suggested += len(answers)
+            return found
+        finally:
+            self.lock.release()
+
+    def suggest_findings(
+        self, findings, limit=0, budget=0, detect_only=False, deadline=None
+    ):
+        # Fill in the suggestions of the misspelled words among findings
+        # (prrecords.finding), in report order, spending at most budget
+        # seconds (0: no budget) or stopping at time.time() deadline.
+        # detect_only leaves them all empty.
+        misspelled = [
+            f
+            for f in findings
+            if f.category == prrecords.SPELL and f.severity == prrecords.WARNING
+        ]
+        if detect_only:
+            for f in misspelled:
+                f.extra = None
+            return
+        if deadline is None and budget:
+            deadline = time.time() + budget
+        words = []
+        for f in misspelled:
+            if f.text not in words:
+                words.append(f.text)
+        suggestions = self.suggest(words, limit, deadline)
+        for f in misspelled:
+            f.extra = suggestions[f.text]
+            if f.extra is None:
+                print("[WARNING] ?%s? -> (suggestion budget spent)" % f.text)
+            else:
+                print("[WARNING] ?%s? ->" % f.text)
+                for suggest in f.extra:
+                    print(suggest)
+
+    def close(self):
+        self.pool.close()
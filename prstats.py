@@ -0,0 +1,215 @@
+#!/usr/bin/env python
+
+"""Corpus statistics for the PR Checker.
+
+With --stats FILE a batch counts, over every report it checks,
+
+    rules   every evaluation of a field stage (regex, spell, acronym, catch)
+            per form and field, and of every Catch pattern, with how often
+            it found something and the time it took
+    fields  warnings and failed checks per form and field
+    words   misspelled words and unknown acronyms
+
+and writes a ranked report to FILE: the rules that fire most, the rules that
+cost the most time, the rules that never fired (candidates for removal from
+PR Structure.ods) and the fields and words found most often.
+
+Each report is counted into its own report_stats, which the engine and the
+catch stage fill in only when a pr_object carries one, so an ordinary check
+pays nothing.  The counters are plain dicts of small lists, cheap to pickle,
+and merged into the batch's totals as each report finishes, in this process
+or sent back from an --isolate worker process.  Fields answered from the
+--incremental cache are not evaluated and so not timed.
+
+Usage: prbatch.py --stats FILE [options] file-or-directory ...
+"""
+
+import threading
+
+import prinput
+import prreport
+from prrecords import SPELL, ACRONYM, WARNING, FAIL
+
+# Rows per ranked table of the report
+DEFAULT_TOP = 25
+
+RULE_FORMAT = "%-8s %-10s %-44s %9s %7s %6s %10s %8s"
+FIELD_FORMAT = "%-10s %-56s %8s %6s"
+WORD_FORMAT = "%-8s %-40s %8s"
+
+
+class report_stats:
+    def __init__(self):
+        # rules: (kind, form, rule) => [evaluations, hits, seconds]
+        # fields: (form, sid, label) => [warnings, fails]
+        # words: (kind, word) => count
+        self.rules = {}
+        self.fields = {}
+        self.words = {}
+        self.reports = 0
+        self.lock = threading.Lock()
+
+    def __getstate__(self):
+        # Everything but the lock, to come back from a worker process
+        return (self.rules, self.fields, self.words, self.reports)
+
+    def __setstate__(self, state):
+        self.rules, self.fields, self.words, self.reports = state
+        self.lock = threading.Lock()
+
+    def record(self, kind, form, rule, hit, seconds):
+        # One evaluation of a rule; stages may call this from pool threads
+        key = (kind, form, rule)
+        self.lock.acquire()
+        try:
+            counts = self.rules.get(key)
+            if counts is None:
+                counts = self.rules[key] = [0, 0, 0.0]
+            counts[0] += 1
+            if hit:
+                counts[1] += 1
+            counts[2] += seconds
+        finally:
+            self.lock.release()
+
+    def add_report(self, pr):
+        # Count the findings of a checked report by field and word
+        form = getattr(getattr(pr, "form", None), "name", "")
+        self.lock.acquire()
+        try:
+            self.reports += 1
+            for finding in pr.findings:
+                if finding.severity < WARNING or finding.sid is None:
+                    continue
+                key = (form, finding.sid, finding.label or "")
+                counts = self.fields.get(key)
+                if counts is None:
+                    counts = self.fields[key] = [0, 0]
+                if finding.severity == FAIL:
+                    counts[1] += 1
+                else:
+                    counts[0] += 1
+                if finding.category in (SPELL, ACRONYM) and finding.text:
+                    kind = "spell"
+                    if finding.category == ACRONYM:
+                        kind = "acronym"
+                    key = (kind, finding.text)
+                    self.words[key] = self.words.get(key, 0) + 1
+        finally:
+            self.lock.release()
+
+    def merge(self, other):
+        # Add the counts of another report_stats (a report, or a worker's)
+        self.lock.acquire()
+        try:
+            for key, counts in other.rules.items():
+                mine = self.rules.get(key)
+                if mine is None:
+                    self.rules[key] = list(counts)
+                else:
+                    for i in range(3):
+                        mine[i] += counts[i]
+            for key, counts in other.fields.items():
+                mine = self.fields.get(key)
+                if mine is None:
+                    self.fields[key] = list(counts)
+                else:
+                    mine[0] += counts[0]
+                    mine[1] += counts[1]
+            for key, count in other.words.items():
+                self.words[key] = self.words.get(key, 0) + count
+            self.reports += other.reports
+        finally:
+            self.lock.release()
+
+    # *****************************REPORT******************************
+
+    def rule_lines(self, rows):
+        lines = [
+            RULE_FORMAT
+            % (
+                "Kind",
+                "Form",
+                "Rule",
+                "Evaluated",
+                "Hits",
+                "Rate",
+                "Total (ms)",
+                "us/eval",
+            )
+        ]
+        for (kind, form, rule), (evaluations, hits, seconds) in rows:
+            lines.append(
+                RULE_FORMAT
+                % (
+                    kind,
+                    form[:10],
+                    rule[:44],
+                    evaluations,
+                    hits,
+                    "%.0f%%" % (100.0 * hits / evaluations),
+                    "%.1f" % (seconds * 1000),
+                    "%.0f" % (seconds * 1e6 / evaluations),
+                )
+            )
+        return lines
+
+    def report(self, top=DEFAULT_TOP):
+        # The ranked report, as text
+        rules = [item for item in self.rules.items() if item[1][0]]
+        lines = [
+            "=====PR Checker Statistics=====",
+            "",
+            "%d report(s), %d rule(s) evaluated %d time(s) in %.2f s"
+            % (
+                self.reports,
+                len(rules),
+                sum([counts[0] for key, counts in rules]),
+                sum([counts[2] for key, counts in rules]),
+            ),
+            "",
+            "Rules that fire most",
+        ]
+        fired = [item for item in rules if item[1][1]]
+        fired.sort(key=lambda item: (-item[1][1], item[0]))
+        lines += self.rule_lines(fired[:top])
+
+        lines += ["", "Rules that cost most (optimize these first)"]
+        rules.sort(key=lambda item: (-item[1][2], item[0]))
+        lines += self.rule_lines(rules[:top])
+
+        dead = [item for item in rules if not item[1][1]]
+        lines += [
+            "",
+            "Rules that never fired (%d, costliest first; candidates for removal)"
+            % len(dead),
+        ]
+        lines += self.rule_lines(dead)
+
+        lines += ["", "Fields with most findings"]
+        lines.append(FIELD_FORMAT % ("Form", "Field", "Warnings", "Fails"))
+        fields = list(self.fields.items())
+        fields.sort(key=lambda item: (-(item[1][0] + item[1][1]), item[0]))
+        for (form, sid, label), (warnings, fails) in fields[:top]:
+            name = sid
+            if label:
+                name = "%s (%s)" % (sid, label)
+            lines.append(FIELD_FORMAT % (form[:10], name[:56], warnings, fails))
+
+        lines += ["", "Words found most"]
+        lines.append(WORD_FORMAT % ("Kind", "Word", "Count"))
+        words = list(self.words.items())
+        words.sort(key=lambda item: (-item[1], item[0]))
+        for (kind, word), count in words[:top]:
+            lines.append(WORD_FORMAT % (kind, word[:40], count))
+        return "\n".join(lines) + "\n"
+
+    def write(self, filename, top=DEFAULT_TOP):
+        # Write the ranked report to filename
+        temp_filename = "%s.tmp" % filename
+        f = prinput.open_report(temp_filename)
+        try:
+            f.write(self.report(top))
+        finally:
+            f.close()
+        prreport.replace_file(temp_filename, filename)
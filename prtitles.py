@@ -0,0 +1,224 @@
+#!/usr/bin/env python
+
+"""Duty title checking for the PR Checker.
+
+Duty titles used to be checked only by the regex in the Fields sheet, which
+accepts nothing but capitalized words, so real titles such as
+"Commander, 66 ERS" or "FLIGHT COMMANDER, 8 EFS" failed.  A duty title is
+now split into tokens and every token is classified with one dict lookup:
+
+    office      office symbols (CC, CV, DO, A3, ...)
+    unit        unit designators (FW, OG, RS, ...), also with the
+                expeditionary E prefix (ERS, EFS, EAMXS)
+    command     command designators (ACC, AFSOC, ...)
+    number      unit numbers and ordinals (66, 33d, 1st)
+    connector   lowercase joining words in a mixed-case title (and, of)
+    word        any other word, capitalized the way the field requires
+
+The title passes if every token does.  Whether the field wants a title in
+capitals ("FLIGHT COMMANDER") or capitalized words ("Flight Commander") is
+read from its Fields sheet regex, so the sheets need no change, and so is
+everything around the tokens: a regex such as ^\n(...)$ still requires its
+leading newline, and the commas and whitespace before, between and after the
+tokens must be ones the regex accepts between two plain words.  Only what a
+token may be is relaxed; double spaces, repeated commas, slashes or a
+trailing period still fail.  A "Duty Titles" sheet in the ruleset (kind,
+token) adds to the built-in index.
+"""
+
+import re
+
+TITLE_SHEET = "Duty Titles"
+TITLE_LABEL = "Duty Title"
+
+OFFICE_SYMBOLS = (
+    "CC CV CD CCE CCC CCF CCS CCX DO DOO DOT DOV DOK DS DP MX MXO CE IG JA "
+    "PA SE XP HO FM SC A1 A2 A3 A4 A5 A6 A7 A8 A9 A3O A3T A5X J1 J2 J3 J4 J5 "
+    "J6 J7 J8 OIC NCOIC"
+)
+UNIT_DESIGNATORS = (
+    "AF NAF HQ WG W FW AW ARW AMW BW SOW ABW OG MXG MSG MDG OSS GP SQ S FS RS "
+    "RQS AS ARS AMS AMXS MXS CMS EMS CES CS CONS FSS LRS SFS MDOS AMDS MDSS "
+    "OWS IS ACS BCS ATKS RQG RQW SOS SOG DET FLT AEW AEG"
+)
+COMMAND_DESIGNATORS = (
+    "ACC AETC AFGSC AFMC AFSOC AFSPC AMC PACAF USAFE AFRC ANG AFDW AFCENT "
+    "AFAFRICA AFSOUTH AFNORTH USAF DoD"
+)
+CONNECTORS = ("and", "of", "for", "the", "to")
+ORDINAL_SUFFIXES = ("st", "nd", "rd", "th", "d")
+EXPEDITIONARY_PREFIX = "E"
+
+# Tokens of a title, and the commas and whitespace between them
+TOKEN_RE = re.compile(r"[^\s,]+")
+
+# Probe values used to read the capitalization a Fields sheet regex wants
+CAPS_PROBE = "COMMANDER"
+TITLE_PROBE = "Commander"
+# Text a regex may want before the title
+LEADS = ("", "\n")
+
+
+def is_duty_title(rule):
+    # Duty title fields are the rows labelled "... Duty Title"
+    return rule.label.endswith(TITLE_LABEL)
+
+
+def is_number(token):
+    # 66, 33d, 1st, 2nd, 3rd, 4th
+    if token.isdigit():
+        return True
+    for suffix in ORDINAL_SUFFIXES:
+        if token.endswith(suffix) and token[: -len(suffix)].isdigit():
+            return True
+    return False
+
+
+class title_index:
+    def __init__(self):
+        self.index = {}  # token => kind
+        self.styles = {}  # Fields sheet regex => title_style
+        for kind, tokens in (
+            ("office", OFFICE_SYMBOLS),
+            ("unit", UNIT_DESIGNATORS),
+            ("command", COMMAND_DESIGNATORS),
+        ):
+            for token in tokens.split():
+                self.add(kind, token)
+
+    def add(self, kind, token):
+        token = token.strip()
+        if token:
+            self.index[token] = kind
+
+    def load_rows(self, rows):
+        # Rows of a Duty Titles sheet: kind, token
+        for cells in rows:
+            if len(cells) > 1 and cells[0] and cells[1]:
+                self.add(cells[0].strip().lower(), cells[1])
+
+    def tokens(self, title):
+        # Split a title into words at whitespace and commas; returns the
+        # words and the separators before, between and after them
+        tokens = []
+        gaps = []
+        end = 0
+        for match in TOKEN_RE.finditer(title):
+            gaps.append(title[end : match.start()])
+            tokens.append(match.group())
+            end = match.end()
+        gaps.append(title[end:])
+        return tokens, gaps
+
+    def classify(self, token):
+        # Return the kind of a token, or None for a plain word
+        try:
+            return self.index[token]
+        except KeyError:
+            pass
+        if is_number(token):
+            return "number"
+        if token.startswith(EXPEDITIONARY_PREFIX):
+            if self.index.get(token[len(EXPEDITIONARY_PREFIX) :]) == "unit":
+                return "unit"
+        return None
+
+    def style(self, regex):
+        # title_style of a field, as read from its regex; worked out once per
+        # regex
+        try:
+            return self.styles[regex]
+        except KeyError:
+            pass
+        result = title_style()
+        try:
+            result.pattern = re.compile(regex)
+        except re.error:
+            result.pattern = None
+        if result.pattern is not None:
+            result.empty_ok = result.pattern.match("") is not None
+            for lead in LEADS:
+                for style, probe in (("caps", CAPS_PROBE), ("title", TITLE_PROBE)):
+                    if result.case is None and result.pattern.match(lead + probe):
+                        result.case = style
+                        result.lead = lead
+                        result.probe = probe
+        self.styles[regex] = result
+        return result
+
+    def word_ok(self, token, style):
+        # Plain words: capitals in a capitals title, else capitalized
+        # words with lowercase connectors
+        if not token.isalpha():
+            return False
+        if style == "caps":
+            return token.isupper()
+        if token in CONNECTORS:
+            return True
+        return token[0].isupper() and (len(token) == 1 or token[1:].islower())
+
+    def check(self, title, style):
+        # True if every token of the title is acceptable and every separator
+        # is one the field's regex accepts
+        tokens, gaps = self.tokens(title)
+        if not tokens:
+            return False
+        for token in tokens:
+            if self.classify(token) is None and not self.word_ok(token, style.case):
+                return False
+        last = len(gaps) - 1
+        for position, gap in enumerate(gaps):
+            if not gap:
+                continue
+            before = after = style.probe
+            if position == 0:
+                before = ""
+            elif position == last:
+                after = ""
+            if not style.separator_ok(before, gap, after):
+                return False
+        return True
+
+    def check_field(self, value, regex):
+        # Return True or False for a duty title field, or None if its regex
+        # is not a duty title pattern (the caller falls back to the regex)
+        style = self.style(regex)
+        if style.case is None:
+            return None
+        if not value.strip():
+            return style.empty_ok
+        if not value.startswith(style.lead):
+            return False
+        return self.check(value[len(style.lead) :], style)
+
+
+class title_style:
+    def __init__(self):
+        # What a duty title field's regex wants: case "caps", "title" or None
+        # (not a duty title pattern), whether the field may be empty, the
+        # text before the title and a one-word title it accepts (probe)
+        self.pattern = None
+        self.case = None
+        self.empty_ok = False
+        self.lead = ""
+        self.probe = ""
+        self.separators = {}  # (before, gap, after) => accepted
+
+    def separator_ok(self, before, gap, after):
+        # True if the regex accepts gap between the words before and after
+        # (the probe, or "" at either end of the title)
+        key = (before, gap, after)
+        try:
+            return self.separators[key]
+        except KeyError:
+            pass
+        accepted = self.pattern.match(self.lead + before + gap + after) is not None
+        self.separators[key] = accepted
+        return accepted
+
+
+def load_title_index(rules):
+    # The built-in index plus the ruleset's Duty Titles sheet
+    titles = title_index()
+    titles.load_rows(rules.rows(TITLE_SHEET))
+    return titles
@@ -0,0 +1,139 @@
+#!/usr/bin/env python
+
+"""Tracing for the PR Checker.
+
+A trace tells what every check did, the fields and words that passed as well
+as the ones reported, and is written to a trace stream of its own (the log,
+or --trace-file), never to the report.  Tracing is switched on per check and
+level with --trace:
+
+    --trace all                     everything (what --verbose does)
+    --trace catch,rules:info        the Catch patterns tried on every line,
+                                    and the ruleset tables of the form
+
+The checks are rules (the ruleset tables a report is checked against),
+version, spell, acronym, catch and regex; the levels info (what is traced once
+per report) and debug (the default: every evaluation).  A message is
+formatted only when its check is traced at its level, and the stages ask
+enabled() once per field, so an untraced check pays nothing in its inner
+loops.  Fields answered from the --incremental cache are not checked again
+and so not traced.
+
+One tracer per trace stream is shared by every report of a process, so the
+traces of a batch are interleaved a message at a time.
+
+Usage: prcheck.py --trace CHECK[:LEVEL][,...] [--trace-file FILE] file.xfdl
+"""
+
+import sys
+import threading
+
+import prinput
+
+INFO = 1
+DEBUG = 2
+LEVEL_NAMES = {"info": INFO, "debug": DEBUG}
+
+TRACE_CHECKS = ("rules", "version", "spell", "acronym", "catch", "regex")
+
+
+class trace_error(Exception):
+    pass
+
+
+def parse_trace(spec):
+    # {check: level} from a --trace value such as "spell,catch:info"
+    levels = {}
+    for item in spec.split(","):
+        item = item.strip()
+        if not item:
+            continue
+        check, level = item, DEBUG
+        if ":" in item:
+            check, level_name = item.split(":", 1)
+            if level_name not in LEVEL_NAMES:
+                raise trace_error("Unknown trace level: %s" % level_name)
+            level = LEVEL_NAMES[level_name]
+        if check == "all":
+            for name in TRACE_CHECKS:
+                levels[name] = max(levels.get(name, 0), level)
+        elif check in TRACE_CHECKS:
+            levels[check] = max(levels.get(check, 0), level)
+        else:
+            raise trace_error("Unknown check to trace: %s" % check)
+    return levels
+
+
+class trace_stream:
+    def __init__(self, filename=None):
+        # Appends to filename, or writes to whatever sys.stdout is (the log)
+        self.filename = filename
+        self.stream = None
+        self.lock = threading.Lock()
+
+    def write(self, text):
+        self.lock.acquire()
+        try:
+            stream = self.stream
+            if self.filename is None:
+                stream = sys.stdout
+            elif stream is None:
+                stream = self.stream = prinput.open_report(self.filename, "a")
+            stream.write(text)
+            stream.flush()
+        finally:
+            self.lock.release()
+
+
+class tracer:
+    def __init__(self, levels=None, stream=None):
+        # levels maps a check name to the level it is traced at
+        self.levels = levels or {}
+        self.stream = stream
+
+    def enabled(self, check, level=DEBUG):
+        return self.levels.get(check, 0) >= level
+
+    def trace(self, check, level, message, *args):
+        # Write message % args if check is traced at level
+        if self.levels.get(check, 0) < level:
+            return
+        if args:
+            message = message % args
+        self.stream.write(message)
+
+    def heading(self, title):
+        # Mark the start of a report in the trace, if anything is traced
+        if self.levels:
+            self.stream.write("=====Trace: %s=====\n" % title)
+
+    def trace_finding(self, check, level, finding):
+        # Write a prrecords.finding as the report would have shown it
+        if self.levels.get(check, 0) >= level:
+            self.stream.write(finding.format())
+
+
+# Traces nothing; the tracer of every report checked without --trace
+NO_TRACE = tracer()
+
+streams = {}  # trace file name (None: the log) => trace_stream
+streams_lock = threading.Lock()
+
+
+def open_tracer(run_options):
+    # The tracer asked for by --trace, --trace-file and --verbose
+    spec = getattr(run_options, "trace", None) or ""
+    if getattr(run_options, "verbose", False):
+        spec = "all," + spec
+    levels = parse_trace(spec)
+    if not levels:
+        return NO_TRACE
+    filename = getattr(run_options, "trace_file", None)
+    streams_lock.acquire()
+    try:
+        stream = streams.get(filename)
+        if stream is None:
+            stream = streams[filename] = trace_stream(filename)
+    finally:
+        streams_lock.release()
+    return tracer(levels, stream)
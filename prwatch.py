@@ -0,0 +1,335 @@
+#!/usr/bin/env python
+
+"""Watch folder mode for the PR Checker.
+
+Checks every PR dropped into an intake directory, as it arrives, through the
+batch pipeline (prbatch.py).  The directory is watched with inotify where the
+C library has it (Linux) and polled every --poll seconds everywhere else.
+
+A PR copied over a network share shows up long before its last byte does, so
+a new .xfdl file is only checked once its size and modification time have not
+changed for --settle seconds.  Reports are written to a temporary file and
+renamed into place, so a reader never sees a partial report.
+
+The journal, a JSON line per checked file, remembers the size and modification
+time each file had when it was checked.  On restart only files that are new
+or changed since are checked; the journal is compacted to one line per file
+when it is opened.  Stop the watch with Ctrl+C.
+
+Edits to the workbook (or the --lexicon) are picked up without a restart: the
+rules are looked at every --reload seconds and reloaded in the background
+once they have changed (see prrules.ruleset_manager).
+
+Usage: prwatch.py [options] intake-directory
+"""
+
+import os
+import sys
+import json
+import time
+import errno
+import select
+import struct
+import threading
+
+import prbatch
+import prinput
+import prisolate
+import prreport
+import prrules
+
+DEFAULT_JOURNAL = ".prwatch.journal"
+DEFAULT_SETTLE = 2.0
+DEFAULT_POLL = 2.0
+
+# inotify(7) events meaning a file was written, created or moved in
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+WATCH_MASK = IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE
+EVENT_HEADER = struct.Struct("iIII")  # wd, mask, cookie, name length
+EVENT_BUFFER = 64 * 1024
+
+
+def is_report(name):
+    return os.path.splitext(name)[1].lower() == ".xfdl" and not name.startswith(".")
+
+
+class inotify_watcher:
+    def __init__(self, directory):
+        # Raises OSError (or AttributeError) where inotify is not available
+        import ctypes
+        import ctypes.util
+
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        self.fd = libc.inotify_init()
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init failed")
+        if not isinstance(directory, bytes):
+            directory = directory.encode(sys.getfilesystemencoding())
+        if libc.inotify_add_watch(self.fd, directory, WATCH_MASK) < 0:
+            error = ctypes.get_errno()
+            os.close(self.fd)
+            raise OSError(error, "inotify_add_watch failed")
+
+    def wait(self, timeout):
+        # Names of the files changed within timeout seconds
+        names = set()
+        try:
+            ready = select.select([self.fd], [], [], timeout)[0]
+        except select.error as e:
+            if e.args[0] == errno.EINTR:
+                return names
+            raise
+        if not ready:
+            return names
+        data = os.read(self.fd, EVENT_BUFFER)
+        position = 0
+        while position + EVENT_HEADER.size <= len(data):
+            wd, mask, cookie, length = EVENT_HEADER.unpack_from(data, position)
+            position += EVENT_HEADER.size
+            name = data[position : position + length].rstrip(b"\0")
+            position += length
+            if name:
+                if not isinstance(name, str):
+                    name = name.decode(sys.getfilesystemencoding())
+                names.add(name)
+        return names
+
+    def close(self):
+        os.close(self.fd)
+
+
+class poll_watcher:
+    def __init__(self, directory):
+        self.directory = directory
+
+    def wait(self, timeout):
+        # Every name in the directory, after timeout seconds
+        time.sleep(timeout)
+        return set(os.listdir(self.directory))
+
+    def close(self):
+        pass
+
+
+class journal:
+    def __init__(self, filename):
+        # Load and compact the journal, then keep it open for appending
+        self.filename = filename
+        self.entries = {}  # path => last journal entry
+        self.active = {}  # path => (size, mtime) of files being checked
+        self.lock = threading.Lock()
+        self.load()
+        self.compact()
+        self.journal_file = open(filename, "a")
+
+    def load(self):
+        try:
+            f = open(self.filename)
+        except IOError:
+            return
+        try:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                    self.entries[entry["file"]] = entry
+                except (ValueError, KeyError, TypeError):
+                    # A line cut short when the last run was stopped
+                    continue
+        finally:
+            f.close()
+
+    def compact(self):
+        # Rewrite the journal with the last entry for each file
+        temp_filename = "%s.tmp" % self.filename
+        f = open(temp_filename, "w")
+        try:
+            for path in sorted(self.entries):
+                f.write(json.dumps(self.entries[path], sort_keys=True) + "\n")
+        finally:
+            f.close()
+        prreport.replace_file(temp_filename, self.filename)
+
+    def wants(self, path, size, mtime):
+        # True unless the file is being checked or was checked as it is now
+        self.lock.acquire()
+        try:
+            if path in self.active:
+                return False
+            entry = self.entries.get(path)
+            if entry is None:
+                return True
+            return (entry.get("size"), entry.get("mtime")) != (size, mtime)
+        finally:
+            self.lock.release()
+
+    def start(self, path, size, mtime):
+        self.lock.acquire()
+        self.active[path] = (size, mtime)
+        self.lock.release()
+
+    def record(self, path, status, report_filename=None):
+        # Note a finished check; the line is on disk before this returns
+        self.lock.acquire()
+        try:
+            size, mtime = self.active.pop(path)
+            entry = {
+                "file": path,
+                "size": size,
+                "mtime": mtime,
+                "status": status,
+                "report": report_filename,
+                "time": time.time(),
+            }
+            self.entries[path] = entry
+            self.journal_file.write(json.dumps(entry, sort_keys=True) + "\n")
+            self.journal_file.flush()
+            os.fsync(self.journal_file.fileno())
+        finally:
+            self.lock.release()
+
+    def close(self):
+        self.journal_file.close()
+
+
+class intake:
+    def __init__(
+        self, directory, log, settle=DEFAULT_SETTLE, poll=DEFAULT_POLL, use_inotify=True
+    ):
+        # log is the journal; use_inotify False always polls
+        self.directory = os.path.abspath(directory)
+        self.log = log
+        self.settle = settle
+        self.poll = poll
+        self.watcher = None
+        if use_inotify:
+            try:
+                self.watcher = inotify_watcher(self.directory)
+            except (OSError, AttributeError):
+                pass
+        self.method = "inotify"
+        if self.watcher is None:
+            self.watcher = poll_watcher(self.directory)
+            self.method = "polling"
+        self.pending = {}  # path => (size, mtime, unchanged since)
+
+    def consider(self, names):
+        # Start timing new or changed reports among names
+        now = time.time()
+        for name in names:
+            if not is_report(name):
+                continue
+            path = os.path.join(self.directory, name)
+            if path in self.pending:
+                continue
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            if self.log.wants(path, stat.st_size, stat.st_mtime):
+                self.pending[path] = (stat.st_size, stat.st_mtime, now)
+
+    def settled(self):
+        # Reports unchanged for the settle time, taken off the pending list
+        now = time.time()
+        ready = []
+        for path in sorted(self.pending):
+            size, mtime, since = self.pending[path]
+            try:
+                stat = os.stat(path)
+            except OSError:
+                # Moved away or deleted before it settled
+                del self.pending[path]
+                continue
+            if (stat.st_size, stat.st_mtime) != (size, mtime) or not size:
+                self.pending[path] = (stat.st_size, stat.st_mtime, now)
+            elif now - since >= self.settle:
+                del self.pending[path]
+                if self.log.wants(path, size, mtime):
+                    self.log.start(path, size, mtime)
+                    ready.append(path)
+        return ready
+
+    def files(self):
+        # Yield every report to check, for prbatch.pipeline.run, until
+        # interrupted with Ctrl+C
+        self.consider(os.listdir(self.directory))
+        try:
+            while True:
+                for path in self.settled():
+                    yield path
+                timeout = self.poll
+                if self.pending:
+                    timeout = min(timeout, self.settle / 2.0)
+                self.consider(self.watcher.wait(timeout))
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self.watcher.close()
+
+
+# ***********************START MAIN PROGRAM*************************
+
+
+def watch_option_parser():
+    # prbatch's options plus the intake settings
+    p = prbatch.batch_option_parser()
+    p.set_usage("%prog [options] intake-directory")
+    p.add_option(
+        "--journal", metavar="FILE", help="default: %s in the intake" % DEFAULT_JOURNAL
+    )
+    p.add_option("--settle", type="float", default=DEFAULT_SETTLE, metavar="SECONDS")
+    p.add_option("--poll", type="float", default=DEFAULT_POLL, metavar="SECONDS")
+    p.add_option("--no-inotify", action="store_true", help="always poll")
+    p.set_defaults(reload=prrules.DEFAULT_RELOAD_INTERVAL)
+    return p
+
+
+if __name__ == "__main__":
+    # Needed by the --isolate worker processes in the py2exe build
+    prisolate.multiprocessing.freeze_support()
+
+    p = watch_option_parser()
+    options, arguments = p.parse_args()
+    if len(arguments) != 1 or not os.path.isdir(arguments[0]):
+        p.error("give one intake directory")
+    if options.report or options.duplicates:
+        p.error("--report and --duplicates need a batch; use prbatch.py")
+    if options.sink != "pdf":
+        p.error("a watch writes a report per file; use prbatch.py for --sink")
+
+    console = sys.stdout
+    sys.stdout = prinput.open_report("logfile.txt")
+    sys.stderr = prinput.open_report("logfileerr.txt")
+
+    directory = arguments[0]
+    log = journal(options.journal or os.path.join(directory, DEFAULT_JOURNAL))
+    incoming = intake(
+        directory, log, options.settle, options.poll, not options.no_inotify
+    )
+
+    workers = {}
+    for name in prbatch.STAGE_NAMES:
+        workers[name] = getattr(options, "%s_workers" % name)
+    batch = prbatch.pipeline(
+        options.settings,
+        options,
+        workers,
+        options.queue_size,
+        options.text,
+        options.output_dir,
+        journal=log,
+        isolate=options.isolate,
+        timeout=options.timeout,
+        memory_limit=options.memory_limit,
+        reload=options.reload,
+    )
+    console.write("Watching %s (%s)\n" % (incoming.directory, incoming.method))
+    batch.run(incoming.files())
+    log.close()
+
+    report = batch.throughput_report()
+    print(report)
+    console.write(report)
@@ -46,8 +46,10 @@
 
 # http://aspn.activestate.com/ASPN/Cookbook/Python/Recipe/189858
 
+from __future__ import print_function
+
 import sys, os
-import string
+import io
 import time
 import getopt
 
@@ -236,7 +238,7 @@ class pyText2Pdf:
                         self._pageHt=842
                     else:
                         psz=o[1]+a
-                        print self._progname, ': ignoring unknown paper size ', psz
+                        print(self._progname, ': ignoring unknown paper size ', psz)
                 elif o == '-s':
                     self._ptSize=int(a)
                     if self._ptSize<1:
@@ -268,7 +270,7 @@ class pyText2Pdf:
                 elif o in ('-o', '-O'):
                     self._ofile=a
                 else:
-                    print self._progname, ': ignoring invalid switch: ', o
+                    print(self._progname, ': ignoring invalid switch: ', o)
 
             x += 1
 
@@ -297,14 +299,14 @@ class pyText2Pdf:
             self.argsCallBack( args )
 
         if self._landscape:
-            print 'Landscape option on...'
+            print('Landscape option on...')
         if self._columns==2:
-            print 'Printing in two columns...'
+            print('Printing in two columns...')
         if self._doFFs:
-            print 'Ignoring form feed character...'
+            print('Ignoring form feed character...')
         if self._IsoEnc:
-            print 'Using ISO Latin Encoding...'
-        print 'Using font', self._font[1:], ' size =', self._ptSize
+            print('Using ISO Latin Encoding...')
+        print('Using font', self._font[1:], ' size =', self._ptSize)
             
 
     def writestr(self, str):
@@ -312,15 +314,19 @@ class pyText2Pdf:
         All output operations go through this function.
         We keep the current file position also here"""
 
+        # the input is read as ISO Latin-1 text, one byte per character
+        if not isinstance(str, bytes):
+            str = str.encode('latin-1')
+
         # update current file position
         self._fpos += len(str)
         for x in range(0, len(str)):
-            if str[x] == '\n':
+            if str[x:x+1] == b'\n':
                 self._fpos += LF_EXTRA
         try:
             self._ofs.write(str)
-        except IOError, e:
-            print e
+        except IOError as e:
+            print(e)
             return -1
 
         return 0
@@ -335,32 +341,37 @@ class pyText2Pdf:
             self._pageWd = tmp
 
         if self._lines==0:
-            self._lines = (self._pageHt - 72)/self._vertSpace
+            self._lines = (self._pageHt - 72)//self._vertSpace
         if self._lines < 1:
             self._lines=1
         
-        try:
-            self._ifs=open(self._ifile)
-        except IOError, (strerror, errno):
-            print 'Error: Could not open file to read --->', self._ifile
-            sys.exit(3)
+        # a caller may hand over the text as an open file (_ifs) instead
+        if self._ifs is None:
+            try:
+                if sys.version_info[0] < 3:
+                    self._ifs=open(self._ifile)
+                else:
+                    self._ifs=io.open(self._ifile, encoding='latin-1')
+            except IOError:
+                print('Error: Could not open file to read --->', self._ifile)
+                sys.exit(3)
 
         if self._ofile=="":
             self._ofile=self._ifile + '.pdf'
 
         try:
             self._ofs = open(self._ofile, 'wb')
-        except IOError, (strerror, errno):
-            print 'Error: Could not open file to write --->', self._ofile
+        except IOError:
+            print('Error: Could not open file to write --->', self._ofile)
             sys.exit(3)
 
-        print 'Input file =>', self._ifile
-        print 'Writing pdf file', self._ofile, '...'
+        print('Input file =>', self._ifile)
+        print('Writing pdf file', self._ofile, '...')
         self.WriteHeader(self._ifile)
         self.WritePages()
         self.WriteRest()
 
-        print 'Wrote file', self._ofile
+        print('Wrote file', self._ofile)
         self._ifs.close()
         self._ofs.close()
         return 0
@@ -575,7 +586,7 @@ class pyText2Pdf:
 
                 if column < self._columns:
                     buf = "".join(("1 0 0 1 ",
-                                   str((self._pageWd/2 + 25)),
+                                   str((self._pageWd//2 + 25)),
                                    " ",
                                    str(self._pageHt - 40),
                                    " Tm\n"))
@@ -615,7 +626,7 @@ class pyText2Pdf:
 
         for i in range(1, self._curobj + 1):
             val = self._locations[i]
-            buf = "".join((string.zfill(str(val), 10), " 00000 n ", str(LINE_END)))
+            buf = "".join((str(val).zfill(10), " 00000 n ", str(LINE_END)))
             ws(buf)
 
         ws("trailer\n")
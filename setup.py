@@ -6,7 +6,9 @@ setup(windows=["Text2PDF"])
 setup(
     windows=[{"script": "prcheck.py", "icon_resources": [(1, "prcheck.ico")]}],
     options={"py2exe": {"packages": ["xml", "gzip"]}},
-    data_files=[("", ["PR Structure.ods", "prchecker_splash.gif", "uudeview.exe"])],
+    data_files=[
+        ("", ["PR Structure.ods", "PR Acronyms.txt", "prchecker_splash.gif"])
+    ],
 )
 
 
@@ -0,0 +1,119 @@
+"""Shared helpers for the PR Checker regression tests.
+
+The expected reports in tests/expected are what the checks write for the forms
+in Test_PRs with the text sink and without the Word spell check, which only
+runs on Windows.
+"""
+
+import binascii
+import io
+import os
+import sys
+import zlib
+
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(TESTS_DIR)
+if REPO_DIR not in sys.path:
+    sys.path.insert(0, REPO_DIR)
+
+import prcheck
+import prinput
+import prsinks
+
+SETTINGS = os.path.join(REPO_DIR, "PR Structure.ods")
+FIXTURES = ("AF707", "AF707_test_doc", "AF910")
+
+MIME_LINE = b'application/vnd.xfdl;content-encoding="base64-gzip"'
+
+# The checks start Word on Windows, and the expected reports have no
+# spelling findings
+NEEDS_NO_WORD = os.name == "nt"
+
+
+def fixture(name):
+    return os.path.join(REPO_DIR, "Test_PRs", "%s.xfdl" % name)
+
+
+def expected_report(name):
+    f = io.open(
+        os.path.join(TESTS_DIR, "expected", "%s.out" % name),
+        encoding=prinput.XFDL_ENCODING,
+        newline="",
+    )
+    try:
+        return f.read()
+    finally:
+        f.close()
+
+
+def fixture_document(name):
+    # The decoded XML document of a Test_PRs form
+    return prinput.decode_payload(fixture(name))
+
+
+def xfdl_payload(document):
+    # document gzipped and base64 encoded in 76 character lines, as in a form
+    compressor = zlib.compressobj(9, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    compressed = compressor.compress(document) + compressor.flush()
+    return b"".join(
+        [
+            binascii.b2a_base64(compressed[start : start + 57])
+            for start in range(0, len(compressed), 57)
+        ]
+    )
+
+
+def write_xfdl(filename, document=None, payload=None, mime_line=MIME_LINE):
+    # Write an .xfdl file holding document, or a ready made payload
+    if payload is None:
+        payload = xfdl_payload(document)
+    f = open(filename, "wb")
+    try:
+        f.write(mime_line + b"\n")
+        f.write(payload)
+    finally:
+        f.close()
+
+
+def report_text(text):
+    # A memory sink holds str on Python 3 and str or unicode on Python 2
+    if isinstance(text, bytes):
+        return text.decode(prinput.XFDL_ENCODING)
+    return text
+
+
+class quiet:
+    # Swallows what the checks print to the log while a test runs
+    def write(self, text):
+        pass
+
+    def flush(self):
+        pass
+
+
+def check_report(name, **option_values):
+    # Check a Test_PRs form the way prbatch does; returns the pr_object and
+    # its report text
+    return check_file(fixture(name), **option_values)
+
+
+def check_file(filename, **option_values):
+    # Check any .xfdl file the way prbatch does
+    options = prcheck.option_parser().get_default_values()
+    for option, value in option_values.items():
+        setattr(options, option, value)
+    sink = prsinks.memory_sink()
+    stdout = sys.stdout
+    sys.stdout = quiet()
+    try:
+        pr = prcheck.pr_object(filename, SETTINGS, options, sink, run=False)
+        if not pr.check_header(filename):
+            pr.status = "rejected"
+            pr.clean_up()
+        elif pr.load_document():
+            pr.load_rules()
+            pr.run_checks()
+            pr.clean_up()
+    finally:
+        sys.stdout = stdout
+    return pr, report_text(sink.getvalue())
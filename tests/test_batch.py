@@ -0,0 +1,54 @@
+"""The batch pipeline over the Test_PRs forms.
+
+Usage: python -m unittest discover tests
+"""
+
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+from tests import support
+
+import prbatch
+
+
+class failing_journal:
+    # A journal whose disk is full
+    def record(self, path, status, report_filename=None):
+        raise IOError("disk full")
+
+
+class recording_test(unittest.TestCase):
+    def setUp(self):
+        self.work = tempfile.mkdtemp()
+        self.stdout = sys.stdout
+        sys.stdout = support.quiet()
+
+    def tearDown(self):
+        sys.stdout = self.stdout
+        shutil.rmtree(self.work)
+
+    def test_failed_recording(self):
+        # Every report is still counted, with the error that stopped it
+        batch = prbatch.pipeline(
+            support.SETTINGS,
+            text_only=True,
+            output_dir=self.work,
+            journal=failing_journal(),
+        )
+        filenames = [support.fixture(name) for name in support.FIXTURES]
+        results = batch.run(filenames)
+        self.assertEqual(
+            sorted([os.path.abspath(filename) for filename in filenames]),
+            sorted([result[0] for result in results]),
+        )
+        for filename, status, error, report_filename in results:
+            self.assertEqual("error", status)
+            self.assertTrue(error.endswith("disk full"))
+            self.assertTrue(os.path.isfile(report_filename))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,101 @@
+"""Concurrent saves of the incremental cache of one form.
+
+Usage: python -m unittest discover tests
+"""
+
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+import multiprocessing
+
+from tests import support  # puts the repository on sys.path
+
+import prcache
+
+SERIAL = "8f3c2a10-5d4e-4b7a-9c61-2e0f1a7b3d95"
+FINGERPRINT = ("ruleset", False, None)
+WRITERS = 8
+SAVES = 20
+FIELDS = 50
+
+
+def save_results(cache_dir, writer):
+    # One check worker saving the results of SAVES reports of the same form
+    for i in range(SAVES):
+        cache = prcache.incremental_cache(SERIAL, FINGERPRINT, cache_dir)
+        for field in range(FIELDS):
+            key = ("field", 1, "FIELD%d" % field)
+            cache.store(key, "value %d" % field, [writer, i])
+        cache.save()
+
+
+class concurrent_save_test(unittest.TestCase):
+    def setUp(self):
+        self.work = tempfile.mkdtemp()
+        self.cache_dir = os.path.join(self.work, prcache.CACHE_DIR)
+
+    def tearDown(self):
+        shutil.rmtree(self.work)
+
+    def test_same_serial_threads(self):
+        # Check workers of one batch finishing reports of the same form
+        errors = []
+
+        def write(writer):
+            try:
+                save_results(self.cache_dir, writer)
+            except Exception as e:
+                errors.append(e)
+
+        threads = [
+            threading.Thread(target=write, args=(writer,)) for writer in range(WRITERS)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual([], errors)
+        self.assert_one_whole_cache()
+
+    def test_same_serial_processes(self):
+        # --isolate workers, which share no lock
+        workers = [
+            multiprocessing.Process(target=save_results, args=(self.cache_dir, writer))
+            for writer in range(WRITERS)
+        ]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        self.assertEqual([0] * WRITERS, [worker.exitcode for worker in workers])
+        self.assert_one_whole_cache()
+
+    def assert_one_whole_cache(self):
+        # No temporary file is left, and the cache that remains is one
+        # writer's whole result
+        cache = self.reader()
+        self.assertEqual(
+            [os.path.basename(cache.cache_filename)], os.listdir(self.cache_dir)
+        )
+        self.assertEqual(FIELDS, len(cache.previous))
+        results = set()
+        for digest, result in cache.previous.values():
+            results.add(tuple(result))
+        self.assertEqual(1, len(results))
+
+    def test_changed_fingerprint(self):
+        cache = prcache.incremental_cache(SERIAL, FINGERPRINT, self.cache_dir)
+        cache.store(("field", 1, "FIELD1"), "value", [])
+        cache.save()
+        self.assertEqual(1, len(self.reader().previous))
+        other = prcache.incremental_cache(SERIAL, ("other",), self.cache_dir)
+        self.assertEqual({}, other.previous)
+
+    def reader(self):
+        return prcache.incremental_cache(SERIAL, FINGERPRINT, self.cache_dir)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,158 @@
+"""Duplicate bullets across the reports of a batch.
+
+Usage: python -m unittest discover tests
+"""
+
+import csv
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+from tests import support
+
+import prbatch
+import prdupes
+import prinput
+
+BULLET = "Led 12 Airmen through a 30 day surge; generated 240 sorties, zero delays"
+REWORDED = "Led 12 Airmen through a 30 day surge; generated 240 sorties, zero misses"
+OTHER = "Rebuilt the squadron tool crib inventory and recovered 45K in lost parts"
+
+
+class narrative_rule:
+    def __init__(self, page):
+        self.page = page
+
+
+def narratives(*values):
+    # (sid, rule, value) per field, as rule_engine.narratives yields them
+    return [
+        ("FIELD%d" % number, narrative_rule(1), value)
+        for number, value in enumerate(values)
+    ]
+
+
+class duplicate_test(unittest.TestCase):
+    def setUp(self):
+        self.work = tempfile.mkdtemp()
+        self.filename = os.path.join(self.work, "duplicates.csv")
+        self.index = prdupes.duplicate_index(self.filename)
+        self.max_bullets = prdupes.MAX_BULLETS
+
+    def tearDown(self):
+        prdupes.MAX_BULLETS = self.max_bullets
+        self.index.close()
+        shutil.rmtree(self.work)
+
+    def rows(self):
+        self.index.close()
+        f = prinput.open_csv(self.filename)
+        try:
+            return list(csv.reader(f))
+        finally:
+            f.close()
+
+    def test_shingles(self):
+        # Case and punctuation do not count
+        self.assertEqual(
+            prdupes.shingles(BULLET), prdupes.shingles(BULLET.upper() + "!")
+        )
+        self.assertEqual(set(), prdupes.shingles("Too short"))
+
+    def test_copied_bullet(self):
+        self.assertEqual(0, self.index.add_report("a.xfdl", narratives(BULLET, OTHER)))
+        self.assertEqual(1, self.index.add_report("b.xfdl", narratives(BULLET)))
+        rows = self.rows()
+        self.assertEqual(prdupes.CSV_HEADER, rows[0])
+        self.assertEqual(
+            ["1.00", "b.xfdl", "1", "FIELD0", "1", BULLET, "a.xfdl", "1", "FIELD0"],
+            rows[1][:9],
+        )
+        self.assertEqual(2, len(rows))
+
+    def test_reworded_bullet(self):
+        self.index.add_report("a.xfdl", narratives(BULLET))
+        self.index.threshold = 0.5
+        self.assertEqual(1, self.index.add_report("b.xfdl", narratives(REWORDED)))
+
+    def test_same_report(self):
+        # A report repeating itself is not a copy of another report
+        self.assertEqual(0, self.index.add_report("a.xfdl", narratives(BULLET, BULLET)))
+
+    def test_short_lines(self):
+        self.index.add_report("a.xfdl", narratives("Outstanding NCO"))
+        self.assertEqual(
+            0, self.index.add_report("b.xfdl", narratives("Outstanding NCO"))
+        )
+
+    def test_oldest_evicted(self):
+        # Once MAX_BULLETS newer bullets are in, the oldest is forgotten and
+        # its buckets are emptied
+        prdupes.MAX_BULLETS = 2
+        self.index.add_report("a.xfdl", narratives(BULLET))
+        self.index.add_report("b.xfdl", narratives(OTHER, OTHER.upper()))
+        self.assertEqual(0, self.index.add_report("c.xfdl", narratives(BULLET)))
+        self.assertEqual(1, self.index.add_report("d.xfdl", narratives(BULLET)))
+        for buckets in self.index.buckets:
+            for bucket in buckets.values():
+                for bullet in bucket:
+                    self.assertTrue(bullet >= self.index.count - prdupes.MAX_BULLETS)
+
+
+class batch_duplicate_test(unittest.TestCase):
+    def setUp(self):
+        self.work = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.work)
+
+    def form(self, name, bullets):
+        # An AF707 whose duty description (FIELD12) holds bullets
+        document = support.fixture_document("AF707")
+        start = document.index(b'<field sid="FIELD12">')
+        empty = document.index(b"<value></value>", start)
+        value = "<value>%s</value>" % "&#xA;".join(bullets)
+        document = (
+            document[:empty]
+            + value.encode("ascii")
+            + document[empty + len(b"<value></value>") :]
+        )
+        filename = os.path.join(self.work, name)
+        support.write_xfdl(filename, document)
+        return filename
+
+    def batch_pairs(self, isolate):
+        index = prdupes.duplicate_index(os.path.join(self.work, "duplicates.csv"))
+        batch = prbatch.pipeline(
+            support.SETTINGS,
+            text_only=True,
+            output_dir=self.work,
+            duplicates=index,
+            isolate=isolate,
+        )
+        filenames = [
+            self.form("first.xfdl", [BULLET, OTHER]),
+            self.form("second.xfdl", [REWORDED.upper()]),
+            self.form("third.xfdl", [OTHER]),
+        ]
+        stdout = sys.stdout
+        sys.stdout = support.quiet()
+        try:
+            batch.run(filenames)
+        finally:
+            sys.stdout = stdout
+        return index.close()
+
+    def test_batch(self):
+        # The third form copies OTHER, and the second rewords BULLET in
+        # capitals
+        pairs = self.batch_pairs(False)
+        self.assertEqual(2, pairs)
+        # Isolated workers send their narratives back for the same result
+        self.assertEqual(pairs, self.batch_pairs(True))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,140 @@
+"""The XFDL envelope: damaged, foreign and oversized payloads.
+
+Usage: python -m unittest discover tests
+"""
+
+import base64
+import os
+import shutil
+import tempfile
+import unittest
+import zlib
+
+from tests import support
+
+import prinput
+
+
+def gzipped(document):
+    compressor = zlib.compressobj(9, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    return compressor.compress(document) + compressor.flush()
+
+
+def base64_lines(data, line_length=76, newline=b"\n"):
+    # data base64 encoded and wrapped at line_length characters
+    text = base64.b64encode(data)
+    return b"".join(
+        [
+            text[start : start + line_length] + newline
+            for start in range(0, len(text), line_length)
+        ]
+    )
+
+
+def flipped(data, position):
+    # data with the bits of one byte inverted
+    data = bytearray(data)
+    data[position] ^= 0xFF
+    return bytes(data)
+
+
+class envelope_test(unittest.TestCase):
+    def setUp(self):
+        self.work = tempfile.mkdtemp()
+        self.filename = os.path.join(self.work, "form.xfdl")
+        self.document = support.fixture_document("AF910")
+
+    def tearDown(self):
+        shutil.rmtree(self.work)
+
+    def write(self, payload):
+        support.write_xfdl(self.filename, payload=payload)
+
+    def assert_rejected(self, reason, max_ratio=0, max_size=0):
+        # The decoders turn the form away with an xfdl_error giving reason;
+        # decode_payload has no caps
+        decoders = [lambda: prinput.parse_document(self.filename, max_ratio, max_size)]
+        if not max_ratio and not max_size:
+            decoders.append(lambda: prinput.decode_payload(self.filename))
+        for decode in decoders:
+            try:
+                decode()
+            except prinput.xfdl_error as e:
+                self.assertTrue(str(e).startswith(reason), str(e))
+            else:
+                self.fail("not rejected: %s" % reason)
+
+    def test_bad_base64(self):
+        payload = support.xfdl_payload(self.document)
+        middle = len(payload) // 2
+        self.write(payload[:middle] + b"!" + payload[middle + 1 :])
+        self.assert_rejected("Bad base64 payload: character outside the alphabet")
+
+    def test_not_gzip(self):
+        self.write(base64_lines(self.document))
+        self.assert_rejected("Payload is not gzip compressed")
+
+    def test_corrupt_gzip(self):
+        data = gzipped(self.document)
+        self.write(base64_lines(flipped(data, len(data) // 2)))
+        self.assert_rejected("Bad gzip payload")
+
+    def test_bad_trailer(self):
+        # The decompressor checks the CRC-32 of the trailer itself
+        data = gzipped(self.document)
+        self.write(base64_lines(flipped(data, len(data) - 8)))
+        self.assert_rejected("Bad gzip payload")
+
+    def test_truncated(self):
+        data = gzipped(self.document)
+        self.write(base64_lines(data[: len(data) // 2]))
+        self.assert_rejected("Truncated or corrupt gzip payload")
+
+    def test_empty(self):
+        self.write(b"")
+        self.assert_rejected("Empty payload")
+
+    def test_no_root(self):
+        self.write(support.xfdl_payload(b"<html><body>Not a form</body></html>"))
+        self.assert_rejected("No XFDL root element")
+        # Only the start of the document is searched
+        self.write(support.xfdl_payload(b" " * prinput.ROOT_WINDOW + self.document))
+        self.assert_rejected("No XFDL root element")
+
+    def test_bomb(self):
+        # A document that compresses more than a thousand to one is stopped a
+        # little past the grace it is given, long before its end
+        start = self.document.index(b"<XFDL")
+        root = self.document[: self.document.index(b">", start) + 1]
+        self.write(support.xfdl_payload(root + b" " * (64 << 20)))
+        self.assert_rejected("Payload expands more than 100:1", max_ratio=100)
+        self.assert_rejected(
+            "Payload larger than %d bytes" % (1 << 20), max_size=1 << 20
+        )
+        mapped = prinput.mapped_xfdl(self.filename, 100)
+        expanded = 0
+        try:
+            for data in mapped.chunks():
+                expanded += len(data)
+        except prinput.xfdl_error:
+            pass
+        finally:
+            mapped.close()
+        self.assertTrue(expanded < 2 * prinput.RATIO_GRACE, expanded)
+
+    def test_line_layouts(self):
+        # Lines that do not hold whole groups of 4 characters, and CRLF line
+        # ends, decode the same
+        data = gzipped(self.document)
+        for line_length, newline in ((70, b"\n"), (76, b"\r\n"), (4098, b"\n")):
+            self.write(base64_lines(data, line_length, newline))
+            self.assertEqual(self.document, prinput.decode_payload(self.filename))
+            doc = prinput.parse_document(self.filename, 100, 64 << 20)
+            try:
+                self.assertEqual("XFDL", doc.documentElement.tagName)
+            finally:
+                doc.unlink()
+
+
+if __name__ == "__main__":
+    unittest.main()
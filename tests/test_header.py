@@ -0,0 +1,92 @@
+"""Forms turned away by their globalpage header, before the full decode.
+
+Usage: python -m unittest discover tests
+"""
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from tests import support
+
+import prinput
+import prrecords
+
+
+class header_test(unittest.TestCase):
+    def setUp(self):
+        self.work = tempfile.mkdtemp()
+        self.document = support.fixture_document("AF910")
+
+    def tearDown(self):
+        shutil.rmtree(self.work)
+
+    def form(self, old=None, new=None, lines=None):
+        # An AF910 with old replaced by new in its document, cut to its first
+        # lines of base64 if given
+        document = self.document
+        if old is not None:
+            self.assertTrue(old in document)
+            document = document.replace(old, new)
+        payload = support.xfdl_payload(document)
+        if lines is not None:
+            payload = b"".join(payload.splitlines(True)[:lines])
+        filename = os.path.join(self.work, "form.xfdl")
+        support.write_xfdl(filename, payload=payload)
+        return filename
+
+    def test_header(self):
+        header = prinput.read_header(support.fixture("AF910"))
+        self.assertEqual("8.120.3", header.version)
+        self.assertEqual("2008/06/18", header.date)
+        self.assertTrue(header.title.startswith("AF FORM 910"))
+
+    def test_unsupported_version(self):
+        pr, text = support.check_file(
+            self.form(b"<version>8.120.3</version>", b"<version>9.1.0</version>")
+        )
+        self.assertEqual("rejected", pr.status)
+        self.assertTrue("Unsupported form version 9.1.0" in text)
+
+    def test_unknown_form(self):
+        pr, text = support.check_file(
+            self.form(b"AF FORM 910, 20080618, ENLISTED", b"AF FORM 1206, 20080618")
+        )
+        self.assertEqual("rejected", pr.status)
+        self.assertTrue("Unsupported form." in text)
+
+    def test_outdated_form(self):
+        # The version stage reports the date the ruleset wants
+        pr, text = support.check_file(
+            self.form(
+                b"<custom:date>2008/06/18</custom:date>",
+                b"<custom:date>2006/12/01</custom:date>",
+            )
+        )
+        self.assertEqual("rejected", pr.status)
+        self.assertEqual([prrecords.VERSION], [f.category for f in pr.findings])
+        self.assertTrue("Check stopped." in text)
+
+    def test_not_xfdl(self):
+        filename = os.path.join(self.work, "form.xfdl")
+        support.write_xfdl(filename, payload=b"Not a form\n", mime_line=b"text/plain")
+        pr, text = support.check_file(filename)
+        self.assertEqual("rejected", pr.status)
+        self.assertTrue(pr.error.startswith("xfdl_error: Not an XFDL file"))
+
+    def test_rejected_before_decoding(self):
+        # Only the first lines of the payload are read: a form cut short
+        # after its header is rejected for its version, not the damage
+        filename = self.form(
+            b"<version>8.120.3</version>", b"<version>9.1.0</version>", lines=40
+        )
+        self.assertRaises(prinput.xfdl_error, prinput.decode_payload, filename)
+        self.assertEqual("9.1.0", prinput.read_header(filename).version)
+        pr, text = support.check_file(filename)
+        self.assertEqual("rejected", pr.status)
+        self.assertEqual(None, pr.error)
+
+
+if __name__ == "__main__":
+    unittest.main()
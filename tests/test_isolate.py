@@ -0,0 +1,134 @@
+"""Isolated report checks: worker processes, their timeout and memory limit.
+
+Usage: python -m unittest discover tests
+"""
+
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+from tests import support
+
+import prcheck
+import prisolate
+import prsinks
+
+
+def address_space():
+    # Megabytes of address space this process uses now (Linux), or None
+    try:
+        f = open("/proc/self/status")
+    except IOError:
+        return None
+    try:
+        for line in f:
+            if line.startswith("VmSize:"):
+                return int(line.split()[1]) >> 10
+    finally:
+        f.close()
+    return None
+
+
+def group_alive(pid):
+    try:
+        os.killpg(pid, 0)
+    except OSError:
+        return False
+    return True
+
+
+class worker_test(unittest.TestCase):
+    def setUp(self):
+        self.work = tempfile.mkdtemp()
+        self.options = prcheck.option_parser().get_default_values()
+        self.worker = None
+        self.stdout = sys.stdout
+        sys.stdout = support.quiet()
+
+    def tearDown(self):
+        if self.worker is not None:
+            self.worker.close()
+        sys.stdout = self.stdout
+        shutil.rmtree(self.work)
+
+    def start(self, **limits):
+        self.worker = prisolate.report_worker(support.SETTINGS, self.options, **limits)
+        return self.worker
+
+    def large_form(self):
+        # An AF707 whose duty description holds enough elements to fill
+        # far more than a hundred megabytes once parsed
+        document = support.fixture_document("AF707")
+        start = document.index(b'<field sid="FIELD12">')
+        empty = document.index(b"<value></value>", start)
+        document = (
+            document[:empty]
+            + b"<value>"
+            + b"<x/>" * 1000000
+            + document[empty + len(b"<value>") :]
+        )
+        filename = os.path.join(self.work, "large.xfdl")
+        support.write_xfdl(filename, document)
+        return filename
+
+    @unittest.skipIf(support.NEEDS_NO_WORD, "expected reports are without Word")
+    def test_check(self):
+        # The report comes back whole and replays as the report of the form
+        worker = self.start()
+        for name in support.FIXTURES:
+            result = worker.check(support.fixture(name))
+            self.assertTrue(isinstance(result, prisolate.isolated_report))
+            self.assertEqual("ok", result.status)
+            sink = prsinks.memory_sink()
+            result.output.replay(sink, result)
+            self.assertEqual(
+                support.expected_report(name), support.report_text(sink.getvalue())
+            )
+        self.assertEqual(0, worker.restarts)
+
+    def test_rejected(self):
+        filename = os.path.join(self.work, "other.xfdl")
+        support.write_xfdl(filename, b"<XFDL></XFDL>", mime_line=b"text/plain")
+        result = self.start().check(filename)
+        self.assertEqual("rejected", result.status)
+
+    def test_timeout(self):
+        worker = self.start(timeout=0.001)
+        worker.start()
+        pid = worker.process.pid
+        self.assertRaises(
+            prisolate.worker_failure, worker.check, support.fixture("AF910")
+        )
+        self.assertEqual(1, worker.restarts)
+        self.assertEqual(None, worker.process)
+        if hasattr(os, "killpg"):
+            # Nothing the worker started outlives it
+            self.assertFalse(group_alive(pid))
+        # A new worker takes the next report
+        worker.timeout = 60
+        self.assertEqual("ok", worker.check(support.fixture("AF910")).status)
+        self.assertEqual(1, worker.restarts)
+
+    @unittest.skipIf(address_space() is None, "needs /proc/self/status")
+    def test_memory_limit(self):
+        # Whether the worker catches the MemoryError or dies of it, the
+        # report is an error and the next one is checked by a new worker
+        self.options.max_ratio = 0
+        filename = self.large_form()
+        worker = self.start(timeout=60, memory_limit=address_space() + 50)
+        try:
+            result = worker.check(filename)
+        except prisolate.worker_failure as e:
+            self.assertTrue("memory" in str(e), str(e))
+        else:
+            self.assertEqual("error", result.status)
+            self.assertTrue(result.error.startswith("MemoryError"), result.error)
+        self.assertEqual(1, worker.restarts)
+        self.assertEqual("ok", worker.check(support.fixture("AF910")).status)
+        self.assertEqual(1, worker.restarts)
+
+
+if __name__ == "__main__":
+    unittest.main()
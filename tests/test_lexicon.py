@@ -0,0 +1,120 @@
+"""Acronym lookups of the lexicon and the words it keeps from the spell check.
+
+Usage: python -m unittest discover tests
+"""
+
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+from tests import support
+
+import prlexicon
+import prrules
+import prspell
+
+
+def statuses(words, text):
+    # token => status for every acronym-like word of text
+    defined = set()
+    found = {}
+    for line in text.splitlines():
+        for word, token, status, start in words.scan(line, defined):
+            found[token] = status
+    return found
+
+
+class lexicon_test(unittest.TestCase):
+    def setUp(self):
+        rules = prrules.load_ruleset(support.SETTINGS)
+        self.words = prlexicon.load_lexicon(rules)
+
+    def test_lookup(self):
+        self.assertEqual("United States Air Force", self.words.lookup("USAF"))
+        # Plurals of an entry
+        self.assertEqual(self.words.lookup("NCO"), self.words.lookup("NCOs"))
+        self.assertEqual(self.words.lookup("NCO"), self.words.lookup("NCO's"))
+        self.assertEqual(None, self.words.lookup("XQZT"))
+
+    def test_scan(self):
+        found = statuses(self.words, "Led 12 NCOs of the XQZT team for the USAF")
+        self.assertEqual("known", found["NCOs"])
+        self.assertEqual("known", found["USAF"])
+        self.assertEqual("unknown", found["XQZT"])
+
+    def test_defined_in_field(self):
+        # Spelled out once, an acronym is accepted for the rest of the field
+        found = statuses(
+            self.words, "Ran the Quality Zone Tracker (QZTR)\nQZTR scores up 12%"
+        )
+        self.assertEqual("defined", found["QZTR"])
+
+    def test_overlook(self):
+        # Tokens the Overlook sheet lets pass are known too
+        found = statuses(self.words, "Managed 3 UAVs and 2 DGs")
+        self.assertEqual({"UAVs": "known", "DGs": "known"}, found)
+
+    def test_name_block(self):
+        # Lines mostly in capitals are not screened
+        found = statuses(self.words, "JOHN Q. XQZT, Capt, USAF")
+        self.assertEqual({"USAF": "known"}, found)
+
+    def test_text_lexicon(self):
+        work = tempfile.mkdtemp()
+        try:
+            filename = os.path.join(work, "acronyms.txt")
+            f = open(filename, "w")
+            f.write("# comment\nXQZT\tExample Quality Zone Team\nZZQ\n")
+            f.close()
+            rules = prrules.load_ruleset(support.SETTINGS)
+            words = prlexicon.load_lexicon(rules, filename)
+        finally:
+            shutil.rmtree(work)
+        self.assertEqual("Example Quality Zone Team", words.lookup("XQZT"))
+        self.assertEqual("", words.lookup("ZZQ"))
+        # The default PR Acronyms.txt is not loaded in its place
+        self.assertEqual(None, words.lookup("USAF"))
+
+
+class word_list_backend:
+    # A spell backend that knows a few lowercase words
+    WORDS = ("managed", "and", "must", "lead")
+
+    def check(self, word):
+        return word.lower() in self.WORDS
+
+    def suggest(self, word, limit=0):
+        return []
+
+
+class spell_words_test(unittest.TestCase):
+    def setUp(self):
+        rules = prrules.load_ruleset(support.SETTINGS)
+        rules.load_sheets(["Overlook"])
+        self.words = prlexicon.load_lexicon(rules)
+        self.scheduler = prspell.spell_scheduler(
+            prspell.spell_pool(word_list_backend),
+            rules.cell_list("Overlook"),
+            self.words,
+        )
+        self.stdout = sys.stdout
+        sys.stdout = support.quiet()
+
+    def tearDown(self):
+        sys.stdout = self.stdout
+        self.scheduler.close()
+
+    def test_known_kept_unknown_checked(self):
+        # Known acronyms never reach the backend; unknown ones are spell
+        # checked like any other word
+        found = dict(self.scheduler.check_words("Managed UAVs and MUST lead XQZT USAF"))
+        self.assertEqual("acronym", found["UAVs"])
+        self.assertEqual("acronym", found["USAF"])
+        self.assertEqual("ok", found["MUST"])
+        self.assertEqual("misspelled", found["XQZT"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,115 @@
+"""The regex linter and the run time guard of the rule patterns.
+
+Usage: python -m unittest discover tests
+"""
+
+import sys
+import threading
+import unittest
+
+from tests import support
+
+import prlint
+import prrules
+
+NESTED = r"^(([A-Z]+)[,]?\s?)+$"
+ALTERNATION = r"^(a|ab)+$"
+BACK_TO_BACK = r"^\w*\w*!"
+SAFE = r"^\d{3}-\d{4}$"
+BROKEN = r"(unclosed"
+
+
+def levels(pattern):
+    return [level for level, message in prlint.analyze(pattern)]
+
+
+class analyze_test(unittest.TestCase):
+    def test_levels(self):
+        self.assertEqual([prlint.RISKY], levels(NESTED))
+        self.assertEqual([prlint.WARNING], levels(ALTERNATION))
+        self.assertEqual([prlint.WARNING], levels(BACK_TO_BACK))
+        self.assertEqual([], levels(SAFE))
+        self.assertEqual([prlint.ERROR], levels(BROKEN))
+
+    def test_adversarial_inputs(self):
+        # The nested pattern runs out of time on its own characters, the
+        # safe one does not
+        timer = prlint.pattern_timer(0.5)
+        try:
+            self.assertEqual(
+                None,
+                timer.time(NESTED, "match", prlint.adversarial_inputs(NESTED)),
+            )
+            self.assertNotEqual(
+                None, timer.time(SAFE, "match", prlint.adversarial_inputs(SAFE))
+            )
+        finally:
+            timer.close()
+
+
+class ruleset_test(unittest.TestCase):
+    def setUp(self):
+        self.rules = prrules.load_ruleset(support.SETTINGS)
+
+    def test_guarded_patterns(self):
+        # The duty title regex is guarded; Overlook patterns only see one
+        # word and are not
+        guarded = prlint.guarded_patterns(self.rules)
+        self.assertTrue(r"^\n(([A-Z]+)[,]?\s?)+$" in guarded)
+        for sheet_name, row_number, label, pattern, method in prlint.rule_patterns(
+            self.rules, ["Overlook"]
+        ):
+            self.assertTrue(pattern.startswith("(?i)"))
+            self.assertFalse(pattern in guarded)
+
+    def test_lint(self):
+        # Every pattern of the workbook is linted once
+        report = prlint.lint(self.rules, 0.5)
+        patterns = [(entry[0], entry[3]) for entry in report]
+        self.assertEqual(len(set(patterns)), len(patterns))
+        self.assertTrue(("EPR Fields", r"^\n(([A-Z]+)[,]?\s?)+$") in patterns)
+
+
+class guard_test(unittest.TestCase):
+    def setUp(self):
+        self.guard = prlint.regex_guard(set([NESTED]), 0.5)
+        self.stdout = sys.stdout
+        sys.stdout = support.quiet()
+
+    def tearDown(self):
+        sys.stdout = self.stdout
+        self.guard.close()
+
+    def test_span(self):
+        self.assertEqual((0, 6), self.guard.span(NESTED, "match", "AB, CD"))
+        self.assertEqual((0, 8), self.guard.span(SAFE, "match", "555-1234"))
+        self.assertEqual(None, self.guard.span(SAFE, "match", "5551234"))
+
+    def test_timeout(self):
+        self.assertRaises(
+            prlint.regex_timeout, self.guard.span, NESTED, "match", "A" * 40 + "!"
+        )
+        self.assertEqual(1, self.guard.timeouts)
+        # The stuck worker is replaced
+        self.assertEqual((0, 2), self.guard.span(NESTED, "match", "AB"))
+
+    def test_workers_reused(self):
+        # Threads that come and go share the guard's workers
+        for attempt in range(3):
+            threads = [
+                threading.Thread(
+                    target=self.guard.span, args=(NESTED, "match", "AB, CD")
+                )
+                for i in range(4)
+            ]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            self.assertTrue(len(self.guard.pools) <= 4)
+        self.guard.close()
+        self.assertEqual([], self.guard.pools)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,115 @@
+"""Hot reload of the ruleset while reports are being checked.
+
+Usage: python -m unittest discover tests
+"""
+
+import os
+import shutil
+import sys
+import tempfile
+import time
+import unittest
+
+from tests import support
+
+import prrules
+
+
+class closer:
+    # A derived table that notes when its ruleset is closed
+    def __init__(self, closed, name):
+        self.closed = closed
+        self.name = name
+
+    def close(self):
+        self.closed.append(self.name)
+
+
+class reload_test(unittest.TestCase):
+    def setUp(self):
+        self.work = tempfile.mkdtemp()
+        self.settings = os.path.join(self.work, "PR Structure.ods")
+        shutil.copy(support.SETTINGS, self.settings)
+        self.manager = prrules.ruleset_manager(self.settings, interval=0.05)
+        self.closed = []
+        self.stdout = sys.stdout
+        sys.stdout = support.quiet()
+
+    def tearDown(self):
+        sys.stdout = self.stdout
+        self.manager.close()
+        shutil.rmtree(self.work)
+
+    def acquire(self, name):
+        rules = self.manager.acquire()
+        rules.memo("closer", lambda rules: closer(self.closed, name))
+        return rules
+
+    def touch(self):
+        # Save the workbook again, later than any earlier save
+        later = time.time() + 10 * (self.manager.reloads + 1)
+        os.utime(self.settings, (later, later))
+
+    def test_unchanged(self):
+        rules = self.manager.acquire()
+        self.assertFalse(self.manager.poll())
+        self.assertTrue(rules is self.manager.acquire())
+
+    def test_reload(self):
+        # A change is picked up once it has held still for a poll
+        old = self.manager.acquire()
+        self.manager.release(old)
+        self.touch()
+        self.assertFalse(self.manager.poll())
+        self.assertTrue(self.manager.poll())
+        self.assertEqual(1, self.manager.reloads)
+        self.assertFalse(old is self.manager.acquire())
+        self.assertFalse(self.manager.poll())
+
+    def test_old_rules_kept_while_used(self):
+        old = self.acquire("old")
+        self.touch()
+        self.manager.poll()
+        self.assertTrue(self.manager.poll())
+        new = self.acquire("new")
+        self.assertFalse(old is new)
+        # The report still checking with the old rules keeps them open
+        self.assertEqual([], self.closed)
+        self.manager.release(old)
+        self.assertEqual(["old"], self.closed)
+        self.manager.release(new)
+        self.assertEqual(["old"], self.closed)
+        # Rules no report is using are closed as soon as they are replaced
+        self.touch()
+        self.manager.poll()
+        self.assertTrue(self.manager.poll())
+        self.assertEqual(["old", "new"], self.closed)
+        self.assertEqual({}, self.manager.users)
+
+    def test_broken_workbook(self):
+        # A workbook that does not load leaves the old rules in use
+        old = self.acquire("old")
+        f = open(self.settings, "wb")
+        f.write(b"not a workbook")
+        f.close()
+        self.touch()
+        self.manager.poll()
+        self.assertFalse(self.manager.poll())
+        self.assertNotEqual(None, self.manager.error)
+        self.assertEqual(0, self.manager.reloads)
+        self.assertTrue(old is self.manager.acquire())
+        self.assertEqual([], self.closed)
+
+    def test_background(self):
+        self.manager.start()
+        self.touch()
+        deadline = time.time() + 10
+        while not self.manager.reloads and time.time() < deadline:
+            time.sleep(0.05)
+        self.assertEqual(1, self.manager.reloads)
+        self.manager.stop()
+        self.assertEqual(None, self.manager.thread)
+
+
+if __name__ == "__main__":
+    unittest.main()
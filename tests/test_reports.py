@@ -0,0 +1,76 @@
+"""Replay the Test_PRs forms against their expected reports, in full, in
+parallel and from the incremental cache.
+
+Usage: python -m unittest discover tests
+"""
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from tests import support
+
+
+@unittest.skipIf(support.NEEDS_NO_WORD, "expected reports are without Word")
+class report_replay_test(unittest.TestCase):
+    def assert_report(self, name, text):
+        self.assertEqual(support.expected_report(name), text)
+
+    def test_full_check(self):
+        for name in support.FIXTURES:
+            pr, text = support.check_report(name)
+            self.assertEqual("ok", pr.status)
+            self.assert_report(name, text)
+
+    def test_parallel_check(self):
+        # Field stages in a thread pool report exactly what a serial run does
+        for name in support.FIXTURES:
+            pr, text = support.check_report(name, jobs=4)
+            self.assert_report(name, text)
+
+
+@unittest.skipIf(support.NEEDS_NO_WORD, "expected reports are without Word")
+class incremental_test(unittest.TestCase):
+    def setUp(self):
+        # The cache lives in prcache/ under the working directory
+        self.cwd = os.getcwd()
+        self.work = tempfile.mkdtemp()
+        os.chdir(self.work)
+
+    def tearDown(self):
+        os.chdir(self.cwd)
+        shutil.rmtree(self.work)
+
+    def test_incremental_matches_full(self):
+        for name in support.FIXTURES:
+            # A cache of its own; the AF707 forms share a serial number
+            os.mkdir(os.path.join(self.work, name))
+            os.chdir(os.path.join(self.work, name))
+            first, text = support.check_report(name, incremental=True)
+            self.assertEqual(0, first.cache.hits)
+            self.assertEqual(support.expected_report(name), text)
+
+            second, text = support.check_report(name, incremental=True)
+            self.assertEqual(0, second.cache.misses)
+            self.assertTrue(second.cache.hits > 0)
+            self.assertEqual(support.expected_report(name), text)
+
+    def test_timeouts_not_cached(self):
+        # With no time to run, every guarded pattern times out; those fields
+        # are checked again on the next run instead of replayed
+        first, text = support.check_report("AF910", incremental=True, regex_budget=1e-6)
+        timeouts = [f for f in first.findings if f.extra == "timeout"]
+        self.assertTrue(timeouts)
+
+        second, text = support.check_report(
+            "AF910", incremental=True, regex_budget=1e-6
+        )
+        self.assertEqual(len(timeouts), second.cache.misses)
+        self.assertEqual(
+            len(timeouts), len([f for f in second.findings if f.extra == "timeout"])
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
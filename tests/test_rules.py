@@ -0,0 +1,67 @@
+"""The ruleset backends: CSV and binary exports read back as the workbook.
+
+Usage: python -m unittest discover tests
+"""
+
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+from tests import support
+
+import prrules
+
+
+class export_test(unittest.TestCase):
+    def setUp(self):
+        self.work = tempfile.mkdtemp()
+        self.rules = prrules.load_ruleset(support.SETTINGS)
+
+    def tearDown(self):
+        shutil.rmtree(self.work)
+
+    def assert_same_rules(self, filename):
+        exported = prrules.load_ruleset(filename)
+        self.assertEqual(self.rules.sheet_names, exported.sheet_names)
+        for name in self.rules.sheet_names:
+            self.assertEqual(self.rules.rows(name), exported.rows(name))
+        self.assertEqual(self.rules.fingerprint(), exported.fingerprint())
+
+    def test_csv(self):
+        dirname = os.path.join(self.work, "rules")
+        prrules.csv_loader().save(self.rules, dirname)
+        self.assertTrue(isinstance(prrules.get_loader(dirname), prrules.csv_loader))
+        self.assert_same_rules(dirname)
+
+    def test_binary(self):
+        filename = os.path.join(self.work, "rules" + prrules.BINARY_EXTENSION)
+        prrules.binary_loader().save(self.rules, filename)
+        self.assertTrue(isinstance(prrules.get_loader(filename), prrules.binary_loader))
+        self.assert_same_rules(filename)
+
+    def test_not_a_ruleset(self):
+        filename = os.path.join(self.work, "rules" + prrules.BINARY_EXTENSION)
+        f = open(filename, "wb")
+        f.write(b"not a ruleset")
+        f.close()
+        self.assertRaises(prrules.ruleset_error, prrules.load_ruleset, filename)
+        self.assertRaises(prrules.ruleset_error, prrules.load_ruleset, self.work)
+
+    def test_find_ruleset(self):
+        # The binary copy is used only while it is newer than the workbook
+        settings = os.path.join(self.work, "rules.ods")
+        shutil.copy(support.SETTINGS, settings)
+        binary = os.path.join(self.work, "rules" + prrules.BINARY_EXTENSION)
+        self.assertEqual(settings, prrules.find_ruleset(settings))
+        prrules.binary_loader().save(self.rules, binary)
+        now = time.time()
+        os.utime(settings, (now - 10, now - 10))
+        self.assertEqual(binary, prrules.find_ruleset(settings))
+        os.utime(settings, (now + 10, now + 10))
+        self.assertEqual(settings, prrules.find_ruleset(settings))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,63 @@
+"""Field extraction and the character spans of findings.
+
+Usage: python -m unittest discover tests
+"""
+
+import unittest
+
+from tests import support
+
+import prcheck
+import prinput
+import prrecords
+
+
+class extract_fields_test(unittest.TestCase):
+    def test_fields(self):
+        for name in support.FIXTURES:
+            fields = prcheck.extract_fields(support.fixture(name), support.SETTINGS)
+            self.assertTrue(fields)
+            for field in fields:
+                for number, start, line in field.lines():
+                    self.assertEqual(line, field.value[start : start + len(line)])
+
+    def test_rejected_form(self):
+        self.assertRaises(
+            prinput.xfdl_error,
+            prcheck.extract_fields,
+            support.SETTINGS,
+            support.SETTINGS,
+        )
+
+
+@unittest.skipIf(support.NEEDS_NO_WORD, "expected reports are without Word")
+class finding_span_test(unittest.TestCase):
+    def test_spans_index_the_extracted_values(self):
+        for name in support.FIXTURES:
+            fields = prcheck.extract_fields(support.fixture(name), support.SETTINGS)
+            values = dict(((field.sid, field.page), field) for field in fields)
+            pr, text = support.check_report(name)
+            spans = 0
+            for finding in pr.findings:
+                if finding.span is None:
+                    continue
+                spans += 1
+                field = values[(finding.sid, finding.page)]
+                start, end = finding.span
+                self.assertTrue(0 <= start <= end <= len(field.value))
+                piece = field.value[start:end]
+                if finding.category == prrecords.REGEX:
+                    self.assertEqual(field.value, piece)
+                elif finding.extra != "timeout" and finding.category in (
+                    prrecords.CATCH,
+                    prrecords.ACRONYM,
+                ):
+                    self.assertEqual(finding.text, piece)
+                if finding.line:
+                    line_start = field.lines()[finding.line - 1][1]
+                    self.assertTrue(line_start <= start)
+            self.assertTrue(spans > 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,106 @@
+"""Duty titles: the title index against the Fields sheet regexes.
+
+Usage: python -m unittest discover tests
+"""
+
+import re
+import unittest
+
+from tests import support
+
+import prrules
+import prtitles
+
+CAPS_REGEX = r"^\n(([A-Z]+)[,]?\s?)+$"
+TITLE_REGEX = r"^(([A-Z][a-z]+|and)[,]?\s?)+$"
+OPTIONAL_REGEX = r"(^\s*$^)|((([A-Z][a-z]+|and)[,]?\s?)+$)"
+
+# Titles of plain words, laid out every way a rule editor might
+LAYOUTS = (
+    "%s %s",
+    "%s, %s",
+    "%s,%s",
+    "%s  %s",
+    "%s ,%s",
+    "%s,, %s",
+    "%s/%s",
+    "%s %s.",
+    "%s %s ",
+    "%s %s,",
+    "%s %s  ",
+    " %s %s",
+    "%s\n%s",
+    "%s,\n%s",
+)
+
+
+class title_regex_test(unittest.TestCase):
+    def setUp(self):
+        self.titles = prtitles.title_index()
+
+    def assert_as_regex(self, regex, lead, words):
+        # On titles of plain words the index agrees with the regex
+        for layout in LAYOUTS:
+            value = lead + layout % words
+            expected = re.match(regex, value) is not None
+            self.assertEqual(
+                expected, self.titles.check_field(value, regex), repr(value)
+            )
+
+    def test_caps(self):
+        self.assert_as_regex(CAPS_REGEX, "\n", ("FLIGHT", "COMMANDER"))
+
+    def test_title(self):
+        self.assert_as_regex(TITLE_REGEX, "", ("Flight", "Commander"))
+        self.assert_as_regex(OPTIONAL_REGEX, "", ("Chief", "and"))
+
+    def test_ruleset_regexes(self):
+        # Every duty title regex of the workbook is read as a title pattern
+        rules = prrules.load_ruleset(support.SETTINGS)
+        regexes = set()
+        for name in rules.sheet_names:
+            if name.endswith("Fields"):
+                for cells in rules.rows(name):
+                    if len(cells) > 3 and cells[0].endswith(prtitles.TITLE_LABEL):
+                        regexes.add(cells[3])
+        self.assertTrue(CAPS_REGEX in regexes)
+        for regex in regexes:
+            if re.match(regex, "Commander") or re.match(regex, "\nCOMMANDER"):
+                self.assertNotEqual(None, self.titles.style(regex).case)
+
+    def test_relaxed_tokens(self):
+        # Unit names and numbers the regex turns away
+        for value, regex in (
+            ("\nFLIGHT COMMANDER, 8 EFS", CAPS_REGEX),
+            ("\nCOMMANDER, 33d FW", CAPS_REGEX),
+            ("\nSUPERINTENDENT, A3O", CAPS_REGEX),
+            ("Commander, 66 ERS", TITLE_REGEX),
+            ("Chief of Safety", TITLE_REGEX),
+        ):
+            self.assertEqual(None, re.match(regex, value))
+            self.assertTrue(self.titles.check_field(value, regex), repr(value))
+
+    def test_strict_tokens(self):
+        for value, regex in (
+            ("\nFlight Commander", CAPS_REGEX),
+            ("\nCOMMANDER & CHIEF", CAPS_REGEX),
+            ("FLIGHT COMMANDER", CAPS_REGEX),
+            ("Chief's Office", TITLE_REGEX),
+            ("flight commander", TITLE_REGEX),
+        ):
+            self.assertFalse(self.titles.check_field(value, regex), repr(value))
+
+    def test_empty(self):
+        self.assertTrue(self.titles.check_field("", OPTIONAL_REGEX))
+        self.assertFalse(self.titles.check_field("", TITLE_REGEX))
+
+    def test_not_a_title_pattern(self):
+        self.assertEqual(None, self.titles.check_field("", r"^\s*$"))
+
+    def test_titles_sheet(self):
+        self.titles.load_rows([["unit", "XQS"], ["office", "ZQ1"]])
+        self.assertTrue(self.titles.check_field("\nCOMMANDER, 5 XQS, ZQ1", CAPS_REGEX))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,143 @@
+"""The watch folder journal and intake.
+
+Usage: python -m unittest discover tests
+"""
+
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+import unittest
+
+from tests import support
+
+import prbatch
+import prwatch
+
+
+class journal_test(unittest.TestCase):
+    def setUp(self):
+        self.work = tempfile.mkdtemp()
+        self.filename = os.path.join(self.work, prwatch.DEFAULT_JOURNAL)
+
+    def tearDown(self):
+        shutil.rmtree(self.work)
+
+    def test_wants(self):
+        log = prwatch.journal(self.filename)
+        try:
+            self.assertTrue(log.wants("a.xfdl", 10, 1.0))
+            log.start("a.xfdl", 10, 1.0)
+            # Not twice at once
+            self.assertFalse(log.wants("a.xfdl", 10, 1.0))
+            log.record("a.xfdl", "ok", "a.xfdl.out")
+            self.assertFalse(log.wants("a.xfdl", 10, 1.0))
+            # Changed since it was checked
+            self.assertTrue(log.wants("a.xfdl", 11, 1.0))
+            self.assertTrue(log.wants("a.xfdl", 10, 2.0))
+        finally:
+            log.close()
+
+    def test_restart(self):
+        # The journal is on disk after every record and compacted on opening;
+        # a line cut short by a crash is skipped
+        log = prwatch.journal(self.filename)
+        for size in (10, 20):
+            log.start("a.xfdl", size, 1.0)
+            log.record("a.xfdl", "ok", "a.xfdl.out")
+        log.start("b.xfdl", 5, 1.0)
+        log.record("b.xfdl", "error")
+        log.close()
+        f = open(self.filename, "a")
+        f.write('{"file": "c.xfdl", "si')
+        f.close()
+
+        log = prwatch.journal(self.filename)
+        try:
+            self.assertFalse(log.wants("a.xfdl", 20, 1.0))
+            self.assertTrue(log.wants("a.xfdl", 10, 1.0))
+            self.assertFalse(log.wants("b.xfdl", 5, 1.0))
+            self.assertTrue(log.wants("c.xfdl", 5, 1.0))
+        finally:
+            log.close()
+        f = open(self.filename)
+        try:
+            entries = [json.loads(line) for line in f]
+        finally:
+            f.close()
+        self.assertEqual(["a.xfdl", "b.xfdl"], [entry["file"] for entry in entries])
+        self.assertEqual("error", entries[1]["status"])
+
+
+class intake_test(unittest.TestCase):
+    def setUp(self):
+        self.work = tempfile.mkdtemp()
+        self.intake_dir = os.path.join(self.work, "in")
+        os.mkdir(self.intake_dir)
+        self.journal_filename = os.path.join(self.work, prwatch.DEFAULT_JOURNAL)
+        self.stdout = sys.stdout
+        sys.stdout = support.quiet()
+
+    def tearDown(self):
+        sys.stdout = self.stdout
+        shutil.rmtree(self.work)
+
+    def drop(self, name):
+        shutil.copy(
+            support.fixture(name), os.path.join(self.intake_dir, name + ".xfdl")
+        )
+
+    def ready(self, log):
+        # The reports an intake would hand to the batch right away
+        watch = prwatch.intake(self.intake_dir, log, settle=0, use_inotify=False)
+        watch.consider(os.listdir(self.intake_dir))
+        return [os.path.basename(path) for path in watch.settled()]
+
+    def check(self, log, names):
+        batch = prbatch.pipeline(support.SETTINGS, text_only=True, journal=log)
+        paths = [os.path.join(self.intake_dir, name) for name in names]
+        return batch.run(paths)
+
+    def test_settle(self):
+        # A report still growing waits until it has stopped changing
+        log = prwatch.journal(self.journal_filename)
+        try:
+            self.drop("AF910")
+            watch = prwatch.intake(self.intake_dir, log, settle=60, use_inotify=False)
+            watch.consider(os.listdir(self.intake_dir))
+            self.assertEqual([], watch.settled())
+            self.assertEqual(1, len(watch.pending))
+        finally:
+            log.close()
+
+    def test_incremental(self):
+        # Only new or changed reports are checked again after a restart
+        self.drop("AF707")
+        self.drop("AF910")
+        open(os.path.join(self.intake_dir, "notes.txt"), "w").close()
+        log = prwatch.journal(self.journal_filename)
+        try:
+            names = self.ready(log)
+            self.assertEqual(["AF707.xfdl", "AF910.xfdl"], names)
+            results = self.check(log, names)
+            self.assertEqual(["ok", "ok"], [result[1] for result in results])
+            for result in results:
+                self.assertTrue(os.path.isfile(result[3]))
+        finally:
+            log.close()
+
+        log = prwatch.journal(self.journal_filename)
+        try:
+            self.assertEqual([], self.ready(log))
+            path = os.path.join(self.intake_dir, "AF910.xfdl")
+            later = time.time() + 10
+            os.utime(path, (later, later))
+            self.assertEqual(["AF910.xfdl"], self.ready(log))
+        finally:
+            log.close()
+
+
+if __name__ == "__main__":
+    unittest.main()